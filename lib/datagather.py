@@ -7,24 +7,30 @@ will download, clean and gather the data from https://www.geonames.org/.
 
 This file  contains the following functions:
 
+    * _download - downloads a file, skipping it if unchanged and resuming it
+        if interrupted
     * dl_county_data - downloads the geoname data from the geonames server
     * _clean_countydata - cleans up known issues in the county data from
         geonames
+    * _cat_key - packs country, state and county codes into an integer key
     * dl_fips_codes - downloads FIPS codes for each county
     * _clean_fipsdata - cleans up known issues in the fips code data
     * prep_data - prepares the tour data for calculating the tour
     * write_data - writes given data to a csv file
     * remove_gndata - removes downloaded zip and txt files from geonames.org
+        that are not kept for later runs
 
 """
 
 # import math
+import hashlib
+import json
 import numpy as np
 import os.path
 import pandas as pd
 from lib.tourroute import TourRoute
 
-from os import listdir, mkdir, remove
+from os import listdir, mkdir, remove, replace
 from re import search, sub
 from requests import get
 from zipfile import ZipFile
@@ -33,6 +39,22 @@ from zipfile import ZipFile
 _COUNTY_FCODE = 'ADM2'
 _SEAT_FCODE = 'PPLA2'
 
+# Bytes read from the server at a time when downloading
+_DL_CHUNK_SIZE = 1 << 20
+
+# Seconds to wait on the server before giving up
+_DL_TIMEOUT = 60
+
+# File in the download dir recording the HTTP validators, size and checksum of
+# each downloaded file
+_DL_MANIFEST = 'manifest.json'
+
+# Suffix of a download in progress; kept if interrupted so it can be resumed
+_DL_PART = '.part'
+
+# Rows of the Geonames dump parsed at a time
+_GN_CHUNK_ROWS = 100000
+
 # Class for terminal output colours
 
 
@@ -42,12 +64,203 @@ class bcolours:
     ENDC = '\033[0m'
 
 
-def dl_county_data(url, path):
+def _read_manifest(dir):
+    '''
+    Reads the download manifest in the given dir
+
+    Parameters:
+        dir (str): Download dir e.g. ../data/
+
+    Returns:
+        dict: Entry for each downloaded file name, empty if there is no
+            manifest
+    '''
+    manifest_path = os.path.join(dir, _DL_MANIFEST)
+    if not os.path.exists(manifest_path):
+        return {}
+
+    with open(manifest_path, 'r') as f:
+        return json.load(f)
+
+
+def _write_manifest(dir, manifest):
+    '''
+    Writes the download manifest to the given dir, replacing it in one step
+    so an interrupted write does not leave it corrupt
+
+    Parameters:
+        dir (str): Download dir e.g. ../data/
+        manifest (dict): Entry for each downloaded file name
+    '''
+    manifest_path = os.path.join(dir, _DL_MANIFEST)
+    with open(manifest_path + _DL_PART, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    replace(manifest_path + _DL_PART, manifest_path)
+
+
+def _sha256(path, chunk_size=_DL_CHUNK_SIZE):
+    '''
+    Gets the SHA-256 hash object of the file at the given path
+
+    Parameters:
+        path (str): Path to the file
+
+    Optional:
+        chunk_size (int): Bytes read at a time. Defaults to `_DL_CHUNK_SIZE`.
+
+    Returns:
+        hashlib.sha256 object, which can be updated with more data
+    '''
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(chunk_size), b''):
+            hasher.update(block)
+    return hasher
+
+
+def _download(url, path, chunk_size=_DL_CHUNK_SIZE, sha256=None):
+    '''
+    Downloads the given url to the given path. The ETag, Last-Modified, size
+    and SHA-256 checksum of each download are kept in a manifest in the same
+    dir. If the file is still on disk and matches its checksum, the request
+    is made conditional so an unchanged file is not downloaded again. An
+    interrupted download is kept with a `.part` suffix and resumed with an
+    HTTP Range request, provided the server's validators are unchanged.
+
+    Parameters:
+        url (str): A full url e.g. https://www.data.org/data.zip
+        path (str): A full path to save the file to e.g. ../data/data.zip.
+            Will create dir if it does not exist
+
+    Optional:
+        chunk_size (int): Bytes read from the server at a time. Defaults to
+            `_DL_CHUNK_SIZE`.
+        sha256 (str): Expected SHA-256 hex digest of the file. Defaults to
+            `None` for no check other than the size.
+
+    Returns:
+        bool: `True` if the file was downloaded, `False` if it was unchanged
+
+    Raises:
+        requests.HTTPError: If the server returns an error status
+        IOError: If the server closed the connection early; the partial
+            download is kept so it can be resumed
+        ValueError: If the file does not match the given checksum
+    '''
+    # Create dir if it does not exist
+    dir = os.path.dirname(path)
+    if not os.path.exists(dir):
+        mkdir(dir)
+        print(f'Created dir {dir}')
+
+    fnm = os.path.basename(path)
+    part_fnm = fnm + _DL_PART
+    part_path = path + _DL_PART
+    manifest = _read_manifest(dir)
+
+    # Only ask the server whether the file changed if the copy on disk is
+    # intact and matches the expected checksum, otherwise download it again
+    entry = manifest.get(fnm)
+    if entry is not None and (entry.get('url') != url
+                              or not os.path.exists(path)
+                              or os.path.getsize(path) != entry['size']
+                              or _sha256(path).hexdigest() != entry['sha256']
+                              or (sha256 is not None
+                                  and entry['sha256'] != sha256.lower())):
+        entry = None
+
+    for attempt in range(2):
+        # Ask for the bytes as stored, so sizes and ranges line up
+        headers = {'Accept-Encoding': 'identity'}
+        if entry is not None and entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry is not None and entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+
+        # Resume a partial download, unless the file changed since
+        part = manifest.get(part_fnm)
+        done = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        if done > 0 and part is not None and part.get('url') == url \
+                and (part.get('etag') or part.get('last_modified')):
+            headers['Range'] = f'bytes={done}-'
+            headers['If-Range'] = part.get('etag') or part['last_modified']
+
+        response = get(url, stream=True, headers=headers,
+                       timeout=_DL_TIMEOUT)
+        if response.status_code != 416:
+            break
+
+        # Range not satisfiable, so start over
+        response.close()
+        remove(part_path)
+
+    if response.status_code == 304:
+        response.close()
+        print(f'{url} is unchanged; using {path}')
+        return False
+
+    response.raise_for_status()
+
+    if response.status_code == 206:
+        print(f'Resuming download of {url} to {path} from {done:,} bytes')
+        total_length = response.headers.get('content-range', '').split('/')[-1]
+        hasher = _sha256(part_path, chunk_size)
+        mode = 'ab'
+    else:
+        print(f'Downloading {url} to {path}')
+        total_length = response.headers.get('content-length')
+        hasher = hashlib.sha256()
+        done = 0
+        mode = 'wb'
+    total_length = int(total_length) if total_length not in [None, '', '*'] \
+        else None
+
+    # Record the validators before any data so that an interrupted download
+    # can be resumed
+    manifest[part_fnm] = {'url': url,
+                          'etag': response.headers.get('etag'),
+                          'last_modified':
+                              response.headers.get('last-modified')}
+    _write_manifest(dir, manifest)
+
+    with response, open(part_path, mode) as f:
+        for data in response.iter_content(chunk_size=chunk_size):
+            done += len(data)
+            f.write(data)
+            hasher.update(data)
+            if total_length:
+                pct = int(50 * done / total_length)
+                print(f'\r[{"="*pct}{" "*(50-pct)}] {pct*2}%', end='\r')
+
+    print(f'\nHTTP status {response.status_code}')
+    if total_length is not None and done != total_length:
+        raise IOError(f'Downloaded {done:,} of {total_length:,} bytes of '
+                      + f'{url}; run again to resume')
+
+    digest = hasher.hexdigest()
+    if sha256 is not None and digest != sha256.lower():
+        remove(part_path)
+        del manifest[part_fnm]
+        _write_manifest(dir, manifest)
+        raise ValueError(f'SHA-256 of {url} is {digest}, expected {sha256}')
+
+    replace(part_path, path)
+    manifest[fnm] = dict(manifest.pop(part_fnm), size=done, sha256=digest)
+    _write_manifest(dir, manifest)
+    return True
+
+
+def dl_county_data(url, path, chunk_size=_DL_CHUNK_SIZE, sha256=None,
+                   chunksize=_GN_CHUNK_ROWS):
     '''
     Gathers the county and seat data from the given url. Adds cat_code
-    (country.state.county) and some data corrections (by
+    (country.state.county), its packed integer form cat_key (see
+    `_cat_key()`) and some data corrections (by
     `calling _clean_countydata()`). Writes the corrected data to the the given
-    path and also returns it.
+    path and also returns it. The zip file is only downloaded again if it
+    changed on the server (see `_download()`). The txt file in it is parsed
+    as a stream in chunks, keeping only the feature codes of interest, so it
+    is never extracted or held in memory in full.
 
     Parameters:
         url (str): A full url to a zip file e.g.
@@ -55,6 +268,14 @@ def dl_county_data(url, path):
         path (str): A full path to a csv file e.g. ../data/data.csv. Will
             create dir and file if they do not exist
 
+    Optional:
+        chunk_size (int): Bytes read from the server at a time. Defaults to
+            `_DL_CHUNK_SIZE`.
+        sha256 (str): Expected SHA-256 hex digest of the zip file. Defaults
+            to `None` for no check.
+        chunksize (int): Rows of the txt file parsed at a time. Defaults to
+            `_GN_CHUNK_ROWS`.
+
     Returns:
         data.frame : Data frame of downloaded data
     '''
@@ -87,54 +308,29 @@ def dl_county_data(url, path):
     # Get the text file name we expect to find in the zip file
     txt_fnm = sub(url_ext, txt_ext, zip_fnm)
 
-    # Create dir if it does not exist
     dir = os.path.dirname(path)
-    if not os.path.exists(dir):
-        mkdir(dir)
-        print(f'Created dir {dir}')
-
     zip_path = os.path.join(dir, zip_fnm)
-    with open(zip_path, 'wb') as f:
-        print(f'Downloading {url} to {zip_path}')
-        response = get(url, stream=True)
-        total_length = response.headers.get('content-length')
-
-        if total_length is None:  # no content length header
-            f.write(response.content)
-        else:
-            dl = 0
-            total_length = int(total_length)
-            for data in response.iter_content(chunk_size=4096):
-                dl += len(data)
-                f.write(data)
-                done = int(50 * dl / total_length)
-                print(f'\r[{"="*done}{" "*(50-done)}] {done*2}%', end='\r')
-
-    # Retrieve HTTP meta-data
-    print(f'\nHTTP status {response.status_code}')
-    print('Content type {}'.format(response.headers['content-type']))
-    print(f'Enconding {response.encoding}')
-
-    with ZipFile(zip_path, 'r') as zip_ref:
-        print(f'Unzipping {zip_path}')
-        txt_path = zip_ref.extract(txt_fnm, path=dir)
-        zip_ref.close()
-        print('Extracted {}'.format(txt_path))
-
-    # Read in county data from the extracted txt file
-    data = pd.read_csv(txt_path, names=header_names, header=0, dtype=dyptes,
-                       usecols=keep_cols, delimiter="\t", na_values=[-1])
-    # Keep only the geoname feature code(s) of interest
-    data.drop(data.loc[~data.isin({'f_code': keep_fcodes}).f_code].index,
-              axis=0, inplace=True)
+    _download(url, zip_path, chunk_size=chunk_size, sha256=sha256)
+
+    # Read in county data straight from the txt file in the zip file,
+    # keeping only the geoname feature code(s) of interest from each chunk
+    with ZipFile(zip_path, 'r') as zip_ref, zip_ref.open(txt_fnm) as txt:
+        print(f'Reading {txt_fnm} from {zip_path}')
+        reader = pd.read_csv(txt, names=header_names, header=0, dtype=dyptes,
+                             usecols=keep_cols, delimiter="\t",
+                             na_values=[-1], chunksize=chunksize)
+        data = pd.concat([chunk.loc[chunk.f_code.isin(keep_fcodes)]
+                          for chunk in reader])
 
     data = _clean_countydata(data)
 
-    # Add cat_code for reference and later use to identify county:seat
+    # Add cat_code for reference and cat_key to identify county:seat
     # matchups
-    data[['county']] = data[['county']].apply(pd.to_numeric)
-    data['cat_code'] = data[['country', 'state', 'county']].apply(
-        lambda x: (f'{x[0]}.{x[1]}.{x[2]:03d}'), axis=1)
+    data['county'] = pd.to_numeric(data['county']).astype('Int64')
+    data['cat_code'] = data['country'] + '.' + data['state'] + '.' \
+        + data['county'].astype(str).str.zfill(3)
+    data['cat_key'] = _cat_key(data['country'], data['state'],
+                               data['county'])
     write_data(data, path)
     return data
 
@@ -172,7 +368,7 @@ def _clean_countydata(data):
                              'cat_code': 'US.CA.027'},
                             index=[0])
 
-    data = data.append(new_data, sort=True)
+    data = pd.concat([data, new_data], sort=True, ignore_index=True)
 
     # Drop county seats Orange, CA and the Washington Street Courthouse Annex,
     # as they are not county seats ref Wikipedia
@@ -180,17 +376,44 @@ def _clean_countydata(data):
     data.drop(data.loc[data.isin(drop_gids).gid].index, axis=0, inplace=True)
     # # Oakley, KS is actually the county seat for Logan County,
     # # i.e. for county 109 in KS
-    data.at[(data.state == 'KS') & (data.name == 'Oakley')
-            & (data.f_code == _SEAT_FCODE), 'county'] = 109
+    data.loc[(data.state == 'KS') & (data.name == 'Oakley')
+             & (data.f_code == _SEAT_FCODE), 'county'] = 109
     return data
 
 
+def _cat_key(country, state, county):
+    '''
+    Packs country and state codes of up to two characters and county codes
+    below 65,536 into one integer key per row, so that they can be matched
+    without building strings
+
+    Parameters:
+        country (pd.Series): Country codes e.g. US
+        state (pd.Series): State codes e.g. CA
+        county (pd.Series): County codes as integers e.g. 27
+
+    Returns:
+        np.array : int64 key for each row
+    '''
+    def chars(codes):
+        codes = np.asarray(codes.to_numpy(dtype=str), dtype='S2')
+        return codes.view(np.uint8).reshape(-1, 2).astype(np.int64)
+
+    country = chars(country)
+    state = chars(state)
+    return (country[:, 0] << 40) | (country[:, 1] << 32) \
+        | (state[:, 0] << 24) | (state[:, 1] << 16) \
+        | county.to_numpy(dtype=np.int64)
+
+
 def dl_fips_codes(url, path):
     '''
     Gathers the FIPS codes for each county from the given url. Performs some
     data corrections to add missing counties (by calling `_clean_fipsdata()`)
     and align the names with the names in the geonmaes data set. Writes the
-    corrected data to the the given path and also returns it.
+    corrected data to the the given path and also returns it. The source file
+    is kept next to the given path and only downloaded again if it changed
+    on the server (see `_download()`).
 
     Parameters:
         url (str): A full url to a zip file e.g.
@@ -213,7 +436,10 @@ def dl_fips_codes(url, path):
     # Specify dtype
     dyptes = {'FIPS_Code': 'Int64', 'State': str, 'Area_name': str}
 
-    fips = pd.read_csv(url, na_values=[' '], names=header_names,
+    src_path = os.path.join(os.path.dirname(path), os.path.basename(url))
+    _download(url, src_path)
+
+    fips = pd.read_csv(src_path, na_values=[' '], names=header_names,
                        usecols=keep_names, header=0, dtype=dyptes)
 
     # Data correction and clean up
@@ -294,7 +520,9 @@ def prep_data(data, fips):
 
     Parameters:
         data (data.frame): A data frame of geonames data that contains the
-            county and county seat information
+            county and county seat information. If it has no cat_key column,
+            e.g. data written before cat_key was added, the key is derived
+            from the country, state and county columns.
         fips (data.frame): A data frame of fips code data
 
     Returns:
@@ -307,22 +535,29 @@ def prep_data(data, fips):
             3) Use a TourRoute class method to write data to a csv file
     '''
 
+    if 'cat_key' not in data:
+        data = data.assign(cat_key=_cat_key(
+            data['country'], data['state'],
+            pd.to_numeric(data['county']).astype(np.int64)))
+
     # Split the data and then remerge it, effectively pivoting it into wide
     # format
     counties = data.loc[data['f_code'] == _COUNTY_FCODE]
     seats = data.loc[data['f_code'] == _SEAT_FCODE]
 
     data = counties.merge(seats, how='left', copy=False,
-                          suffixes=('_county', '_seat'), on='cat_code',
+                          suffixes=('_county', '_seat'), on='cat_key',
                           validate='1:1')
 
     # Drop unrequired and/or duplicated columns
     data.drop(['f_class_county', 'f_code_county', 'country_county',
                'county_county', 'f_class_seat', 'f_code_seat', 'country_seat',
-               'state_seat', 'county_seat'], axis=1, inplace=True)
+               'state_seat', 'county_seat', 'cat_code_seat', 'cat_key'],
+              axis=1, inplace=True)
 
     # rename existing columns where appropiate
-    data.rename(columns={'state_county': 'state'}, inplace=True)
+    data.rename(columns={'state_county': 'state',
+                         'cat_code_county': 'cat_code'}, inplace=True)
 
     # Merge with the fips data
     data = data.merge(fips, how='left', copy=False,
@@ -375,22 +610,27 @@ def write_data(data, path):
     print(f'Created and added data to {path}')
 
 
-def remove_gndata(dir):
+def remove_gndata(dir, keep_downloads=True):
     '''
     Removes .zip and .txt files from the given dir
 
     Parameters:
         dir (str): Path to identify items to remove e.g. ../data/
 
+    Optional:
+        keep_downloads (bool): Keep files in the download manifest, so that
+            they are not downloaded again if unchanged. Defaults to `True`.
+
     '''
     # Will remove .zip and .txt files
     rm_exts = ['.zip', '.txt']
 
     dir_items = listdir(dir)
+    keep = _read_manifest(dir) if keep_downloads else {}
 
     for ext in rm_exts:
         for item in dir_items:
-            if item.endswith(ext):
+            if item.endswith(ext) and item not in keep:
                 item_pth = os.path.join(dir, item)
                 remove(item_pth)
                 print(f'Removed: {item_pth}')
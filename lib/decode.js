@@ -0,0 +1,63 @@
+// Decodes a tour written by TourRoute.write_js() in the 'polyline' or
+// 'float32' format back into the same list of { location, county } objects
+// as the 'objects' format
+
+// Polyline values are decoded with arithmetic rather than bitwise operators,
+// which work on 32 bits and would overflow for precisions above 6
+function decodePolyline (str, precision) {
+  const scale = 10 ** precision
+  var coords = []
+  var index = 0
+  var lat = 0
+  var lng = 0
+
+  while (index < str.length) {
+    var values = []
+    for (let k = 0; k < 2; k++) {
+      var result = 0
+      var factor = 1
+      var b
+      do {
+        b = str.charCodeAt(index++) - 63
+        result += (b % 32) * factor
+        factor *= 32
+      } while (b >= 32)
+      values.push((result % 2) ? -(result + 1) / 2 : result / 2)
+    }
+
+    lat += values[0]
+    lng += values[1]
+    coords.push(lat / scale, lng / scale)
+  }
+
+  return coords
+}
+
+function decodeFloat32 (b64) {
+  const bytes = Uint8Array.from(atob(b64), c => c.charCodeAt(0))
+  return new Float32Array(bytes.buffer)
+}
+
+function decodeTour (data) {
+  var coords = []
+  if (data.format === 'polyline') {
+    coords = decodePolyline(data.coords, data.precision)
+  } else {
+    coords = decodeFloat32(data.coords)
+  }
+
+  var tour = []
+  for (let i = 0; i < data.count; i++) {
+    var county = {}
+    for (const key in data.tables) {
+      county[key] = data.tables[key][data.index[key][i]]
+    }
+
+    tour.push({
+      location: { lat: coords[2 * i], lng: coords[2 * i + 1] },
+      county: county
+    })
+  }
+
+  return tour
+}
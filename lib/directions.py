@@ -0,0 +1,374 @@
+# -*- coding: utf-8 -*-
+"""Directions Fetching
+
+This module contains functions to send many Directions requests concurrently
+from a bounded pool of threads. Requests are spread out by a token bucket rate
+limiter so that the service's queries per second limit is not exceeded, and
+failed requests are retried with jittered exponential backoff. Any client
+object with a ``directions()`` method, such as ``googlemaps.Client``, can be
+used. Results can be kept in an on-disk SQLite cache so that repeat requests
+make no network calls.
+
+This file contains the following classes and functions:
+
+    * _TokenBucket - thread safe token bucket rate limiter
+    * DirectionsCache - SQLite cache of per-leg distances and durations
+    * CachedClient - wraps a client so that its requests go through a
+        DirectionsCache
+    * fetch_directions - sends directions requests concurrently and returns
+        the results in request order
+
+"""
+
+import json
+import random
+import sqlite3
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+# Number of requests in flight at once
+_WORKERS = 8
+
+# Sustained requests per second, and the most requests sent in a burst
+_RATE = 10
+_BURST = 10
+
+# Number of retries after a failed request, and the base backoff in seconds
+_RETRIES = 3
+_BACKOFF = 0.5
+
+# Decimal places coordinates are rounded to in cache keys, about 1 metre
+_CACHE_DP = 5
+
+# Cached results older than this many seconds are refetched; 30 days
+_CACHE_TTL = 30 * 24 * 60 * 60
+
+# Most results held in the cache before the least recently used are evicted
+_CACHE_MAX_ENTRIES = 100000
+
+
+class _TokenBucket():
+    '''
+    Thread safe token bucket rate limiter. Tokens are added at ``rate`` per
+    second up to ``burst`` tokens, and each request takes one token.
+
+    Usage::
+        bucket = _TokenBucket(rate=10, burst=10)
+        bucket.acquire()  # Blocks until a token is available
+    '''
+
+    def __init__(self, rate=_RATE, burst=_BURST, clock=time.monotonic,
+                 sleep=time.sleep):
+        '''
+        Args:
+            rate (float): Tokens added per second
+            burst (int): Most tokens held at once
+
+        Optional:
+            clock (callable): Returns the current time in seconds. Defaults to
+                ``time.monotonic``.
+            sleep (callable): Sleeps for the given seconds. Defaults to
+                ``time.sleep``.
+        '''
+        self._rate = rate
+        self._burst = max(1, burst)
+        self._tokens = float(self._burst)
+        self._clock = clock
+        self._sleep = sleep
+        self._last = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        '''Takes one token, waiting until one is available'''
+        while True:
+            with self._lock:
+                now = self._clock()
+                self._tokens = min(self._burst, self._tokens
+                                   + (now - self._last) * self._rate)
+                self._last = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self._rate
+
+            self._sleep(wait)
+
+
+class DirectionsCache():
+    '''
+    On-disk SQLite cache of directions results, keyed by the request with
+    coordinates rounded to ``_CACHE_DP`` decimal places. Only the distance
+    and duration of each leg are kept. Entries expire after ``ttl`` seconds
+    and the least recently used entries are evicted once there are more than
+    ``max_entries``. Safe to share between threads.
+
+    Usage::
+        cache = DirectionsCache('../data/directions.sqlite')
+        client = CachedClient(googlemaps.Client(key=apikey), cache)
+        print(cache.stats())
+    '''
+
+    def __init__(self, path, ttl=_CACHE_TTL, max_entries=_CACHE_MAX_ENTRIES,
+                 clock=time.time):
+        '''
+        Args:
+            path (str): Path to the SQLite database file; created if it does
+                not exist. Use ``':memory:'`` for a cache that is not kept.
+
+        Optional:
+            ttl (float): Seconds before an entry expires. Defaults to 30 days.
+                Use ``None`` for no expiry.
+            max_entries (int): Most entries held. Defaults to 100,000.
+            clock (callable): Returns the current time in seconds. Defaults to
+                ``time.time``.
+        '''
+        self._ttl = ttl
+        self._max_entries = max_entries
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('CREATE TABLE IF NOT EXISTS directions ('
+                           + 'key TEXT PRIMARY KEY, legs TEXT NOT NULL, '
+                           + 'created REAL NOT NULL, used REAL NOT NULL)')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS directions_used '
+                           + 'ON directions (used)')
+        self._conn.commit()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute(
+                'SELECT COUNT(*) FROM directions').fetchone()[0]
+
+    @staticmethod
+    def key(request):
+        '''
+        Gets the cache key for a request
+
+        Parameters:
+            request (dict): Keyword arguments of the ``directions()`` call
+
+        Returns:
+            str: Key with every coordinate rounded to ``_CACHE_DP`` places
+        '''
+        def norm(value):
+            if isinstance(value, float):
+                return round(value, _CACHE_DP)
+            if isinstance(value, (list, tuple)):
+                return [norm(v) for v in value]
+            return value
+
+        return json.dumps({k: norm(v) for k, v in request.items()},
+                          sort_keys=True)
+
+    def get(self, request):
+        '''
+        Gets the cached legs for a request, counting a hit or a miss
+
+        Parameters:
+            request (dict): Keyword arguments of the ``directions()`` call
+
+        Returns:
+            list of ``(distance, duration)`` for each leg, or ``None`` if the
+            request is not cached or has expired
+        '''
+        key = self.key(request)
+        now = self._clock()
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT legs, created FROM directions WHERE key = ?',
+                (key,)).fetchone()
+            if row is not None and self._ttl is not None \
+                    and row[1] < now - self._ttl:
+                self._conn.execute('DELETE FROM directions WHERE key = ?',
+                                   (key,))
+                self._conn.commit()
+                row = None
+
+            if row is None:
+                self.misses += 1
+                return None
+
+            self._conn.execute('UPDATE directions SET used = ? WHERE key = ?',
+                               (now, key))
+            self._conn.commit()
+            self.hits += 1
+        return [tuple(leg) for leg in json.loads(row[0])]
+
+    def put(self, request, legs):
+        '''
+        Caches the legs for a request, evicting the least recently used
+        entries if the cache is full
+
+        Parameters:
+            request (dict): Keyword arguments of the ``directions()`` call
+            legs (list): ``(distance, duration)`` for each leg
+        '''
+        now = self._clock()
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO directions VALUES (?, ?, ?, ?)',
+                (self.key(request), json.dumps([list(leg) for leg in legs]),
+                 now, now))
+            self._conn.execute(
+                'DELETE FROM directions WHERE key IN (SELECT key FROM '
+                + 'directions ORDER BY used DESC LIMIT -1 OFFSET ?)',
+                (self._max_entries,))
+            self._conn.commit()
+
+    def stats(self):
+        '''
+        Gets the cache counters
+
+        Returns:
+            dict of ``hits``, ``misses`` and ``entries``
+        '''
+        return {'hits': self.hits, 'misses': self.misses,
+                'entries': len(self)}
+
+    def close(self):
+        '''Closes the database connection'''
+        self._conn.close()
+
+
+class CachedClient():
+    '''
+    Wraps a client with a ``directions()`` method so that results are taken
+    from a DirectionsCache where possible. Cached results are returned with
+    only the ``distance`` and ``duration`` of each leg.
+    '''
+
+    def __init__(self, client, cache):
+        '''
+        Args:
+            client: Object with a ``directions(**kwargs)`` method e.g. a
+                ``googlemaps.Client``
+            cache (DirectionsCache or str): Cache, or path to its database
+        '''
+        self.client = client
+        self.cache = cache if isinstance(cache, DirectionsCache) \
+            else DirectionsCache(cache)
+
+    def cached(self, request):
+        '''
+        Gets directions from the cache only
+
+        Parameters:
+            request (dict): Keyword arguments of the ``directions()`` call
+
+        Returns:
+            list: ``directions()`` result, or ``None`` if not cached
+        '''
+        legs = self.cache.get(request)
+        if legs is None:
+            return None
+
+        return [{'legs': [{'distance': {'value': dist},
+                           'duration': {'value': dur}}
+                          for dist, dur in legs]}]
+
+    def directions(self, **request):
+        '''
+        Gets directions from the cache, else from the client, caching the
+        result if it has legs
+
+        Returns:
+            list: ``directions()`` result
+        '''
+        result = self.cached(request)
+        return self.fetch(**request) if result is None else result
+
+    def fetch(self, **request):
+        '''
+        Gets directions from the client, skipping the cache lookup, and
+        caches the result if it has legs
+
+        Returns:
+            list: ``directions()`` result
+        '''
+        result = self.client.directions(**request)
+        if len(result) > 0 and result[0].get('legs'):
+            self.cache.put(request, [(leg['distance']['value'],
+                                      leg['duration']['value'])
+                                     for leg in result[0]['legs']])
+        return result
+
+
+def _fetch_one(send, request, bucket, retries, backoff, sleep):
+    '''
+    Sends one directions request with ``send(**request)``, retrying with
+    jittered exponential backoff if it raises
+
+    Returns:
+        The ``directions()`` result
+
+    Raises:
+        Exception: The last exception raised once all retries are used
+    '''
+    for attempt in range(retries + 1):
+        bucket.acquire()
+        try:
+            return send(**request)
+        except Exception:
+            if attempt == retries:
+                raise
+            sleep(backoff * 2 ** attempt * random.uniform(0.5, 1.5))
+
+
+def fetch_directions(client, requests, workers=_WORKERS, rate=_RATE,
+                     burst=_BURST, retries=_RETRIES, backoff=_BACKOFF,
+                     sleep=time.sleep):
+    '''
+    Sends directions requests concurrently from a pool of threads. With a
+    CachedClient, cached results are taken up front and only the misses are
+    rate limited and sent.
+
+    Parameters:
+        client: Object with a ``directions(**kwargs)`` method e.g. a
+            ``googlemaps.Client``
+        requests (list of dict): Keyword arguments for each
+            ``directions()`` call
+
+    Optional:
+        workers (int): Number of requests in flight at once. Defaults to 8.
+        rate (float): Sustained requests per second. Defaults to 10.
+        burst (int): Most requests sent at once after an idle spell.
+            Defaults to 10.
+        retries (int): Number of retries after a failed request. Defaults to
+            3.
+        backoff (float): Base backoff in seconds, doubled after each failed
+            attempt and jittered by +/-50%. Defaults to 0.5.
+        sleep (callable): Sleeps for the given seconds. Defaults to
+            ``time.sleep``.
+
+    Returns:
+        results (list): The ``directions()`` result for each request, in
+            request order, or ``None`` where the request failed
+        failed (list of tuple): ``(index, exception)`` for each request that
+            failed after all retries, in request order
+    '''
+    if isinstance(client, CachedClient):
+        results = [client.cached(request) for request in requests]
+        send = client.fetch
+    else:
+        results = [None] * len(requests)
+        send = client.directions
+
+    bucket = _TokenBucket(rate, burst, sleep=sleep)
+    failed = []
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {i: pool.submit(_fetch_one, send, request, bucket, retries,
+                                  backoff, sleep)
+                   for i, request in enumerate(requests)
+                   if results[i] is None}
+
+        for i, future in futures.items():
+            try:
+                results[i] = future.result()
+            except Exception as e:
+                failed.append((i, e))
+
+    return results, failed
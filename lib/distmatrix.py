@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+"""Distance Matrix
+
+This module contains a great circle distance matrix that is computed once and
+then reused. Only the upper triangle is kept, in condensed form (as per
+``scipy.spatial.distance.squareform``) and as float32, which is a quarter of
+the memory of a full float64 matrix. The matrix can be cached on disk as an
+``.npy`` file named after a hash of the coordinates and opened memory-mapped.
+
+This file contains the following classes and functions:
+
+    * DistMatrix - condensed great circle distance matrix
+    * coord_hash - hash of a set of latitude and longitude coordinates
+    * condensed_index - index into a condensed matrix for a pair of points
+
+"""
+
+import hashlib
+import numpy as np
+import os.path
+import lib.utils as utils
+
+from os import makedirs, replace
+
+# Number of matrix rows computed per block
+_BLOCK_ROWS = 256
+
+# Dtype used to hold distances
+_DIST_DTYPE = np.float32
+
+
+def coord_hash(lat, lon):
+    '''
+    Gets a hash of the given coordinates, in order
+
+    Parameters:
+        lat (np.array): Latitudes in degrees
+        lon (np.array): Longitudes in degrees
+
+    Returns:
+        str: Hex digest identifying the coordinates
+    '''
+    h = hashlib.sha1()
+    h.update(np.ascontiguousarray(lat, dtype=np.float64).tobytes())
+    h.update(np.ascontiguousarray(lon, dtype=np.float64).tobytes())
+    return h.hexdigest()[:20]
+
+
+def condensed_index(i, j, n):
+    '''
+    Gets the index into a condensed distance matrix for the pair ``(i, j)``
+
+    Parameters:
+        i (int or np.array): Row number(s); must not equal ``j``
+        j (int or np.array): Column number(s); must not equal ``i``
+        n (int): Number of points in the matrix
+
+    Returns:
+        int or np.array of indexes into the condensed matrix
+    '''
+    i, j = np.minimum(i, j), np.maximum(i, j)
+    return n * i - i * (i + 1) // 2 + (j - i - 1)
+
+
+def _fill_condensed(lat, lon, out, block_rows=_BLOCK_ROWS):
+    '''
+    Computes the condensed great circle distance matrix into ``out``, a block
+    of rows at a time so that peak memory is ``block_rows * n`` distances
+
+    Parameters:
+        lat (np.array): Latitudes in degrees
+        lon (np.array): Longitudes in degrees
+        out (np.array): Array of length ``n * (n - 1) / 2`` to write into
+
+    Optional:
+        block_rows (int): Number of rows to compute per block. Defaults to
+            256.
+    '''
+    n = len(lat)
+    lat = np.radians(np.asarray(lat, dtype=np.float64))
+    lon = np.radians(np.asarray(lon, dtype=np.float64))
+
+    for start in range(0, n - 1, block_rows):
+        stop = min(n - 1, start + block_rows)
+        block = utils.haversine(lat[start:stop, None], lon[start:stop, None],
+                                lat[None, :], lon[None, :], to_radians=False)
+
+        for i in range(start, stop):
+            offset = condensed_index(i, i + 1, n)
+            out[offset:offset + n - 1 - i] = block[i - start, i + 1:]
+
+
+class DistMatrix():
+    '''
+    Holds a condensed great circle distance matrix in kilometres
+
+    Usage::
+        dm = DistMatrix.from_coords(lat, lon, cache_dir='../data/cache')
+        dm[0, 10]  # Distance between points 0 and 10
+    '''
+
+    def __init__(self, data, n):
+        '''
+        Args:
+            data (np.array): Condensed distance matrix of length
+                ``n * (n - 1) / 2``; may be a memory-map
+            n (int): Number of points in the matrix
+        '''
+        assert (n >= 0 and len(data) == n * (n - 1) // 2), \
+            'Condensed matrix of wrong length for ``n``'
+        self._data = data
+        self._n = n
+
+    def __len__(self):
+        return self._n
+
+    @property
+    def data(self):
+        '''The condensed distance matrix'''
+        return self._data
+
+    @classmethod
+    def from_coords(cls, lat, lon, cache_dir=None):
+        '''
+        Gets the distance matrix for the given coordinates. If ``cache_dir``
+        is given, a matrix previously computed for the same coordinates is
+        opened memory-mapped from there, otherwise it is computed and saved
+        there first.
+
+        Parameters:
+            lat (np.array): Latitudes in degrees
+            lon (np.array): Longitudes in degrees
+
+        Optional:
+            cache_dir (str): Directory holding cached ``.npy`` matrix files.
+                Defaults to ``None`` for an in-memory matrix.
+
+        Returns:
+            DistMatrix for the coordinates
+        '''
+        n = len(lat)
+        size = n * (n - 1) // 2
+
+        # With fewer than two points there are no pairs to cache
+        if cache_dir is None or n < 2:
+            data = np.empty(size, dtype=_DIST_DTYPE)
+            _fill_condensed(lat, lon, data)
+            return cls(data, n)
+
+        path = os.path.join(cache_dir, f'dist_{coord_hash(lat, lon)}.npy')
+        if not os.path.exists(path):
+            makedirs(cache_dir, exist_ok=True)
+
+            # Write to a temporary file first so that an interrupted run
+            # never leaves a partial matrix behind under the final name
+            tmp_path = path + '.tmp'
+            data = np.lib.format.open_memmap(tmp_path, mode='w+',
+                                             dtype=_DIST_DTYPE, shape=(size,))
+            _fill_condensed(lat, lon, data)
+            data.flush()
+            del data
+            replace(tmp_path, path)
+
+        return cls.open(path, n)
+
+    @classmethod
+    def open(cls, path, n=None):
+        '''
+        Opens a saved distance matrix as a read only memory-map
+
+        Parameters:
+            path (str): Path to a ``.npy`` condensed matrix file
+
+        Optional:
+            n (int): Number of points in the matrix. Defaults to ``None`` to
+                infer it from the file length.
+
+        Returns:
+            DistMatrix backed by the file
+
+        Raises:
+            ValueError: If ``n`` is not given and the file is empty, as it
+                could hold zero or one points, or the file length does not
+                match ``n`` points
+        '''
+        data = np.load(path, mmap_mode='r')
+        if n is None:
+            if len(data) == 0:
+                raise ValueError('Cannot infer the number of points in '
+                                 + f'empty matrix file {path}; give ``n``')
+            # Invert m = n * (n - 1) / 2 to get the number of points
+            n = int(round((1 + np.sqrt(1 + 8 * len(data))) / 2))
+
+        if len(data) != n * (n - 1) // 2:
+            raise ValueError(f'Matrix file {path} does not hold {n} points')
+        return cls(data, n)
+
+    def __getitem__(self, key):
+        '''
+        Gets the distance(s) between pairs of points
+
+        Parameters:
+            key (tuple): ``(i, j)`` where each is an int or an array of ints
+
+        Returns:
+            float or np.array of distances in kilometres
+
+        Raises:
+            IndexError: If a point number is out of range
+        '''
+        i, j = key
+        i = np.asarray(i)
+        j = np.asarray(j)
+        if np.any((i < 0) | (i >= self._n) | (j < 0) | (j >= self._n)):
+            raise IndexError(f'Point number out of range for {self._n} '
+                             + 'points')
+
+        same = i == j
+        if self._n < 2:
+            dist = np.zeros(same.shape, dtype=self._data.dtype)
+            return dist[()] if dist.ndim == 0 else dist
+
+        idx = condensed_index(i, np.where(same, i + 1, j), self._n)
+        dist = np.where(same, 0, self._data[np.where(same, 0, idx)])
+        return dist[()] if dist.ndim == 0 else dist
+
+    def row(self, i):
+        '''
+        Gets the distances from one point to every point
+
+        Parameters:
+            i (int): Point number
+
+        Returns:
+            np.array of distances in kilometres
+        '''
+        return self[np.full(self._n, i), np.arange(self._n)]
+
+    def square(self):
+        '''
+        Gets the full square distance matrix
+
+        Returns:
+            np.array of shape ``(n, n)`` of distances in kilometres
+        '''
+        out = np.zeros((self._n, self._n), dtype=self._data.dtype)
+        rows, cols = np.triu_indices(self._n, k=1)
+        out[rows, cols] = self._data
+        out[cols, rows] = self._data
+        return out
@@ -0,0 +1,336 @@
+# -*- coding: utf-8 -*-
+"""Parallel Solving
+
+This module contains functions to run tour solves in a pool of worker
+processes. The point coordinates are copied once into shared memory and every
+worker attaches to that block rather than receiving its own pickled copy.
+
+This file contains the following functions:
+
+    * share_coords - copies coordinates into a shared memory block
+    * attach_coords - attaches to coordinates held in shared memory
+    * solve_multistart - runs independent solves with different seeds and
+        keeps the shortest tour
+    * solve_clustered - splits the points into clusters, solves each in
+        parallel and stitches the subtours into one tour
+
+"""
+
+import numpy as np
+import queue
+import lib.solver as solver
+from lib.spatial import chord_to_km, kmeans, to_xyz
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from multiprocessing import Pool, shared_memory
+
+# Relative greedy edge noise used so that each start begins from a different
+# tour
+_MULTISTART_PERTURB = 0.1
+
+# Target number of points per cluster when the number of clusters is not given
+_CLUSTER_SIZE = 2000
+
+
+def share_coords(lat, lon):
+    '''
+    Copies latitude and longitude coordinates into a new shared memory block.
+    The caller must ``close()`` and ``unlink()`` the block when done.
+
+    Parameters:
+        lat (np.array): Latitudes in degrees
+        lon (np.array): Longitudes in degrees
+
+    Returns:
+        SharedMemory block holding a ``(2, n)`` float64 array
+    '''
+    n = len(lat)
+    shm = shared_memory.SharedMemory(create=True, size=max(16 * n, 1))
+    coords = np.ndarray((2, n), dtype=np.float64, buffer=shm.buf)
+    coords[0] = lat
+    coords[1] = lon
+    return shm
+
+
+def attach_coords(name, n):
+    '''
+    Attaches to coordinates held in shared memory by ``share_coords()``
+
+    Parameters:
+        name (str): Name of the shared memory block
+        n (int): Number of points
+
+    Returns:
+        shm (SharedMemory): The attached block; keep it open while ``coords``
+            is in use
+        coords (np.array): ``(2, n)`` array of latitudes and longitudes backed
+            by the block
+    '''
+    shm = shared_memory.SharedMemory(name=name)
+    return shm, np.ndarray((2, n), dtype=np.float64, buffer=shm.buf)
+
+
+def _solve_worker(name, n, engine, seed, time_bound, perturb, idx=None):
+    '''
+    Solves the tour over coordinates in shared memory, or over the subset of
+    them given by ``idx``; run in a worker process
+
+    Returns:
+        dict: ``seed``, ``tour`` (of point numbers in the full coordinate
+            set), ``length`` in kilometres, ``seconds``, ``compile_seconds``
+            spent compiling the kernels beforehand and ``success``
+    '''
+    compile_seconds = solver.warm_up() if engine == 'builtin' else 0.0
+    start_time = datetime.now()
+    shm, coords = attach_coords(name, n)
+    try:
+        lat = coords[0] if idx is None else coords[0][idx]
+        lon = coords[1] if idx is None else coords[1][idx]
+        if len(lat) < 4:
+            tour, success = np.arange(len(lat)), True
+        else:
+            tour, success = solver.run_engine(engine, lat, lon, time_bound,
+                                              int(seed), perturb)
+        length = solver.tour_length(to_xyz(lat, lon), tour)
+        if idx is not None:
+            tour = idx[tour]
+    finally:
+        del coords
+        shm.close()
+
+    return {'seed': int(seed), 'tour': tour, 'length': length,
+            'seconds': (datetime.now() - start_time).total_seconds(),
+            'compile_seconds': compile_seconds, 'success': success}
+
+
+def solve_multistart(lat, lon, seeds, engine='builtin', time_bound=-1,
+                     workers=None, target_length=None, wall_time=None):
+    '''
+    Runs independent solves with each of the given seeds in a process pool
+    and keeps the shortest tour. Once ``target_length`` is reached or
+    ``wall_time`` is up, the worker processes are terminated, so solves
+    still running stop there too.
+
+    Parameters:
+        lat (np.array): Latitudes in degrees
+        lon (np.array): Longitudes in degrees
+        seeds ([int]): Random seed for each solve
+
+    Optional:
+        engine (str): Solver engine; see ``solver.ENGINES``. Defaults to
+            ``'builtin'``.
+        time_bound (int): Time bound in seconds for each solve. Defaults to
+            ``-1`` for unbounded.
+        workers (int): Number of worker processes. Defaults to ``None`` for
+            one per CPU.
+        target_length (float): Stop once a tour of this length in kilometres
+            or shorter is found. Defaults to ``None``.
+        wall_time (float): Stop all solves after this many seconds.
+            Defaults to ``None``.
+
+    Returns:
+        tour (np.array): Point numbers in the shortest tour order
+        success (bool): Whether the solve that found it reported success
+        starts (list of dict): ``seed``, ``length``, ``seconds``,
+            ``compile_seconds``, ``success`` and ``best``, True for the
+            solve kept, for each completed solve, in completion order
+
+    Raises:
+        RuntimeError: If no solve completed within ``wall_time``
+    '''
+    engine = solver.resolve_engine(engine)
+    n = len(lat)
+    if engine == 'builtin':
+        # Compile once here, so that the workers load the kernels from the
+        # numba cache
+        solver.warm_up()
+    shm = share_coords(lat, lon)
+    pool = Pool(processes=workers)
+    done = queue.Queue()
+    results = []
+    start_time = datetime.now()
+    try:
+        for seed in seeds:
+            pool.apply_async(_solve_worker,
+                             (shm.name, n, engine, seed, time_bound,
+                              _MULTISTART_PERTURB),
+                             callback=done.put, error_callback=done.put)
+
+        while len(results) < len(seeds):
+            timeout = None if wall_time is None else max(
+                0, wall_time - (datetime.now() - start_time).total_seconds())
+            try:
+                result = done.get(timeout=timeout)
+            except queue.Empty:
+                break
+
+            if isinstance(result, BaseException):
+                raise result
+            results.append(result)
+            if target_length is not None \
+                    and result['length'] <= target_length:
+                break
+    finally:
+        # Stop solves still running past the budget
+        pool.terminate()
+        pool.join()
+        shm.close()
+        shm.unlink()
+
+    if not results:
+        raise RuntimeError('No solve completed within the wall time')
+
+    best = min(results, key=lambda r: r['length'])
+    starts = [{**{k: v for k, v in r.items() if k != 'tour'},
+               'best': r is best} for r in results]
+    return best['tour'], best['success'], starts
+
+
+def _stitch(xyz, subtours, order):
+    '''
+    Joins closed subtours into one tour, visiting them in the given order.
+    Each subtour is opened at the edge that best connects it to the exit of
+    the previous subtour and the centre of the next one.
+
+    Parameters:
+        xyz (np.array): Array of shape ``(n, 3)`` of unit-sphere coordinates
+        subtours (list of np.array): Point numbers of each closed subtour
+        order (np.array): Order to visit the subtours in
+
+    Returns:
+        np.array of point numbers in tour order
+    '''
+    centres = np.array([xyz[s].mean(axis=0) for s in subtours])
+
+    def dist(a, b):
+        return chord_to_km(np.linalg.norm(a - b, axis=-1))
+
+    path = []
+    prev = centres[order[-1]]
+    for k, c in enumerate(order):
+        sub = subtours[c]
+        if len(sub) == 1:
+            path.append(sub)
+            prev = xyz[sub[0]]
+            continue
+
+        nxt = xyz[path[0][0]] if k == len(order) - 1 and path \
+            else centres[order[(k + 1) % len(order)]]
+        a = sub
+        b = np.roll(sub, -1)
+        cut = dist(xyz[a], xyz[b])
+
+        # Enter at a and leave at b, walking backwards, or the reverse
+        cost_ab = dist(prev, xyz[a]) + dist(xyz[b], nxt) - cut
+        cost_ba = dist(prev, xyz[b]) + dist(xyz[a], nxt) - cut
+        j_ab = np.argmin(cost_ab)
+        j_ba = np.argmin(cost_ba)
+        if cost_ab[j_ab] <= cost_ba[j_ba]:
+            piece = np.roll(sub, -j_ab)[::-1]
+            piece = np.roll(piece, 1)
+        else:
+            piece = np.roll(sub, -(j_ba + 1))
+
+        path.append(piece)
+        prev = xyz[piece[-1]]
+
+    return np.concatenate(path)
+
+
+def solve_clustered(lat, lon, labels=None, n_clusters=None, engine='builtin',
+                    time_bound=-1, workers=None, random_seed=42):
+    '''
+    Finds a tour by decomposing the points into clusters. Each cluster's
+    subtour is solved in a worker process, the clusters are ordered by a tour
+    over their centres, the subtours are stitched together at their best
+    boundary edges and a final local search pass runs over the whole tour.
+
+    Parameters:
+        lat (np.array): Latitudes in degrees
+        lon (np.array): Longitudes in degrees
+
+    Optional:
+        labels (np.array): Cluster label for each point, e.g. the state.
+            Defaults to ``None`` to cluster with k-means.
+        n_clusters (int): Number of k-means clusters. Defaults to ``None``
+            for one per ``_CLUSTER_SIZE`` points.
+        engine (str): Solver engine for the subtours; see
+            ``solver.ENGINES``. Defaults to ``'builtin'``.
+        time_bound (int): Time bound in seconds for each subtour solve and
+            for the final local search. Defaults to ``-1`` for unbounded.
+        workers (int): Number of worker processes. Defaults to ``None`` for
+            one per CPU.
+        random_seed (int): Random seed for clustering and solving. Defaults
+            to 42.
+
+    Returns:
+        tour (np.array): Point numbers in tour order
+        stats (dict): ``clusters``, ``subtour_length``, ``stitched_length``,
+            ``stitch_overhead`` (stitched less subtour length) and ``length``
+            in kilometres, and seconds spent on each of ``cluster_seconds``,
+            ``solve_seconds``, ``stitch_seconds`` and ``polish_seconds``
+    '''
+    engine = solver.resolve_engine(engine)
+    n = len(lat)
+    xyz = to_xyz(lat, lon)
+
+    start_time = datetime.now()
+    if labels is None:
+        k = n_clusters or max(1, int(np.ceil(n / _CLUSTER_SIZE)))
+        labels = kmeans(xyz, k, random_seed=random_seed)
+    else:
+        labels = np.unique(np.asarray(labels), return_inverse=True)[1]
+    members = np.argsort(labels, kind='stable')
+    clusters = np.split(members, np.cumsum(np.bincount(labels))[:-1])
+    cluster_time = datetime.now()
+
+    # Solve each cluster's subtour in parallel, largest first
+    shm = share_coords(lat, lon)
+    subtours = [None] * len(clusters)
+    sub_length = 0.0
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(_solve_worker, shm.name, n, engine,
+                                   random_seed, time_bound, 0.0, idx): c
+                       for c, idx in sorted(enumerate(clusters),
+                                            key=lambda x: -len(x[1]))}
+            for future in as_completed(futures):
+                result = future.result()
+                subtours[futures[future]] = result['tour']
+                sub_length += result['length']
+    finally:
+        shm.close()
+        shm.unlink()
+    solve_time = datetime.now()
+
+    # Order the clusters by a tour over their centres, then stitch
+    centres = np.array([xyz[c].mean(axis=0) for c in clusters])
+    centres /= np.linalg.norm(centres, axis=1)[:, None]
+    c_lat = np.degrees(np.arcsin(np.clip(centres[:, 2], -1, 1)))
+    c_lon = np.degrees(np.arctan2(centres[:, 1], centres[:, 0]))
+    order = solver.solve(c_lat, c_lon, random_seed=random_seed)
+    tour = _stitch(xyz, subtours, order)
+    stitched_length = solver.tour_length(xyz, tour)
+    stitch_time = datetime.now()
+
+    # Global local search pass to clean up around the stitches
+    neigh, neigh_dist = solver.neighbours(xyz)
+    tour = solver.local_search(xyz, tour, neigh, neigh_dist,
+                               time_bound=time_bound,
+                               random_seed=random_seed)
+    end_time = datetime.now()
+
+    stats = {'clusters': len(clusters),
+             'subtour_length': sub_length,
+             'stitched_length': stitched_length,
+             'stitch_overhead': stitched_length - sub_length,
+             'length': solver.tour_length(xyz, tour),
+             'cluster_seconds': (cluster_time - start_time).total_seconds(),
+             'solve_seconds': (solve_time - cluster_time).total_seconds(),
+             'stitch_seconds': (stitch_time - solve_time).total_seconds(),
+             'polish_seconds': (end_time - stitch_time).total_seconds()}
+    print(f'Stitched {len(clusters)} clusters with '
+          + f'{stats["stitch_overhead"]:,.1f} km overhead in '
+          + f'{stats["stitch_seconds"]:.2f} seconds')
+    return tour, stats
@@ -0,0 +1,315 @@
+# -*- coding: utf-8 -*-
+"""Point Store
+
+This module contains the columnar storage engine that sits behind the
+TourRoute class. Each column is held in its own preallocated NumPy array which
+grows geometrically, so appending many small batches of points is amortized
+O(1) per point rather than copying the whole table on every call. A pandas
+DataFrame view is only built when one is asked for, and is cached until the
+next mutation.
+
+This file contains the following classes and functions:
+
+    * _PointStore - growable, column-per-array point storage
+    * _to_array - converts list, Series or array input to a NumPy array of
+        the given dtype
+
+"""
+
+import numpy as np
+import pandas as pd
+
+# Minimum capacity allocated on first growth
+_MIN_CAPACITY = 64
+
+# Growth factor used when the store runs out of capacity
+_GROWTH_FACTOR = 2
+
+
+def _to_array(values, dtype):
+    '''
+    Converts the given values to a NumPy array of the given dtype.
+
+    Parameters:
+        values (list, pd.Series or np.array): Values to convert
+        dtype (np.dtype): NumPy dtype of the returned array
+
+    Returns:
+        np.array: Array of ``values`` with dtype ``dtype``. Missing values are
+            ``NaN`` for float and object dtypes
+    '''
+    dtype = np.dtype(dtype)
+    if isinstance(values, (pd.Series, pd.Index)):
+        if dtype.kind == 'f':
+            return values.to_numpy(dtype=dtype, na_value=np.nan)
+        return values.to_numpy(dtype=dtype)
+
+    return np.asarray(values, dtype=dtype)
+
+
+class _PointStore():
+    '''
+    Holds points as a set of preallocated NumPy arrays, one per column
+
+    Usage::
+        store = _PointStore({'gid': np.int64, 'name': object})
+        store.append({'gid': [1, 2], 'name': ['foo', 'bar']})
+        df = store.frame()
+    '''
+
+    def __init__(self, dtypes, view_dtypes=None, capacity=0):
+        '''
+        Args:
+            dtypes (dict): Mapping of column names to the NumPy dtype used to
+                store each column. Column order is taken from the dict order
+
+        Optional:
+            view_dtypes (dict): Mapping of column names to the pandas dtype
+                used for the column in the DataFrame view e.g. ``'Int64'`` for
+                nullable integers stored as ``float64``. Defaults to ``None``.
+            capacity (int): Number of rows to preallocate. Defaults to 0.
+        '''
+        self._dtypes = {col: np.dtype(dt) for col, dt in dtypes.items()}
+        self._view_dtypes = view_dtypes or {}
+        self._size = 0
+        self._capacity = 0
+        self._cols = {col: np.empty(0, dtype=dt)
+                      for col, dt in self._dtypes.items()}
+        self._frame = None
+        self._version = 0
+        self.reserve(capacity)
+
+    @classmethod
+    def from_columns(cls, dtypes, cols, view_dtypes=None):
+        '''
+        Creates a store that holds the given arrays as its columns, without
+        copying any that already have the right dtype and are writeable e.g.
+        copy on write memory-maps. Read-only arrays, such as those backed by
+        Arrow buffers, are copied since the store writes to its columns in
+        place. The other arrays are only copied once the store has to grow.
+
+        Parameters:
+            dtypes (dict): Mapping of column names to the NumPy dtype used to
+                store each column
+            cols (dict): Mapping of column names to equal length arrays.
+                Columns not given are filled with missing values
+
+        Optional:
+            view_dtypes (dict): Mapping of column names to the pandas dtype
+                used for the column in the DataFrame view. Defaults to
+                ``None``.
+
+        Returns:
+            _PointStore holding the columns
+        '''
+        store = cls(dtypes, view_dtypes)
+        lengths = {len(v) for v in cols.values() if v is not None}
+        assert (len(lengths) <= 1), 'Columns of different length'
+        length = lengths.pop() if lengths else 0
+
+        for col, dtype in store._dtypes.items():
+            values = cols.get(col)
+            if values is None:
+                values = store._missing(col, length)
+            elif not isinstance(values, np.ndarray) or values.dtype != dtype:
+                values = _to_array(values, dtype)
+            if not values.flags.writeable:
+                values = values.copy()
+            store._cols[col] = values
+
+        store._size = length
+        store._capacity = length
+        store._changed()
+        return store
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def version(self):
+        '''Counter that is incremented every time the stored data changes'''
+        return self._version
+
+    def _changed(self):
+        '''Drops the cached DataFrame view and bumps the version counter'''
+        self._frame = None
+        self._version += 1
+
+    @property
+    def columns(self):
+        '''List of the column names held in the store'''
+        return list(self._dtypes)
+
+    @property
+    def capacity(self):
+        '''Number of rows the store can hold before it has to grow'''
+        return self._capacity
+
+    def reserve(self, capacity):
+        '''
+        Ensures the store can hold at least ``capacity`` rows without growing.
+
+        Parameters:
+            capacity (int): Minimum number of rows to hold
+        '''
+        if capacity <= self._capacity:
+            return
+
+        for col, arr in self._cols.items():
+            new_arr = np.empty(capacity, dtype=arr.dtype)
+            new_arr[:self._size] = arr[:self._size]
+            self._cols[col] = new_arr
+
+        self._capacity = capacity
+
+    def _grow(self, needed):
+        '''
+        Grows the store geometrically so that it can hold ``needed`` rows.
+
+        Parameters:
+            needed (int): Number of rows the store must be able to hold
+        '''
+        if needed > self._capacity:
+            self.reserve(max(needed, _GROWTH_FACTOR * self._capacity,
+                             _MIN_CAPACITY))
+
+    def _missing(self, col, length):
+        '''
+        Returns an array of missing values for the given column.
+
+        Parameters:
+            col (str): Column name
+            length (int): Number of missing values
+
+        Returns:
+            np.array: Array of ``NaN`` of length ``length``
+
+        Raises:
+            ValueError: If the column dtype can not hold missing values
+        '''
+        dtype = self._dtypes[col]
+        if dtype.kind not in ('f', 'O'):
+            raise ValueError(f'Column ``{col}`` can not hold missing values')
+
+        return np.full(length, np.nan, dtype=dtype)
+
+    def append(self, cols):
+        '''
+        Appends rows to the store.
+
+        Parameters:
+            cols (dict): Mapping of column names to equal length sequences of
+                values. Columns not given, or given as ``None``, are filled
+                with missing values
+
+        Returns:
+            np.array: Integer row numbers of the appended rows
+        '''
+        lengths = {len(v) for v in cols.values() if v is not None}
+        assert (len(lengths) <= 1), 'Columns of different length'
+        length = lengths.pop() if lengths else 0
+
+        start = self._size
+        self._grow(start + length)
+        for col, dtype in self._dtypes.items():
+            values = cols.get(col)
+            if values is None:
+                values = self._missing(col, length)
+            self._cols[col][start:start + length] = _to_array(values, dtype)
+
+        self._size += length
+        self._changed()
+        return np.arange(start, self._size)
+
+    def column(self, col):
+        '''
+        Gets a read only view of a column.
+
+        Parameters:
+            col (str): Column name
+
+        Returns:
+            np.array: View of the column values
+        '''
+        view = self._cols[col][:self._size]
+        view.flags.writeable = False
+        return view
+
+    def set(self, col, rows, values):
+        '''
+        Sets values for a column at the given rows.
+
+        Parameters:
+            col (str): Column name
+            rows (np.array): Integer row numbers or boolean mask
+            values (scalar or sequence): Values to set
+        '''
+        if not isinstance(values, (int, float, str)) and values is not None:
+            values = _to_array(values, self._dtypes[col])
+
+        self._cols[col][:self._size][rows] = values
+        self._changed()
+
+    def delete(self, rows):
+        '''
+        Deletes rows from the store, keeping the remaining rows in order.
+
+        Parameters:
+            rows (np.array): Integer row numbers or boolean mask of rows to
+                delete
+
+        Returns:
+            np.array: Integer array mapping each old row number to its new
+                row number, or ``-1`` if the row was deleted
+        '''
+        keep = np.ones(self._size, dtype=bool)
+        keep[rows] = False
+        self.take(np.flatnonzero(keep))
+
+        remap = np.cumsum(keep) - 1
+        remap[~keep] = -1
+        return remap
+
+    def take(self, rows):
+        '''
+        Rearranges the store so that it only holds the given rows, in the
+        given order.
+
+        Parameters:
+            rows (np.array): Integer row numbers
+        '''
+        rows = np.asarray(rows, dtype=np.intp)
+        for col, arr in self._cols.items():
+            arr[:len(rows)] = arr[:self._size][rows]
+
+        self._size = len(rows)
+        self._changed()
+
+    def frame(self, rows=None):
+        '''
+        Gets a DataFrame view of the store. The full view is cached until the
+        store is next changed.
+
+        Optional:
+            rows (np.array): Integer row numbers to include in the view.
+                Defaults to ``None`` for all rows.
+
+        Returns:
+            pd.DataFrame: DataFrame of the stored points
+        '''
+        if rows is None and self._frame is not None:
+            return self._frame
+
+        data = {}
+        for col, arr in self._cols.items():
+            values = arr[:self._size]
+            values = values.copy() if rows is None else values[rows]
+            view_dtype = self._view_dtypes.get(col)
+            data[col] = values if view_dtype is None \
+                else pd.array(values, dtype=view_dtype)
+
+        df = pd.DataFrame(data)
+        if rows is None:
+            self._frame = df
+
+        return df
@@ -0,0 +1,471 @@
+# -*- coding: utf-8 -*-
+"""Road Network Routing
+
+This module contains an offline routing engine over a road graph held in
+compressed sparse row (CSR) arrays. Tour points are snapped to their nearest
+graph node through a spatial index. Shortest path queries between two points
+use a bidirectional Dijkstra search, and batches of origins and destinations
+use a many-to-many Dijkstra search.
+
+The engine has the same ``directions()`` method as ``googlemaps.Client``, and
+returns results of the same shape (a route with one leg per pair of points),
+so it can be used in place of the Google Directions service anywhere a client
+is accepted e.g. ``tourroute.get_drive_distdur(RoadNetwork.load(path),
+tour_slices)``.
+
+This file contains the following classes and functions:
+
+    * RoadNetwork - road graph in CSR arrays with point to point and many to
+        many shortest path queries
+
+"""
+
+import heapq
+import numpy as np
+import pandas as pd
+
+from lib.spatial import _SphereIndex
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+
+# Speed in km/h used for edges without a duration
+_DEFAULT_SPEED_KPH = 50
+
+# Speed in km/h used for the straight line between a point and its snapped
+# graph node
+_SNAP_SPEED_KPH = 30
+
+# Metrics that paths can be minimised on
+_WEIGHTS = ['duration', 'distance']
+
+# Smallest edge weight; ``scipy.sparse.csgraph`` can drop zero weight edges
+_MIN_WEIGHT = 1e-6
+
+# Most unknown node ids listed when loading edges that refer to them
+_MAX_LISTED_IDS = 10
+
+
+def _csr(src, dst, n):
+    '''
+    Sorts edges into CSR order
+
+    Parameters:
+        src (np.array): Start node of each edge
+        dst (np.array): End node of each edge
+        n (int): Number of nodes
+
+    Returns:
+        indptr (np.array): Offsets into ``order`` for each node's edges
+        order (np.array): Edge numbers sorted by start node
+    '''
+    order = np.argsort(src, kind='stable')
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(src, minlength=n), out=indptr[1:])
+    return indptr, order
+
+
+class RoadNetwork():
+    '''
+    Holds a directed road graph in CSR arrays, in both the forward and the
+    reverse direction, with the distance in metres and the duration in
+    seconds of each edge
+
+    Usage::
+        net = RoadNetwork.from_csv('../data/nodes.csv', '../data/edges.csv')
+        dist, dur = net.route(40.7, -74.0, 42.7, -73.8)
+        result = net.directions(origin=(40.7, -74.0),
+                                destination=(42.7, -73.8))
+    '''
+
+    def __init__(self, lat, lon, u, v, distance, duration=None,
+                 oneway=None, weight='duration'):
+        '''
+        Args:
+            lat (np.array): Latitude of each node in degrees
+            lon (np.array): Longitude of each node in degrees
+            u (np.array): Start node number of each edge
+            v (np.array): End node number of each edge
+            distance (np.array): Length of each edge in metres
+
+        Optional:
+            duration (np.array): Time to drive each edge in seconds. Defaults
+                to ``None`` to use ``_DEFAULT_SPEED_KPH``.
+            oneway (np.array): Whether each edge can only be driven from
+                ``u`` to ``v``. Defaults to ``None`` for all two way.
+            weight (str): One of ``_WEIGHTS``, the metric that paths are
+                minimised on. Defaults to ``'duration'``.
+
+        Raises:
+            ValueError: If ``weight`` is unknown
+        '''
+        if weight not in _WEIGHTS:
+            raise ValueError(f'Unknown weight ``{weight}``')
+
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self.lon = np.asarray(lon, dtype=np.float64)
+        self.weight = weight
+        n = len(self.lat)
+
+        u = np.asarray(u, dtype=np.int64)
+        v = np.asarray(v, dtype=np.int64)
+        distance = np.asarray(distance, dtype=np.float64)
+        duration = distance / (_DEFAULT_SPEED_KPH / 3.6) if duration is None \
+            else np.asarray(duration, dtype=np.float64)
+
+        # Add the reverse of every two way edge
+        two_way = np.ones(len(u), dtype=bool) if oneway is None \
+            else ~np.asarray(oneway, dtype=bool)
+        src = np.concatenate((u, v[two_way]))
+        dst = np.concatenate((v, u[two_way]))
+        distance = np.concatenate((distance, distance[two_way]))
+        duration = np.concatenate((duration, duration[two_way]))
+
+        # Keep only the best of any parallel edges and drop self loops
+        cost = duration if weight == 'duration' else distance
+        keep = np.lexsort((cost, dst, src))
+        first = np.ones(len(keep), dtype=bool)
+        first[1:] = (src[keep][1:] != src[keep][:-1]) \
+            | (dst[keep][1:] != dst[keep][:-1])
+        keep = keep[first & (src[keep] != dst[keep])]
+        src, dst = src[keep], dst[keep]
+        distance, duration = distance[keep], duration[keep]
+
+        self._src = src
+        self._dst = dst
+        self._distance = distance
+        self._duration = duration
+
+        # Forward and reverse CSR, as edge numbers into the arrays above
+        self._f_indptr, self._f_edges = _csr(src, dst, n)
+        self._b_indptr, self._b_edges = _csr(dst, src, n)
+        self._sindex = None
+        self._search_lists = None
+
+    def __len__(self):
+        return len(self.lat)
+
+    @property
+    def n_edges(self):
+        '''Number of directed edges'''
+        return len(self._src)
+
+    @classmethod
+    def from_csv(cls, nodes_path, edges_path, weight='duration'):
+        '''
+        Loads a road graph from csv files, such as an edge list exported from
+        OpenStreetMap
+
+        Parameters:
+            nodes_path (str): Path to a csv file with columns ``id``, ``lat``
+                and ``lon``
+            edges_path (str): Path to a csv file with columns ``u`` and ``v``
+                (node ids) and ``length`` (metres), and optionally
+                ``duration`` (seconds), ``speed_kph`` and ``oneway``
+
+        Optional:
+            weight (str): One of ``_WEIGHTS``. Defaults to ``'duration'``.
+
+        Returns:
+            RoadNetwork
+
+        Raises:
+            ValueError: If an edge refers to a node id not in the nodes file
+        '''
+        nodes = pd.read_csv(nodes_path, dtype={'id': np.int64,
+                                               'lat': np.float64,
+                                               'lon': np.float64})
+        edges = pd.read_csv(edges_path)
+
+        # Renumber node ids e.g. OpenStreetMap ids to 0..n-1
+        ids = nodes['id'].to_numpy()
+        order = np.argsort(ids)
+        ends = np.concatenate((edges['u'].to_numpy(np.int64),
+                               edges['v'].to_numpy(np.int64)))
+        idx = np.minimum(np.searchsorted(ids, ends, sorter=order),
+                         max(len(ids) - 1, 0))
+        known = ids[order[idx]] == ends if len(ids) \
+            else np.zeros(len(ends), dtype=bool)
+        if not known.all():
+            unknown = np.unique(ends[~known])
+            listed = ', '.join(str(i) for i in unknown[:_MAX_LISTED_IDS])
+            more = len(unknown) - _MAX_LISTED_IDS
+            raise ValueError(f'Edges refer to {len(unknown):,} node ids '
+                             + f'not in ``{nodes_path}``: {listed}'
+                             + (f' and {more:,} more' if more > 0 else ''))
+        u, v = np.split(order[idx], 2)
+
+        length = edges['length'].to_numpy(np.float64)
+        if 'duration' in edges:
+            duration = edges['duration'].to_numpy(np.float64)
+        elif 'speed_kph' in edges:
+            duration = length / (edges['speed_kph'].to_numpy(np.float64)
+                                 / 3.6)
+        else:
+            duration = None
+
+        oneway = edges['oneway'].to_numpy(bool) if 'oneway' in edges \
+            else None
+        return cls(nodes['lat'].to_numpy(), nodes['lon'].to_numpy(), u, v,
+                   length, duration, oneway, weight)
+
+    def save(self, path):
+        '''
+        Saves the road graph to a ``.npz`` file
+
+        Parameters:
+            path (str): Path to the ``.npz`` file
+        '''
+        np.savez(path, lat=self.lat, lon=self.lon, u=self._src, v=self._dst,
+                 distance=self._distance, duration=self._duration,
+                 weight=self.weight)
+
+    @classmethod
+    def load(cls, path):
+        '''
+        Loads a road graph saved by ``save()``
+
+        Parameters:
+            path (str): Path to the ``.npz`` file
+
+        Returns:
+            RoadNetwork
+        '''
+        with np.load(path) as data:
+            return cls(data['lat'], data['lon'], data['u'], data['v'],
+                       data['distance'], data['duration'],
+                       oneway=np.ones(len(data['u']), dtype=bool),
+                       weight=str(data['weight']))
+
+    def snap(self, lat, lon):
+        '''
+        Snaps points to their nearest graph node
+
+        Parameters:
+            lat (float or np.array): Latitudes in degrees
+            lon (float or np.array): Longitudes in degrees
+
+        Returns:
+            nodes (np.array): Nearest node number for each point
+            dist (np.array): Great circle distance in metres from each point
+                to its node
+        '''
+        if self._sindex is None:
+            self._sindex = _SphereIndex(np.arange(len(self)), self.lat,
+                                        self.lon)
+        km, nodes = self._sindex.nearest(lat, lon, k=1)
+        return nodes[:, 0], km[:, 0] * 1000
+
+    def _costs(self):
+        '''Gets the edge weights minimised by path searches'''
+        return self._duration if self.weight == 'duration' \
+            else self._distance
+
+    def _shortest_path(self, s, t):
+        '''
+        Finds the shortest path between two nodes with a bidirectional
+        Dijkstra search, expanding whichever side has the nearer frontier
+
+        Parameters:
+            s (int): Start node
+            t (int): End node
+
+        Returns:
+            list of int: Edge numbers along the path, in order, or ``None``
+            if ``t`` can not be reached from ``s``
+        '''
+        if s == t:
+            return []
+
+        # Plain lists are much faster than arrays to index one at a time
+        if self._search_lists is None:
+            self._search_lists = (
+                self._costs().tolist(),
+                [(self._f_indptr.tolist(), self._f_edges.tolist(),
+                  self._dst.tolist()),
+                 (self._b_indptr.tolist(), self._b_edges.tolist(),
+                  self._src.tolist())])
+        cost, sides = self._search_lists
+        dist = [{s: 0.0}, {t: 0.0}]
+        pred = [{s: -1}, {t: -1}]
+        heaps = [[(0.0, s)], [(0.0, t)]]
+        done = [set(), set()]
+        best = float('inf')
+        meet = -1
+
+        while heaps[0] and heaps[1]:
+            if heaps[0][0][0] + heaps[1][0][0] >= best:
+                break
+
+            side = 0 if heaps[0][0][0] <= heaps[1][0][0] else 1
+            d, node = heapq.heappop(heaps[side])
+            if node in done[side]:
+                continue
+            done[side].add(node)
+
+            indptr, edges, ends = sides[side]
+            for e in edges[indptr[node]:indptr[node + 1]]:
+                nxt = ends[e]
+                nd = d + cost[e]
+                if nd < dist[side].get(nxt, best):
+                    dist[side][nxt] = nd
+                    pred[side][nxt] = e
+                    heapq.heappush(heaps[side], (nd, nxt))
+                    if nxt in dist[1 - side] \
+                            and nd + dist[1 - side][nxt] < best:
+                        best = nd + dist[1 - side][nxt]
+                        meet = nxt
+
+        if meet < 0:
+            return None
+
+        # Walk back from the meeting node to each end
+        path = []
+        node = meet
+        while pred[0][node] >= 0:
+            path.append(pred[0][node])
+            node = int(self._src[pred[0][node]])
+        path.reverse()
+        node = meet
+        while pred[1][node] >= 0:
+            path.append(pred[1][node])
+            node = int(self._dst[pred[1][node]])
+        return path
+
+    def route(self, lat1, lon1, lat2, lon2):
+        '''
+        Gets the driving distance and duration between two points. Each point
+        is snapped to its nearest graph node, and the straight line to the
+        node is included at ``_SNAP_SPEED_KPH``.
+
+        Parameters:
+            lat1 (float): Latitude of the origin in degrees
+            lon1 (float): Longitude of the origin in degrees
+            lat2 (float): Latitude of the destination in degrees
+            lon2 (float): Longitude of the destination in degrees
+
+        Returns:
+            dist (float): Distance in metres, or ``NaN`` if there is no path
+            duration (float): Duration in seconds, or ``NaN`` if there is no
+                path
+        '''
+        nodes, snap = self.snap([lat1, lat2], [lon1, lon2])
+        return self._leg(nodes[0], nodes[1], snap.sum())
+
+    def _leg(self, s, t, snap_m):
+        '''
+        Gets the driving distance and duration between two nodes, plus the
+        straight line to the snapped points
+
+        Parameters:
+            s (int): Start node
+            t (int): End node
+            snap_m (float): Total distance in metres from the points to their
+                snapped nodes
+
+        Returns:
+            dist (float): Distance in metres, or ``NaN`` if there is no path
+            duration (float): Duration in seconds, or ``NaN`` if there is no
+                path
+        '''
+        path = self._shortest_path(int(s), int(t))
+        if path is None:
+            return np.nan, np.nan
+
+        return (self._distance[path].sum() + snap_m,
+                self._duration[path].sum() + snap_m / (_SNAP_SPEED_KPH / 3.6))
+
+    def matrix(self, lat1, lon1, lat2, lon2):
+        '''
+        Gets the driving distance and duration from every origin to every
+        destination, with one single source search per distinct origin node
+
+        Parameters:
+            lat1 (np.array): Latitudes of the origins in degrees
+            lon1 (np.array): Longitudes of the origins in degrees
+            lat2 (np.array): Latitudes of the destinations in degrees
+            lon2 (np.array): Longitudes of the destinations in degrees
+
+        Returns:
+            dist (np.array): Array of shape ``(m, k)`` of distances in metres,
+                ``NaN`` where there is no path
+            duration (np.array): Array of shape ``(m, k)`` of durations in
+                seconds, ``NaN`` where there is no path
+        '''
+        src, src_snap = self.snap(lat1, lon1)
+        dst, dst_snap = self.snap(lat2, lon2)
+        sources, src_row = np.unique(src, return_inverse=True)
+
+        n = len(self)
+        cost = np.maximum(self._costs(), _MIN_WEIGHT)
+        graph = csr_matrix((cost, (self._src, self._dst)), shape=(n, n))
+        _, pred = dijkstra(graph, directed=True, indices=sources,
+                           return_predecessors=True)
+
+        # Sum both metrics along each path by walking the predecessors back
+        # from every destination at once
+        edge_no = csr_matrix((np.arange(1, self.n_edges + 1),
+                              (self._src, self._dst)), shape=(n, n))
+        rows = np.repeat(np.arange(len(sources)), len(dst))
+        node = np.tile(dst, len(sources))
+        dist = np.zeros(len(rows))
+        dur = np.zeros(len(rows))
+        reached = (node == sources[rows]) | (pred[rows, node] >= 0)
+        walking = reached & (node != sources[rows])
+        while walking.any():
+            prev = pred[rows[walking], node[walking]]
+            e = np.asarray(edge_no[prev, node[walking]]).ravel() - 1
+            dist[walking] += self._distance[e]
+            dur[walking] += self._duration[e]
+            node[walking] = prev
+            walking[walking] = prev != sources[rows[walking]]
+
+        dist = np.where(reached, dist, np.nan).reshape(len(sources), -1)
+        dur = np.where(reached, dur, np.nan).reshape(len(sources), -1)
+        snap_m = src_snap[:, None] + dst_snap[None, :]
+        return (dist[src_row] + snap_m,
+                dur[src_row] + snap_m / (_SNAP_SPEED_KPH / 3.6))
+
+    def directions(self, origin, destination, waypoints=None,
+                   mode='driving', units='metric', **kwargs):
+        '''
+        Gets a route through the given points, in the same shape as
+        ``googlemaps.Client.directions()``, with the ``distance`` and
+        ``duration`` of each leg
+
+        Parameters:
+            origin (tuple): Latitude and longitude tuple of the origin
+            destination (tuple): Latitude and longitude tuple of the
+                destination
+
+        Optional:
+            waypoints (list of tuples): Latitude and longitude tuples of the
+                points in between. Defaults to ``None``.
+            mode (str): Only ``'driving'`` is supported. Defaults to
+                ``'driving'``.
+            units (str): Ignored; values are always metres and seconds.
+                Defaults to ``'metric'``.
+
+        Returns:
+            list: A single route with one leg per pair of consecutive points,
+            or an empty list if any leg has no path
+
+        Raises:
+            ValueError: If ``mode`` is not ``'driving'``
+        '''
+        if mode != 'driving':
+            raise ValueError(f'Unsupported mode ``{mode}``')
+
+        points = np.array([origin] + list(waypoints or []) + [destination],
+                          dtype=np.float64)
+        nodes, snap = self.snap(points[:, 0], points[:, 1])
+
+        legs = []
+        for i in range(len(points) - 1):
+            dist, dur = self._leg(nodes[i], nodes[i + 1], snap[i] + snap[i + 1])
+            if np.isnan(dist):
+                return []
+
+            legs.append({'distance': {'value': int(round(dist))},
+                         'duration': {'value': int(round(dur))}})
+
+        return [{'legs': legs}]
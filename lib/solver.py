@@ -0,0 +1,853 @@
+# -*- coding: utf-8 -*-
+"""Built-in TSP Solver
+
+This module contains a pure NumPy travelling salesman heuristic, used by
+``TourRoute.find_tour(engine='builtin')`` so that a tour can be found without
+Concorde. An initial tour is built with the greedy edge method (or along a
+Hilbert space-filling curve), then improved with 2-opt and Or-opt local search
+over k-nearest-neighbour candidate lists with don't-look bits. A tour from
+another solver, such as Concorde stopped at its time bound, can be polished
+with the same moves plus Lin-Kernighan style variable depth moves.
+
+Concorde is wrapped here too, and imported only when used, so that it is an
+optional dependency.
+
+The hot loops are written as plain functions over NumPy arrays. If numba is
+installed they are JIT compiled, otherwise they run as ordinary Python.
+
+This file contains the following functions:
+
+    * solve - finds a tour over the given latitude and longitude points
+    * warm_up - compiles the JIT kernels ahead of a time bounded run
+    * tour_length - gets the closed tour length in kilometres
+    * neighbours - gets the k-nearest-neighbour candidate lists
+    * greedy_tour - builds an initial tour with the greedy edge method
+    * sfc_tour - builds an initial tour along a Hilbert curve
+    * local_search - improves a tour with 2-opt and Or-opt moves
+    * polish - improves a given tour with Or-opt and Lin-Kernighan style moves
+        and reports the gain
+    * resolve_engine - checks an engine name and resolves ``'auto'``
+    * run_engine - finds a tour with the given engine
+    * concorde_available - checks whether Concorde is installed
+    * solve_concorde - finds a tour with Concorde
+
+"""
+
+import importlib.util
+import numpy as np
+from datetime import datetime
+from lib.spatial import to_xyz
+from scipy.spatial import cKDTree
+
+try:
+    from numba import njit
+    _jit = njit(cache=True)
+except ImportError:  # numba is optional; run the kernels as plain Python
+    def _jit(fn):
+        return fn
+
+_EARTH_RADIUS = 6371  # Earth's average radius in kilometres
+
+# Solver engines accepted by ``run_engine()``
+ENGINES = ['auto', 'concorde', 'builtin']
+
+# Minimum improvement in kilometres for a move to be applied
+_EPS = 1e-7
+
+# Longest segment moved by Or-opt
+_OR_OPT_MAX_SEG = 3
+
+# Number of queue steps run between time bound checks
+_STEPS_PER_CHECK = 2048
+
+# Maximum number of 2-opt steps chained by a Lin-Kernighan style move
+_LK_MAX_DEPTH = 6
+
+# Number of points in the tour solved by ``warm_up()``
+_WARM_UP_POINTS = 16
+
+# Whether ``warm_up()`` has run in this process
+_warm = False
+
+
+@_jit
+def _dist(xyz, a, b):
+    '''
+    Great circle distance in kilometres between points ``a`` and ``b``
+    '''
+    dx = xyz[a, 0] - xyz[b, 0]
+    dy = xyz[a, 1] - xyz[b, 1]
+    dz = xyz[a, 2] - xyz[b, 2]
+    half = np.sqrt(dx * dx + dy * dy + dz * dz) / 2
+    return 2 * _EARTH_RADIUS * np.arcsin(min(half, 1.0))
+
+
+@_jit
+def _succ(tour, pos, a):
+    return tour[(pos[a] + 1) % len(tour)]
+
+
+@_jit
+def _pred(tour, pos, a):
+    return tour[(pos[a] - 1) % len(tour)]
+
+
+@_jit
+def _reverse(tour, pos, i, j):
+    '''
+    Reverses the tour path running forward from position ``i`` to position
+    ``j``, or the path outside of it if that is shorter; both give the same
+    cycle
+    '''
+    n = len(tour)
+    length = (j - i) % n + 1
+    if 2 * length > n:
+        i, j = (j + 1) % n, (i - 1) % n
+        length = n - length
+
+    idx = (i + np.arange(length)) % n
+    tour[idx] = tour[idx][::-1].copy()
+    pos[tour[idx]] = idx
+
+
+@_jit
+def _move(tour, pos, a, b, c, d):
+    '''
+    Applies the 2-opt move that removes edges ``(a, b)`` and ``(c, d)`` and
+    adds edges ``(a, c)`` and ``(b, d)``
+    '''
+    if _succ(tour, pos, a) == b:
+        _reverse(tour, pos, pos[b], pos[c])
+    else:
+        _reverse(tour, pos, pos[a], pos[d])
+
+
+@_jit
+def _push(queue, inq, head, size, a):
+    '''
+    Pushes node ``a`` onto the ring buffer queue of active nodes, i.e. clears
+    its don't-look bit
+    '''
+    if not inq[a]:
+        queue[(head + size) % len(queue)] = a
+        inq[a] = True
+        size += 1
+    return size
+
+
+@_jit
+def _try_2opt(tour, pos, xyz, neigh, neigh_dist, a):
+    '''
+    Looks for an improving 2-opt move at node ``a``, applying the first one
+    found
+
+    Returns the four nodes touched by the move, or ``-1`` if none was found
+    '''
+    for direction in range(2):
+        if direction == 0:
+            b = _succ(tour, pos, a)
+        else:
+            b = _pred(tour, pos, a)
+        d_ab = _dist(xyz, a, b)
+
+        for k in range(neigh.shape[1]):
+            c = neigh[a, k]
+            g1 = d_ab - neigh_dist[a, k]
+            if g1 <= _EPS:
+                break
+
+            if direction == 0:
+                d = _succ(tour, pos, c)
+            else:
+                d = _pred(tour, pos, c)
+            if c == b or d == a:
+                continue
+
+            delta = neigh_dist[a, k] + _dist(xyz, b, d) - d_ab \
+                - _dist(xyz, c, d)
+            if delta < -_EPS:
+                _move(tour, pos, a, b, c, d)
+                return a, b, c, d
+
+    return -1, -1, -1, -1
+
+
+@_jit
+def _try_or_opt(tour, pos, xyz, neigh, a):
+    '''
+    Looks for an improving Or-opt move of a segment of up to
+    ``_OR_OPT_MAX_SEG`` nodes that starts or ends at node ``a``, applying the
+    best one found for the first segment that can be improved
+
+    Returns the four nodes either side of the old and new segment positions,
+    or ``-1`` if no move was found
+    '''
+    n = len(tour)
+    for seg_len in range(1, min(_OR_OPT_MAX_SEG, n - 3) + 1):
+        for direction in range(2):
+            # Segment runs forward from s1 to s2 and sits between p and nx
+            if direction == 0:
+                s1 = a
+                s2 = tour[(pos[a] + seg_len - 1) % n]
+            else:
+                s2 = a
+                s1 = tour[(pos[a] - seg_len + 1) % n]
+            p = _pred(tour, pos, s1)
+            nx = _succ(tour, pos, s2)
+            g_remove = _dist(xyz, p, s1) + _dist(xyz, s2, nx) \
+                - _dist(xyz, p, nx)
+            if g_remove <= _EPS:
+                continue
+
+            best = -_EPS
+            best_c = -1
+            best_e = -1
+            best_rev = False
+            p_s1 = pos[s1]
+            for end in range(2):
+                x = s1 if end == 0 else s2
+                for k in range(neigh.shape[1]):
+                    y = neigh[x, k]
+                    if _dist(xyz, x, y) >= g_remove:
+                        break
+                    for side in range(2):
+                        if side == 0:
+                            c = y
+                            e = _succ(tour, pos, y)
+                        else:
+                            c = _pred(tour, pos, y)
+                            e = y
+                        # c and e must both be outside the segment and the
+                        # new edge must not be the one being removed
+                        if (pos[c] - p_s1) % n < seg_len \
+                                or (pos[e] - p_s1) % n < seg_len \
+                                or c == p:
+                            continue
+                        d_ce = _dist(xyz, c, e)
+                        fwd = _dist(xyz, c, s1) + _dist(xyz, s2, e) - d_ce
+                        rev = _dist(xyz, c, s2) + _dist(xyz, s1, e) - d_ce
+                        if fwd - g_remove < best:
+                            best = fwd - g_remove
+                            best_c, best_e, best_rev = c, e, False
+                        if rev - g_remove < best:
+                            best = rev - g_remove
+                            best_c, best_e, best_rev = c, e, True
+
+            if best_c >= 0:
+                c = best_c
+                e = best_e
+                # Segment insertion as a sequence of 2-opt moves
+                _move(tour, pos, p, s1, c, e)
+                if c != nx:
+                    _move(tour, pos, p, c, nx, s2)
+                if not best_rev:
+                    _move(tour, pos, c, s2, s1, e)
+                return p, nx, c, e
+
+    return -1, -1, -1, -1
+
+
+@_jit
+def _try_lk(tour, pos, xyz, neigh, neigh_dist, t1, max_depth):
+    '''
+    Looks for an improving Lin-Kernighan style move at node ``t1``: a chain
+    of up to ``max_depth`` 2-opt steps, where each step breaks the edge the
+    previous step closed the tour with. The chain is cut back to the step
+    with the best gain and kept if that gain is positive.
+
+    Returns the nodes touched by the kept move, or an empty array if none was
+    found
+    '''
+    touched = np.empty(2 * max_depth + 2, dtype=np.int64)
+    moves = np.empty((max_depth, 4), dtype=np.int64)
+
+    for direction in range(2):
+        if direction == 0:
+            t2 = _succ(tour, pos, t1)
+        else:
+            t2 = _pred(tour, pos, t1)
+        touched[0] = t1
+        touched[1] = t2
+        n_touched = 2
+        g = _dist(xyz, t1, t2)
+        best_gain = _EPS
+        best_depth = 0
+        depth = 0
+
+        while depth < max_depth:
+            # Choose t3 from the candidates of t2 with the best one step
+            # lookahead gain
+            fwd = _succ(tour, pos, t1) == t2
+            best_g = -np.inf
+            best_t3 = -1
+            best_t4 = -1
+            for k in range(neigh.shape[1]):
+                t3 = neigh[t2, k]
+                g1 = g - neigh_dist[t2, k]
+                if g1 <= _EPS:
+                    break
+                t4 = _pred(tour, pos, t3) if fwd else _succ(tour, pos, t3)
+                if t3 == t1 or t4 == t2 or t4 == t1:
+                    continue
+
+                # Do not break an edge that this chain has already touched
+                seen = False
+                for m in range(n_touched):
+                    if touched[m] == t3 or touched[m] == t4:
+                        seen = True
+                if seen:
+                    continue
+
+                g_look = g1 + _dist(xyz, t3, t4)
+                if g_look > best_g:
+                    best_g = g_look
+                    best_t3 = t3
+                    best_t4 = t4
+
+            if best_t3 < 0:
+                break
+
+            _move(tour, pos, t1, t2, best_t4, best_t3)
+            moves[depth, 0] = t1
+            moves[depth, 1] = t2
+            moves[depth, 2] = best_t4
+            moves[depth, 3] = best_t3
+            touched[n_touched] = best_t3
+            touched[n_touched + 1] = best_t4
+            n_touched += 2
+            depth += 1
+
+            g = best_g
+            gain = g - _dist(xyz, best_t4, t1)
+            if gain > best_gain:
+                best_gain = gain
+                best_depth = depth
+            t2 = best_t4
+
+        # Undo the steps past the best one, newest first
+        for m in range(depth - 1, best_depth - 1, -1):
+            _move(tour, pos, moves[m, 0], moves[m, 2], moves[m, 1],
+                  moves[m, 3])
+
+        if best_depth > 0:
+            return touched[:2 * best_depth + 2].copy()
+
+    return touched[:0].copy()
+
+
+@_jit
+def _improve(tour, pos, xyz, neigh, neigh_dist, queue, inq, head, size,
+             max_steps, or_opt, lk_depth):
+    '''
+    Runs 2-opt, Or-opt and, if ``lk_depth`` is more than one, Lin-Kernighan
+    style local search from the queue of active nodes for at most
+    ``max_steps`` queue pops
+
+    Returns the new queue head and size
+    '''
+    n = len(tour)
+    steps = 0
+    while size > 0 and steps < max_steps:
+        a = queue[head]
+        head = (head + 1) % n
+        size -= 1
+        inq[a] = False
+        steps += 1
+
+        t1, t2, t3, t4 = _try_2opt(tour, pos, xyz, neigh, neigh_dist, a)
+        if t1 < 0 and or_opt:
+            t1, t2, t3, t4 = _try_or_opt(tour, pos, xyz, neigh, a)
+
+        if t1 >= 0:
+            size = _push(queue, inq, head, size, a)
+            size = _push(queue, inq, head, size, t1)
+            size = _push(queue, inq, head, size, t2)
+            size = _push(queue, inq, head, size, t3)
+            size = _push(queue, inq, head, size, t4)
+        elif lk_depth > 1:
+            touched = _try_lk(tour, pos, xyz, neigh, neigh_dist, a,
+                              lk_depth)
+            for m in range(len(touched)):
+                size = _push(queue, inq, head, size, touched[m])
+
+    return head, size
+
+
+@_jit
+def _greedy_edges(n, edge_a, edge_b):
+    '''
+    Adds candidate edges, shortest first, wherever both ends have degree less
+    than two and the edge does not close a cycle
+
+    Returns an ``(n, 2)`` adjacency array with ``-1`` for missing links
+    '''
+    adj = np.full((n, 2), -1, dtype=np.int64)
+    deg = np.zeros(n, dtype=np.int64)
+    parent = np.arange(n)
+
+    for k in range(len(edge_a)):
+        a = edge_a[k]
+        b = edge_b[k]
+        if deg[a] >= 2 or deg[b] >= 2:
+            continue
+
+        # Union-find with path halving
+        ra = a
+        while parent[ra] != ra:
+            parent[ra] = parent[parent[ra]]
+            ra = parent[ra]
+        rb = b
+        while parent[rb] != rb:
+            parent[rb] = parent[parent[rb]]
+            rb = parent[rb]
+        if ra == rb:
+            continue
+
+        parent[ra] = rb
+        adj[a, deg[a]] = b
+        adj[b, deg[b]] = a
+        deg[a] += 1
+        deg[b] += 1
+
+    return adj
+
+
+@_jit
+def _walk(adj, start):
+    '''
+    Walks the adjacency array from ``start`` to the other end of its path
+
+    Returns the nodes on the path in order
+    '''
+    path = np.empty(len(adj), dtype=np.int64)
+    prev = -1
+    cur = start
+    k = 0
+    while cur >= 0:
+        path[k] = cur
+        k += 1
+        nxt = adj[cur, 0] if adj[cur, 0] != prev else adj[cur, 1]
+        if nxt == start:
+            break
+        prev = cur
+        cur = nxt
+    return path[:k]
+
+
+def neighbours(xyz, k=10):
+    '''
+    Gets the k-nearest-neighbour candidate lists for each point
+
+    Parameters:
+        xyz (np.array): Array of shape ``(n, 3)`` of unit-sphere coordinates
+
+    Optional:
+        k (int): Number of neighbours per point. Defaults to 10.
+
+    Returns:
+        neigh (np.array): Array of shape ``(n, k)`` of neighbour point
+            numbers, nearest first
+        neigh_dist (np.array): Array of shape ``(n, k)`` of distances in
+            kilometres to each neighbour
+    '''
+    n = len(xyz)
+    k = max(1, min(k, n - 1))
+    chord, neigh = cKDTree(xyz).query(xyz, k=k + 1)
+    chord = chord.reshape(n, k + 1)
+    neigh = neigh.reshape(n, k + 1)
+
+    # Drop each point from its own list by index, as a duplicate of it may
+    # come first; rows without it, from many duplicates, drop the farthest
+    drop = neigh == np.arange(n)[:, None]
+    drop[:, -1] |= ~drop.any(axis=1)
+    chord = chord[~drop].reshape(n, k)
+    neigh = neigh[~drop].reshape(n, k).astype(np.int64)
+    neigh_dist = 2 * _EARTH_RADIUS * np.arcsin(np.clip(chord / 2, 0, 1))
+    return neigh, neigh_dist
+
+
+def greedy_tour(xyz, neigh, neigh_dist):
+    '''
+    Builds a tour with the greedy edge method over the candidate lists. The
+    path fragments left over are joined nearest endpoint first.
+
+    Parameters:
+        xyz (np.array): Array of shape ``(n, 3)`` of unit-sphere coordinates
+        neigh (np.array): Candidate neighbour lists from ``neighbours()``
+        neigh_dist (np.array): Candidate distances from ``neighbours()``
+
+    Returns:
+        np.array of point numbers in tour order
+    '''
+    n = len(xyz)
+    edge_a = np.repeat(np.arange(n), neigh.shape[1])
+    edge_b = neigh.ravel()
+    keep = edge_a < edge_b
+    order = np.argsort(neigh_dist.ravel()[keep], kind='stable')
+    adj = _greedy_edges(n, edge_a[keep][order], edge_b[keep][order])
+
+    # Collect the path fragments by walking from each unvisited endpoint
+    deg = (adj >= 0).sum(axis=1)
+    visited = np.zeros(n, dtype=bool)
+    fragments = []
+    for v in np.flatnonzero(deg < 2):
+        if not visited[v]:
+            path = _walk(adj, v)
+            visited[path] = True
+            fragments.append(path)
+
+    # Chain fragments, each time jumping to the nearest free endpoint
+    ends = np.array([[f[0], f[-1]] for f in fragments], dtype=np.int64)
+    free = np.ones(len(fragments), dtype=bool)
+    free[0] = False
+    tour = [fragments[0]]
+    cur = ends[0, 1]
+    for _ in range(len(fragments) - 1):
+        cand = np.flatnonzero(free)
+        d = np.linalg.norm(xyz[ends[cand]] - xyz[cur], axis=2)
+        f, side = np.unravel_index(np.argmin(d), d.shape)
+        f = cand[f]
+        free[f] = False
+        tour.append(fragments[f] if side == 0 else fragments[f][::-1])
+        cur = ends[f, 1 - side]
+
+    return np.concatenate(tour)
+
+
+def _hilbert_index(x, y, order=16):
+    '''
+    Gets the Hilbert curve index of integer grid points
+
+    Parameters:
+        x (np.array): Integer x grid coordinates in ``[0, 2 ** order)``
+        y (np.array): Integer y grid coordinates in ``[0, 2 ** order)``
+
+    Optional:
+        order (int): Curve order. Defaults to 16.
+
+    Returns:
+        np.array of Hilbert curve indexes
+    '''
+    side = 1 << order
+    x = x.astype(np.int64)
+    y = y.astype(np.int64)
+    d = np.zeros(len(x), dtype=np.int64)
+    s = side >> 1
+    while s > 0:
+        rx = (x & s) > 0
+        ry = (y & s) > 0
+        d += s * s * ((3 * rx.astype(np.int64)) ^ ry.astype(np.int64))
+
+        # Rotate the quadrant so that the curve is continuous
+        flip = ~ry & rx
+        x = np.where(flip, side - 1 - x, x)
+        y = np.where(flip, side - 1 - y, y)
+        x, y = np.where(~ry, y, x), np.where(~ry, x, y)
+        s >>= 1
+
+    return d
+
+
+def sfc_tour(lat, lon):
+    '''
+    Builds a tour by visiting points in Hilbert space-filling curve order
+
+    Parameters:
+        lat (np.array): Latitudes in degrees
+        lon (np.array): Longitudes in degrees
+
+    Returns:
+        np.array of point numbers in tour order
+    '''
+    side = (1 << 16) - 1
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    span_lat = max(lat.max() - lat.min(), 1e-12)
+    span_lon = max(lon.max() - lon.min(), 1e-12)
+    x = ((lon - lon.min()) / span_lon * side).astype(np.int64)
+    y = ((lat - lat.min()) / span_lat * side).astype(np.int64)
+    return np.argsort(_hilbert_index(x, y), kind='stable')
+
+
+def warm_up():
+    '''
+    Compiles the JIT kernels, or loads them from the numba cache, by solving
+    a tiny tour with the same argument types as a real solve. Time bounded
+    runs call this before starting their clock, so that the compile is not
+    counted against the bound. Only the first call in a process does any
+    work.
+
+    Returns:
+        float: Seconds spent compiling; 0 if already done
+    '''
+    global _warm
+    if _warm:
+        return 0.0
+
+    _warm = True
+    start_time = datetime.now()
+    rng = np.random.default_rng(0)
+    lat = rng.uniform(-60, 60, _WARM_UP_POINTS)
+    lon = rng.uniform(-180, 180, _WARM_UP_POINTS)
+    xyz = to_xyz(lat, lon)
+    neigh, neigh_dist = neighbours(xyz)
+    tour = greedy_tour(xyz, neigh, neigh_dist)
+    local_search(xyz, tour, neigh, neigh_dist, lk_depth=_LK_MAX_DEPTH)
+    return (datetime.now() - start_time).total_seconds()
+
+
+def tour_length(xyz, tour):
+    '''
+    Gets the closed tour length, including the leg back to the start
+
+    Parameters:
+        xyz (np.array): Array of shape ``(n, 3)`` of unit-sphere coordinates
+        tour (np.array): Point numbers in tour order
+
+    Returns:
+        float: Tour length in kilometres
+    '''
+    chord = np.linalg.norm(xyz[tour] - xyz[np.roll(tour, -1)], axis=1)
+    return float(np.sum(
+        2 * _EARTH_RADIUS * np.arcsin(np.clip(chord / 2, 0, 1))))
+
+
+def local_search(xyz, tour, neigh, neigh_dist, active=None, or_opt=True,
+                 time_bound=-1, random_seed=42, lk_depth=0):
+    '''
+    Improves a tour with 2-opt and Or-opt moves over the candidate lists.
+    Each node has a don't-look bit; only nodes in the active queue are
+    examined and a node is put back in the queue when a move touches it.
+
+    Parameters:
+        xyz (np.array): Array of shape ``(n, 3)`` of unit-sphere coordinates
+        tour (np.array): Point numbers in tour order
+        neigh (np.array): Candidate neighbour lists from ``neighbours()``
+        neigh_dist (np.array): Candidate distances from ``neighbours()``
+
+    Optional:
+        active (np.array): Point numbers to start with in the active queue.
+            Defaults to ``None`` for all points, in random order.
+        or_opt (bool): If True, also try Or-opt moves. Defaults to True.
+        time_bound (float): Time bound in seconds. Defaults to ``-1`` for
+            unbounded.
+        random_seed (int): Seed for the order of the initial active queue.
+            Defaults to 42.
+        lk_depth (int): Maximum depth of Lin-Kernighan style moves, tried
+            when no 2-opt or Or-opt move is found. Defaults to 0 for none.
+
+    Returns:
+        np.array of point numbers in the improved tour order
+    '''
+    n = len(tour)
+    tour = np.array(tour, dtype=np.int64)
+    if n < 5:
+        return tour
+
+    pos = np.empty(n, dtype=np.int64)
+    pos[tour] = np.arange(n)
+
+    if active is None:
+        active = np.random.default_rng(random_seed).permutation(n)
+    queue = np.zeros(n, dtype=np.int64)
+    inq = np.zeros(n, dtype=np.bool_)
+    size = 0
+    for a in active:
+        size = _push(queue, inq, 0, size, a)
+
+    warm_up()
+    start_time = datetime.now()
+    head = 0
+    while size > 0:
+        head, size = _improve(tour, pos, xyz, neigh, neigh_dist, queue, inq,
+                              head, size, _STEPS_PER_CHECK, or_opt,
+                              lk_depth)
+        if time_bound >= 0 and \
+                (datetime.now() - start_time).total_seconds() > time_bound:
+            break
+
+    return tour
+
+
+def polish(lat, lon, tour, time_bound=-1, k=10, lk_depth=_LK_MAX_DEPTH,
+           random_seed=42):
+    '''
+    Improves a given tour, e.g. one found by Concorde within its time bound,
+    with Or-opt and Lin-Kernighan style moves over the candidate lists
+
+    Parameters:
+        lat (np.array): Latitudes in degrees
+        lon (np.array): Longitudes in degrees
+        tour (np.array): Point numbers in tour order
+
+    Optional:
+        time_bound (float): Time bound in seconds. Defaults to ``-1`` for
+            unbounded.
+        k (int): Number of nearest neighbour candidates per point. Defaults
+            to 10.
+        lk_depth (int): Maximum depth of Lin-Kernighan style moves. Defaults
+            to 6.
+        random_seed (int): Seed for the order nodes are examined in. Defaults
+            to 42.
+
+    Returns:
+        tour (np.array): Point numbers in the improved tour order
+        stats (dict): ``length_before`` and ``length_after`` in kilometres,
+            ``removed`` kilometres, ``seconds`` taken and
+            ``compile_seconds`` spent compiling the kernels beforehand
+    '''
+    compile_seconds = warm_up()
+    start_time = datetime.now()
+    xyz = to_xyz(lat, lon)
+    tour = np.asarray(tour, dtype=np.int64)
+    length_before = tour_length(xyz, tour)
+
+    if len(tour) >= 5:
+        neigh, neigh_dist = neighbours(xyz, k)
+        tour = local_search(xyz, tour, neigh, neigh_dist,
+                            time_bound=time_bound, random_seed=random_seed,
+                            lk_depth=lk_depth)
+
+    length_after = tour_length(xyz, tour)
+    return tour, {'length_before': length_before,
+                  'length_after': length_after,
+                  'removed': length_before - length_after,
+                  'seconds': (datetime.now() - start_time).total_seconds(),
+                  'compile_seconds': compile_seconds}
+
+
+def solve(lat, lon, random_seed=42, time_bound=-1, init='greedy', k=10,
+          or_opt=True, perturb=0.0):
+    '''
+    Finds a short closed tour over the given points
+
+    Parameters:
+        lat (np.array): Latitudes in degrees
+        lon (np.array): Longitudes in degrees
+
+    Optional:
+        random_seed (int): Seed for the local search. Defaults to 42.
+        time_bound (float): Time bound in seconds for the local search.
+            Defaults to ``-1`` for unbounded.
+        init (str): Initial tour method, either ``'greedy'`` for greedy edge
+            or ``'sfc'`` for a Hilbert space-filling curve. Defaults to
+            ``'greedy'``.
+        k (int): Number of nearest neighbour candidates per point. Defaults
+            to 10.
+        or_opt (bool): If True, use Or-opt as well as 2-opt moves. Defaults
+            to True.
+        perturb (float): Relative random noise added to the candidate edge
+            lengths seen by the greedy edge method, so that different seeds
+            start from different tours. Defaults to 0 for none.
+
+    Returns:
+        np.array of point numbers in tour order
+    '''
+    n = len(lat)
+    if n < 4:
+        return np.arange(n)
+
+    xyz = to_xyz(lat, lon)
+    neigh, neigh_dist = neighbours(xyz, k)
+
+    if init == 'greedy':
+        greedy_dist = neigh_dist
+        if perturb > 0:
+            rng = np.random.default_rng(random_seed)
+            greedy_dist = neigh_dist * (
+                1 + perturb * rng.random(neigh_dist.shape))
+        tour = greedy_tour(xyz, neigh, greedy_dist)
+    elif init == 'sfc':
+        tour = sfc_tour(lat, lon)
+    else:
+        raise ValueError(f'Unknown initial tour method ``{init}``')
+
+    return local_search(xyz, tour, neigh, neigh_dist, or_opt=or_opt,
+                        time_bound=time_bound, random_seed=random_seed)
+
+
+def concorde_available():
+    '''
+    Checks whether the Concorde solver can be imported
+
+    Returns:
+        bool: True if ``concorde.tsp`` is installed
+    '''
+    return importlib.util.find_spec('concorde') is not None
+
+
+def solve_concorde(lat, lon, time_bound=-1, random_seed=42):
+    '''
+    Finds a tour with the Concorde algorithim. Concorde is imported here,
+    rather than at module load, so that it is only needed when used.
+
+    Parameters:
+        lat (np.array): Latitudes in degrees
+        lon (np.array): Longitudes in degrees
+
+    Optional:
+        time_bound (int): Time bound in seconds. Defaults to ``-1`` for
+            unbounded.
+        random_seed (int): Random seed for Concorde. Defaults to 42.
+
+    Returns:
+        tour (np.array): Point numbers in tour order
+        success (bool): Whether Concorde reported success
+    '''
+    from concorde.tsp import TSPSolver
+
+    # Instantiate solver
+    tsp = TSPSolver.from_data(lat, lon, norm="GEO")
+    tour_data = tsp.solve(time_bound=time_bound, verbose=False,
+                          random_seed=random_seed)
+    return np.asarray(tour_data.tour), tour_data.success
+
+
+def resolve_engine(engine):
+    '''
+    Checks the given engine name, resolving ``'auto'`` to Concorde if it is
+    installed and to the built-in solver if not
+
+    Parameters:
+        engine (str): One of ``ENGINES``
+
+    Returns:
+        str: Either ``'concorde'`` or ``'builtin'``
+
+    Raises:
+        ValueError: If ``engine`` is not one of ``ENGINES``
+    '''
+    if engine not in ENGINES:
+        raise ValueError(f'Unknown engine ``{engine}``; expected one of '
+                         + f'{ENGINES}')
+
+    if engine == 'auto':
+        engine = 'concorde' if concorde_available() else 'builtin'
+    return engine
+
+
+def run_engine(engine, lat, lon, time_bound=-1, random_seed=42, perturb=0.0):
+    '''
+    Finds a tour with the given engine
+
+    Parameters:
+        engine (str): One of ``ENGINES``
+        lat (np.array): Latitudes in degrees
+        lon (np.array): Longitudes in degrees
+
+    Optional:
+        time_bound (int): Time bound in seconds. Defaults to ``-1`` for
+            unbounded.
+        random_seed (int): Random seed for the engine. Defaults to 42.
+        perturb (float): Greedy edge noise for the built-in engine; see
+            ``solve()``. Defaults to 0.
+
+    Returns:
+        tour (np.array): Point numbers in tour order
+        success (bool): Whether the engine reported success
+    '''
+    if resolve_engine(engine) == 'concorde':
+        return solve_concorde(lat, lon, time_bound, random_seed)
+
+    return solve(lat, lon, random_seed=random_seed, time_bound=time_bound,
+                 perturb=perturb), True
@@ -0,0 +1,344 @@
+# -*- coding: utf-8 -*-
+"""Spatial Index
+
+This module contains a spatial index for latitude and longitude points on the
+earth. Points are converted to 3D unit-sphere (ECEF) coordinates and held in a
+KD-tree, where the straight line (chord) distance between two points is
+monotonic in their great circle distance. Nearest neighbour and radius queries
+then cost O(log n) instead of a full haversine scan.
+
+This file contains the following classes and functions:
+
+    * _SphereIndex - KD-tree backed index that supports incremental adds and
+        removals
+    * to_xyz - converts latitude and longitude in degrees to unit-sphere
+        coordinates
+    * chord_to_km - converts unit-sphere chord lengths to great circle
+        kilometres
+    * km_to_chord - converts great circle kilometres to unit-sphere chord
+        lengths
+    * kmeans - clusters unit-sphere points with k-means
+
+"""
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+_EARTH_RADIUS = 6371  # Earth's average radius in kilometres
+
+# Rebuild the tree once this fraction of its points are removed
+_REBUILD_FRACTION = 0.25
+
+# Rebuild the tree once more points than this, or than the square root of
+# the tree size, are pending; scanning the pending points by brute force then
+# costs about as much per query as the rebuild does per added point
+_MIN_PENDING = 64
+
+
+def to_xyz(lat, lon):
+    '''
+    Converts latitude and longitude to 3D unit-sphere coordinates
+
+    Parameters:
+        lat (np.array): Latitudes in degrees
+        lon (np.array): Longitudes in degrees
+
+    Returns:
+        np.array: Array of shape ``(n, 3)`` of unit-sphere coordinates
+    '''
+    lat = np.radians(np.asarray(lat, dtype=np.float64))
+    lon = np.radians(np.asarray(lon, dtype=np.float64))
+    cos_lat = np.cos(lat)
+    return np.column_stack((cos_lat * np.cos(lon),
+                            cos_lat * np.sin(lon),
+                            np.sin(lat)))
+
+
+def chord_to_km(chord, earth_radius=_EARTH_RADIUS):
+    '''
+    Converts unit-sphere chord lengths to great circle distances
+
+    Parameters:
+        chord (np.array): Chord lengths on the unit sphere
+
+    Optional:
+        earth_radius (float): Earth radius in kilometres. Defaults to 6371.
+
+    Returns:
+        np.array: Great circle distances in kilometres
+    '''
+    half = np.clip(np.asarray(chord, dtype=np.float64) / 2, 0, 1)
+    return 2 * earth_radius * np.arcsin(half)
+
+
+def km_to_chord(km, earth_radius=_EARTH_RADIUS):
+    '''
+    Converts great circle distances to unit-sphere chord lengths
+
+    Parameters:
+        km (np.array): Great circle distances in kilometres
+
+    Optional:
+        earth_radius (float): Earth radius in kilometres. Defaults to 6371.
+
+    Returns:
+        np.array: Chord lengths on the unit sphere
+    '''
+    angle = np.minimum(np.asarray(km, dtype=np.float64) / earth_radius, np.pi)
+    return 2 * np.sin(angle / 2)
+
+
+class _SphereIndex():
+    '''
+    Holds a KD-tree over unit-sphere coordinates, keyed by integer ids
+
+    Points added after the tree was built are held in a small pending buffer
+    that is scanned by brute force, and removed points are masked out. The
+    tree is rebuilt once the pending buffer outgrows the square root of the
+    tree size or the removed points make up a large enough share of it, so
+    that queries stay fast and edits do not each cost a rebuild.
+
+    Usage::
+        idx = _SphereIndex(ids, lat, lon)
+        dist_km, ids = idx.nearest(40.7, -74.0, k=10)
+    '''
+
+    def __init__(self, ids, lat, lon):
+        '''
+        Args:
+            ids (np.array): Integer id for each point
+            lat (np.array): Latitudes in degrees
+            lon (np.array): Longitudes in degrees
+        '''
+        self._build(np.asarray(ids, dtype=np.intp), to_xyz(lat, lon))
+
+    def _build(self, ids, xyz):
+        '''
+        (Re)builds the KD-tree from the given points, dropping any point with
+        missing coordinates
+
+        Parameters:
+            ids (np.array): Integer id for each point
+            xyz (np.array): Array of shape ``(n, 3)`` of unit-sphere
+                coordinates
+        '''
+        finite = np.isfinite(xyz).all(axis=1) & (ids >= 0)
+        self._ids = ids[finite]
+        self._xyz = xyz[finite]
+        self._tree = cKDTree(self._xyz)
+        self._alive = np.ones(len(self._ids), dtype=bool)
+        self._n_dead = 0
+        self._pend_ids = np.empty(0, dtype=np.intp)
+        self._pend_xyz = np.empty((0, 3), dtype=np.float64)
+
+    def __len__(self):
+        return len(self._ids) - self._n_dead + len(self._pend_ids)
+
+    def _maybe_rebuild(self):
+        '''Rebuilds the tree once too many points are pending or removed'''
+        max_pending = max(_MIN_PENDING, np.sqrt(len(self._ids)))
+        if len(self._pend_ids) > max_pending \
+                or self._n_dead > _REBUILD_FRACTION * max(len(self._ids), 1):
+            self._build(
+                np.concatenate((self._ids[self._alive], self._pend_ids)),
+                np.concatenate((self._xyz[self._alive], self._pend_xyz)))
+
+    def add(self, ids, lat, lon):
+        '''
+        Adds points to the index
+
+        Parameters:
+            ids (np.array): Integer id for each point
+            lat (np.array): Latitudes in degrees
+            lon (np.array): Longitudes in degrees
+        '''
+        xyz = to_xyz(lat, lon)
+        finite = np.isfinite(xyz).all(axis=1)
+        self._pend_ids = np.concatenate(
+            (self._pend_ids, np.asarray(ids, dtype=np.intp)[finite]))
+        self._pend_xyz = np.concatenate((self._pend_xyz, xyz[finite]))
+        self._maybe_rebuild()
+
+    def remap(self, remap):
+        '''
+        Renumbers the ids held in the index, removing any point that is mapped
+        to ``-1``
+
+        Parameters:
+            remap (np.array): Integer array mapping each old id to its new id,
+                or ``-1`` if the point has been removed
+        '''
+        self._ids = remap[self._ids]
+        self._alive &= self._ids >= 0
+        self._n_dead = np.count_nonzero(~self._alive)
+
+        self._pend_ids = remap[self._pend_ids]
+        keep = self._pend_ids >= 0
+        self._pend_ids = self._pend_ids[keep]
+        self._pend_xyz = self._pend_xyz[keep]
+        self._maybe_rebuild()
+
+    def nearest(self, lat, lon, k=1):
+        '''
+        Finds the ``k`` nearest points to each of the query points
+
+        Parameters:
+            lat (float or np.array): Query latitudes in degrees
+            lon (float or np.array): Query longitudes in degrees
+
+        Optional:
+            k (int): Number of neighbours to find. Defaults to 1.
+
+        Returns:
+            dist (np.array): Array of shape ``(m, k)`` of great circle
+                distances in kilometres, sorted nearest first
+            ids (np.array): Array of shape ``(m, k)`` of point ids. Where
+                there are fewer than ``k`` points, the id is ``-1`` and the
+                distance is ``inf``
+        '''
+        xyz = to_xyz(np.atleast_1d(lat), np.atleast_1d(lon))
+        chord, ids = self._tree_nearest(xyz, k)
+
+        if len(self._pend_ids):
+            pend_chord = np.linalg.norm(
+                xyz[:, None, :] - self._pend_xyz[None, :, :], axis=2)
+            chord = np.concatenate((chord, pend_chord), axis=1)
+            ids = np.concatenate(
+                (ids, np.broadcast_to(self._pend_ids, pend_chord.shape)),
+                axis=1)
+
+        if chord.shape[1] < k:
+            pad = k - chord.shape[1]
+            chord = np.pad(chord, ((0, 0), (0, pad)), constant_values=np.inf)
+            ids = np.pad(ids, ((0, 0), (0, pad)), constant_values=-1)
+
+        order = np.argsort(chord, axis=1, kind='stable')[:, :k]
+        chord = np.take_along_axis(chord, order, axis=1)
+        ids = np.take_along_axis(ids, order, axis=1)
+        missing = ~np.isfinite(chord)
+        ids[missing] = -1
+        dist = chord_to_km(chord)
+        dist[missing] = np.inf
+        return dist, ids
+
+    def _tree_nearest(self, xyz, k):
+        '''
+        Finds the ``k`` nearest points in the tree that have not been
+        removed. Rows that find removed points are asked again for twice as
+        many neighbours, until they have ``k`` or the whole tree.
+
+        Parameters:
+            xyz (np.array): Array of shape ``(m, 3)`` of query points
+            k (int): Number of neighbours to find
+
+        Returns:
+            chord (np.array): Array of shape ``(m, k)`` of chord lengths,
+                ``inf`` where there are fewer than ``k`` points
+            ids (np.array): Array of shape ``(m, k)`` of point ids, ``-1``
+                where there are fewer than ``k`` points
+        '''
+        m = len(xyz)
+        chord = np.full((m, k), np.inf)
+        ids = np.full((m, k), -1, dtype=np.intp)
+        todo = np.arange(m)
+        kk = min(k, len(self._ids))
+        while len(todo) and kk > 0:
+            q_chord, idx = self._tree.query(xyz[todo], k=kk)
+            q_chord = q_chord.reshape(len(todo), kk)
+            idx = idx.reshape(len(todo), kk)
+            alive = self._alive[idx]
+            q_chord[~alive] = np.inf
+
+            # Removed points sort last, so the first k are the nearest alive
+            order = np.argsort(q_chord, axis=1, kind='stable')[:, :k]
+            got = np.take_along_axis(q_chord, order, axis=1)
+            got_ids = np.where(np.isfinite(got),
+                               self._ids[np.take_along_axis(idx, order,
+                                                            axis=1)], -1)
+            chord[todo, :got.shape[1]] = got
+            ids[todo, :got.shape[1]] = got_ids
+
+            if kk == len(self._ids):
+                break
+            todo = todo[np.count_nonzero(alive, axis=1) < k]
+            kk = min(2 * kk, len(self._ids))
+
+        return chord, ids
+
+    def within(self, lat, lon, km):
+        '''
+        Finds all points within a great circle radius of each query point
+
+        Parameters:
+            lat (float or np.array): Query latitudes in degrees
+            lon (float or np.array): Query longitudes in degrees
+            km (float): Radius in kilometres
+
+        Returns:
+            dist (list of np.array): For each query point, the great circle
+                distances in kilometres to the points found, sorted nearest
+                first
+            ids (list of np.array): For each query point, the ids of the
+                points found
+        '''
+        xyz = to_xyz(np.atleast_1d(lat), np.atleast_1d(lon))
+        radius = km_to_chord(km)
+        found = self._tree.query_ball_point(xyz, radius) \
+            if len(self._ids) else [[] for _ in range(len(xyz))]
+
+        dists = []
+        ids = []
+        for q, idx in zip(xyz, found):
+            idx = np.asarray(idx, dtype=np.intp)
+            idx = idx[self._alive[idx]]
+            q_ids = np.concatenate((self._ids[idx], self._pend_ids))
+            q_chord = np.linalg.norm(
+                np.concatenate((self._xyz[idx], self._pend_xyz)) - q, axis=1)
+
+            keep = q_chord <= radius
+            order = np.argsort(q_chord[keep], kind='stable')
+            dists.append(chord_to_km(q_chord[keep][order]))
+            ids.append(q_ids[keep][order])
+
+        return dists, ids
+
+
+def kmeans(xyz, k, random_seed=42, max_iter=20):
+    '''
+    Clusters unit-sphere points with Lloyd's k-means, using a KD-tree over
+    the centres for each assignment step
+
+    Parameters:
+        xyz (np.array): Array of shape ``(n, 3)`` of unit-sphere coordinates
+        k (int): Number of clusters
+
+    Optional:
+        random_seed (int): Seed for picking the initial centres. Defaults to
+            42.
+        max_iter (int): Maximum number of iterations. Defaults to 20.
+
+    Returns:
+        np.array of integer cluster labels in ``[0, k)`` for each point
+    '''
+    n = len(xyz)
+    k = max(1, min(k, n))
+    rng = np.random.default_rng(random_seed)
+    centres = xyz[rng.choice(n, size=k, replace=False)]
+    labels = np.full(n, -1, dtype=np.intp)
+
+    for _ in range(max_iter):
+        new_labels = cKDTree(centres).query(xyz)[1]
+        if np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+
+        # Move each centre to the mean of its points; keep empty ones put
+        sums = np.zeros((k, 3))
+        np.add.at(sums, labels, xyz)
+        counts = np.bincount(labels, minlength=k)
+        filled = counts > 0
+        centres[filled] = sums[filled] / counts[filled, None]
+        centres /= np.linalg.norm(centres, axis=1)[:, None]
+
+    # Renumber so that the labels are contiguous
+    return np.unique(labels, return_inverse=True)[1]
@@ -1,15 +1,20 @@
 from __future__ import absolute_import
 
 import googlemaps
-import math
+import json
 import numpy as np
 import os.path
 import pandas as pd
+import lib.directions as directions
+import lib.parallel as parallel
+import lib.solver as solver
 import lib.utils as utils
-from concorde.tsp import TSPSolver
 from datetime import datetime
+from lib.distmatrix import DistMatrix
+from lib.pointstore import _GROWTH_FACTOR, _MIN_CAPACITY, _PointStore
+from lib.spatial import _SphereIndex, chord_to_km, to_xyz
 from lib.writer import _Writer
-from os import mkdir
+from os import makedirs, mkdir
 
 _PCOL_NAMES_ = ['gid_county', 'name_county', 'lat_county',
                 'lon_county',
@@ -17,6 +22,59 @@ _PCOL_NAMES_ = ['gid_county', 'name_county', 'lat_county',
                 'gid_seat', 'name_seat', 'lat_seat', 'lon_seat',
                 'name_visit', 'lat_visit', 'lon_visit']
 
+# Storage dtype for each column; nullable integer columns are stored as
+# float64 so that they can hold ``NaN``
+_PCOL_DTYPES_ = {'gid_county': np.int64, 'name_county': object,
+                 'lat_county': np.float64, 'lon_county': np.float64,
+                 'state': object, 'cat_code': object, 'fips_code': np.float64,
+                 'gid_seat': np.float64, 'name_seat': object,
+                 'lat_seat': np.float64, 'lon_seat': np.float64,
+                 'name_visit': object, 'lat_visit': np.float64,
+                 'lon_visit': np.float64}
+
+# pandas dtype used for nullable integer columns in the DataFrame view
+_PCOL_VIEW_DTYPES_ = {'fips_code': 'Int64', 'gid_seat': 'Int64'}
+
+# Number of nearest tour points whose edges are tried for cheapest insertion
+_INSERT_CANDIDATES = 8
+
+# Number of candidate neighbours of each point for the local repair
+_REPAIR_CANDIDATES = 10
+
+# Most duplicate ``gid_county`` values listed when adding points is refused
+_MAX_LISTED_GIDS = 10
+
+# Rules for choosing each visit point, see ``TourRoute.update_visit_points()``
+_VISIT_RULES = ['seat', 'county', 'nearest_place']
+
+# Number of rows read at a time by ``TourRoute.read_csv()``
+_CSV_CHUNK_ROWS = 100000
+
+# Formats for ``TourRoute.save()``; ``feather`` and ``parquet`` need pyarrow
+_SAVE_FORMATS = ['npy', 'feather', 'parquet']
+
+# Name of the metadata file written by ``TourRoute.save()``
+_SAVE_META = 'meta.json'
+
+# Output formats for ``TourRoute.write_js()``
+_JS_FORMATS = ['objects', 'polyline', 'float32']
+
+# Point attributes written to the ``write_js()`` lookup tables, as the
+# JavaScript name and the TourRoute column
+_JS_TABLES = {'name': 'name_county', 'state': 'state', 'seat': 'name_seat'}
+
+# Most waypoints the Google Directions API accepts in one request
+_MAX_WAYPOINTS = 25
+
+# Share of each planned slice's legs that ``TourRoute.plan_slices()`` may give
+# up to end the slice on an anchor point, and the expected number of anchor
+# points in that share
+_PLAN_SLACK = 0.5
+_PLAN_ANCHORS = 2
+
+# Time bound in seconds for the local repair after an incremental edit
+_REPAIR_TIME_BOUND = 1
+
 
 class bcolours:  # Class for terminal output colours
     OKGREEN = '\033[92m'
@@ -38,6 +96,8 @@ class TourRoute():
         * add_points: Add points on the TourRoute
         * read_csv: Read in a TourRoute from a csv file
         * write_csv: Writes TourRoute to a csv file
+        * save: Saves TourRoute, its order and metadata in a binary format
+        * load: Loads a TourRoute saved by ``save``
         * get_points: Get points from the TourRoute
         * del_points: Delete points from the TourRoute
         * update_points: Update points on the TourRoute
@@ -47,10 +107,30 @@ class TourRoute():
         * get_cols: Gets column(s) from the TourRoute
         * get_uniques: Gets unique values for each column(s) from the TourRoute
         * slices: Slice a TourRoute into x slices of length y
+        * iter_slices: Lazily yield slices of a TourRoute
+        * plan_slices: Slice a TourRoute into the fewest Directions requests,
+            with boundaries that stay put under local edits
         * write_js: Writes TourRoute to a js file for use with Google Maps API
             use
         * flyingcrow_dist: Get the total TourRoute straight line distance
             between each point
+        * leg_dists: Get the straight line distance of each TourRoute leg
+        * delta_2opt: Get the tour length change of a 2-opt move
+        * delta_swap: Get the tour length change of swapping two points
+        * delta_relocate: Get the tour length change of moving a point
+        * dist_matrix: Get the straight line distance matrix between every
+            pair of points
+        * find_tour: Find the optimal, or a near optimal, tour
+        * find_tour_decomposed: Find a tour for a very large TourRoute by
+            solving clusters of points and stitching them together
+        * rotate: Rotates the TourRoute to start at a given point
+        * reorder: Reorders the TourRoute by integer locations
+        * reverse: Reverses the direction of the TourRoute
+        * nearest: Get the k nearest points to a location
+        * within_radius: Get the points within a radius of a location
+        * nearest_bulk: Get the k nearest points to each of many locations
+        * within_radius_bulk: Get the points within a radius of each of many
+            locations
 
 
     Class private methods:
@@ -61,19 +141,239 @@ class TourRoute():
         '''
 
         '''
-        self._points = pd.DataFrame(columns=_PCOL_NAMES_)
+        self._store = _PointStore(_PCOL_DTYPES_, _PCOL_VIEW_DTYPES_)
+
+        # The tour order is held as a permutation of the point store rows,
+        # starting at ``self._order[self._offset]`` and wrapping around
+        self._order = np.empty(0, dtype=np.intp)
+        self._offset = 0
+
+        # Spare capacity behind ``self._order`` and ``self._legs``, so that
+        # points added to the end of the tour are appended in place
+        self._order_buf = None
+        self._legs_buf = None
+        self._rows_cache = None
+        self._pos_cache = None
+        self._frame_cache = None
+        self._coords_cache = None
+
+        # Leg distances in kilometres, where ``self._legs[q]`` is the leg from
+        # ``self._order[q]`` to the next point in the order; built lazily and
+        # patched in place by edits that only change a few legs
+        self._legs = None
+
+        # Hash index of gid_county to point store row; built lazily and kept
+        # up to date on appends and dropped on deletes, which renumber rows
+        self._gid_index = None
+
+        # Spatial index over the visit points; built lazily on first query
+        self._sindex = None
+
+        # Candidate neighbour lists of every point store row for the local
+        # repair, built on the first repair; rows in ``self._neigh_stale``
+        # and rows added since are recomputed before the next one
+        self._neigh = None
+        self._neigh_stale = None
+
+        # Metadata about how the tour order was found e.g. solver and seed
+        self._meta = {}
 
     def __len__(self):
         '''
 
         '''
-        return len(self._points)
+        return len(self._store)
+
+    @property
+    def meta(self):
+        '''Metadata about how the tour order was found e.g. the ``engine``,
+        ``random_seed`` and ``length`` from the last ``find_tour()``'''
+        return self._meta
+
+    def _set_order(self, order, offset=0, legs=None):
+        '''
+        Sets the tour order and drops anything cached against the old order
+
+        Parameters:
+            order (np.array): Permutation of the point store row numbers
+            offset (int): Position in ``order`` of the first tour point
+            legs (np.array): Leg distances for the new order, if known.
+                Defaults to ``None`` to recompute them when next needed.
+        '''
+        self._order = order
+        self._offset = offset % len(order) if len(order) else 0
+        self._rows_cache = None
+        self._pos_cache = None
+        self._frame_cache = None
+        self._coords_cache = None
+        self._legs = legs
+
+        # Drop spare capacity no longer behind the order or legs
+        if order.base is not self._order_buf:
+            self._order_buf = None
+        if legs is None or legs.base is not self._legs_buf:
+            self._legs_buf = None
+
+    def _append_order(self, new_rows):
+        '''
+        Adds point store rows to the end of the tour i.e. just before its
+        start. The order and legs are appended in place where there is spare
+        capacity, so adding many small batches is amortized O(1) per point.
+
+        Parameters:
+            new_rows (np.array): Point store rows that are not yet on the tour
+        '''
+        if self._offset:
+            # Move the start to the front once, so later points append
+            legs = None if self._legs is None \
+                else np.roll(self._legs, -self._offset)
+            self._set_order(self._rows(), 0, legs)
+
+        n = len(self._order)
+        size = n + len(new_rows)
+        order_buf = _grown(self._order_buf, self._order, size)
+        order_buf[n:size] = new_rows
+        order = order_buf[:size]
+
+        legs_buf = None
+        legs = None
+        if self._legs is not None:
+            legs_buf = _grown(self._legs_buf, self._legs, size)
+            legs = legs_buf[:size]
+
+        self._order_buf = order_buf
+        self._legs_buf = legs_buf
+        self._set_order(order, 0, self._patched_legs(
+            order, legs, np.arange(n - 1, size)))
+
+    def _coords(self):
+        '''
+        Gets the visit points in tour order as one contiguous array. The
+        array is cached until the points or the tour order change.
+
+        Returns:
+            np.array of shape ``(n, 2)`` of float64 ``lat_visit`` and
+            ``lon_visit``
+        '''
+        if self._coords_cache is None \
+                or self._coords_cache[0] != self._store.version:
+            rows = self._rows()
+            coords = np.empty((len(rows), 2), dtype=np.float64)
+            coords[:, 0] = self._store.column('lat_visit')[rows]
+            coords[:, 1] = self._store.column('lon_visit')[rows]
+            coords.flags.writeable = False
+            self._coords_cache = (self._store.version, coords)
+        return self._coords_cache[1]
+
+    def _km(self, a, b):
+        '''
+        Gets the great circle distances between the visit points of two sets
+        of point store rows
+
+        Parameters:
+            a (np.array): Integer point store row numbers
+            b (np.array): Integer point store row numbers
+
+        Returns:
+            np.array of distances in kilometres
+        '''
+        lat = self._store.column('lat_visit')
+        lon = self._store.column('lon_visit')
+        a = np.atleast_1d(a)
+        b = np.atleast_1d(b)
+        return chord_to_km(np.linalg.norm(
+            to_xyz(lat[a], lon[a]) - to_xyz(lat[b], lon[b]), axis=1))
+
+    def _order_legs(self):
+        '''
+        Gets the leg distances in ``self._order`` order, computing them if
+        they are not cached
+
+        Returns:
+            np.array of distances in kilometres
+        '''
+        if self._legs is None:
+            self._legs = self._km(self._order, np.roll(self._order, -1))
+        return self._legs
+
+    def _patched_legs(self, order, legs, qs):
+        '''
+        Recomputes only the given legs of a new tour order
+
+        Parameters:
+            order (np.array): New tour order
+            legs (np.array): Leg distances for ``order``, correct except at
+                ``qs``, or ``None`` if the legs are not cached
+            qs (np.array): Positions in ``order`` of the legs to recompute
+
+        Returns:
+            np.array of leg distances, or ``None`` if ``legs`` is ``None``
+        '''
+        if legs is None or len(order) == 0:
+            return None
+
+        qs = np.unique(np.asarray(qs, dtype=np.intp) % len(order))
+        legs[qs] = self._km(order[qs], order[(qs + 1) % len(order)])
+        return legs
+
+    def _rows(self):
+        '''
+        Gets the point store row numbers in tour order
+
+        Returns:
+            np.array of integer row numbers, where the i-th entry is the row
+            of the i-th point on the tour
+        '''
+        if self._rows_cache is None:
+            self._rows_cache = np.concatenate(
+                (self._order[self._offset:], self._order[:self._offset]))
+        return self._rows_cache
+
+    def _positions(self, rows):
+        '''
+        Gets the tour positions of the given point store rows through an
+        inverse permutation lookup
+
+        Parameters:
+            rows (np.array): Integer point store row numbers
+
+        Returns:
+            np.array of integer tour positions
+        '''
+        if self._pos_cache is None:
+            self._pos_cache = np.empty(len(self._order), dtype=np.intp)
+            self._pos_cache[self._order] = np.arange(len(self._order))
+
+        return (self._pos_cache[rows] - self._offset) % len(self)
+
+    def _view(self, rows=None):
+        '''
+        Gets a DataFrame view of the TourRoute points in tour order. The full
+        view is built lazily from the point store and is cached until the
+        points or the tour order change.
+
+        Optional:
+            rows (np.array): Integer point store row numbers to include in the
+                view. Defaults to ``None`` for all rows in tour order.
+
+        Returns:
+            pd.DataFrame of the TourRoute points
+        '''
+        if rows is not None:
+            return self._store.frame(rows)
+
+        if self._frame_cache is None \
+                or self._frame_cache[0] != self._store.version:
+            self._frame_cache = (self._store.version,
+                                 self._store.frame(self._rows()))
+        return self._frame_cache[1]
 
     def add_points(self,
                    gid_county, name_county, lat_county, lon_county,
                    state, cat_code, fips_code,
                    gid_seat=None, name_seat=None, lat_seat=None, lon_seat=None,
-                   name_visit=None, lat_visit=None, lon_visit=None):
+                   name_visit=None, lat_visit=None, lon_visit=None,
+                   insert='end', repair=False):
         '''
         Add points to a TourRoute
 
@@ -102,22 +402,42 @@ class TourRoute():
                 ``None``.
             lon_visit (float): Longitude of the visited point. Defaults to
                 ``None``.
+            insert (str): Where to put the new points on the tour. Either
+                ``'end'`` to add them to the end of the tour, or
+                ``'cheapest'`` to insert each one where it adds the least
+                distance, trying the edges around its nearest tour points.
+                ``'cheapest'`` needs the visit points to be set. Defaults to
+                ``'end'``.
+            repair (bool): If True, run a time bounded local search starting
+                from the new points and their tour neighbours. Defaults to
+                False.
 
         Raises:
             Exception: AssertionError if any of the not None arguments are of
                 different length to ``gid_county``
+            ValueError: If ``insert`` is not ``'end'`` or ``'cheapest'``, or
+                a ``gid_county`` is repeated or already in the TourRoute
         '''
-
-        new_points = pd.DataFrame()
+        if insert not in ('end', 'cheapest'):
+            raise ValueError(f'Unknown insert method ``{insert}``')
+
+        # Each gid_county must map to one row for the hash index
+        gids = np.atleast_1d(np.asarray(gid_county))
+        uniq, counts = np.unique(gids, return_counts=True)
+        dups = uniq[counts > 1].tolist() \
+            + gids[self._gid_lookup(gids)[1]].tolist()
+        if dups:
+            raise ValueError(f'Duplicate ``{_PCOL_NAMES_[0]}`` value(s) '
+                             + f'``{sorted(set(dups))[:_MAX_LISTED_GIDS]}``')
+
+        new_points = {}
         args = [gid_county, name_county, lat_county, lon_county,
                 state, cat_code, fips_code,
                 gid_seat, name_seat, lat_seat, lon_seat,
                 name_visit, lat_visit, lon_visit]
 
         for i, arg in enumerate(args):
-            if arg is None:
-                new_points[_PCOL_NAMES_[i]] = np.nan * len(new_points)
-            else:
+            if arg is not None:
                 # Check that the new data columns are of equal length
                 if i == 0:
                     length_check = len(arg)
@@ -126,9 +446,249 @@ class TourRoute():
                     + f'different length to ``{_PCOL_NAMES_[0]}``'
 
                 assert (len(arg) == length_check), error_msg
-                new_points[_PCOL_NAMES_[i]] = arg
+            new_points[_PCOL_NAMES_[i]] = arg
+
+        tour_len = len(self)
+        new_rows = self._store.append(new_points)
+
+        if self._gid_index is not None:
+            self._gid_index.update(zip(
+                self._store.column(_PCOL_NAMES_[0])[new_rows].tolist(),
+                new_rows.tolist()))
+
+        # Cheapest insertion adds each point to the spatial index once it is
+        # on the tour
+        cheapest = insert == 'cheapest' and tour_len > 0
+        if self._sindex is not None and not cheapest:
+            self._sindex.add(new_rows,
+                             self._store.column('lat_visit')[new_rows],
+                             self._store.column('lon_visit')[new_rows])
+
+        if cheapest:
+            self._insert_cheapest(new_rows)
+        else:
+            self._append_order(new_rows)
+
+        if repair:
+            self._repair(new_rows)
+
+    def _insert_cheapest(self, new_rows):
+        '''
+        Inserts new point store rows into the tour one at a time, each on the
+        edge that adds the least distance. Only the edges either side of the
+        nearest points already on the tour are tried. While inserting, the
+        tour is held as links to the next and previous points and each new
+        point joins the spatial index once it is on the tour, so each insert
+        costs O(log n) and the tour order is rebuilt once at the end.
+
+        Parameters:
+            new_rows (np.array): Point store rows that are not yet on the tour
+        '''
+        xyz = self._xyz()
+        lat = self._store.column('lat_visit')
+        lon = self._store.column('lon_visit')
+
+        is_new = np.zeros(len(self._store), dtype=bool)
+        is_new[new_rows] = True
+        if self._sindex is None:
+            self._sindex = _SphereIndex(
+                np.where(is_new, -1, np.arange(len(self._store))), lat, lon)
+
+        rows = self._rows()
+        nxt = np.full(len(self._store), -1, dtype=np.intp)
+        prv = np.full(len(self._store), -1, dtype=np.intp)
+        nxt[rows] = np.roll(rows, -1)
+        prv[rows] = np.roll(rows, 1)
+
+        # Leg distances by the point store row they leave from
+        legs = None
+        if self._legs is not None:
+            legs = np.zeros(len(self._store))
+            legs[self._order] = self._legs
+
+        def dist(a, b):
+            return chord_to_km(np.linalg.norm(xyz[a] - xyz[b], axis=-1))
+
+        heads = []
+        for row in new_rows:
+            _, cand = self._sindex.nearest(lat[row], lon[row],
+                                           _INSERT_CANDIDATES)
+            cand = cand[0][cand[0] >= 0]
+            if len(cand) == 0:
+                cand = rows[:1]
+
+            # Try the edges on both sides of each candidate
+            a = np.concatenate((cand, prv[cand]))
+            b = nxt[a]
+            cost = dist(a, row) + dist(row, b) - dist(a, b)
+            a, b = a[np.argmin(cost)], b[np.argmin(cost)]
+
+            nxt[a], prv[row], nxt[row], prv[b] = row, a, b, row
+            if legs is not None:
+                legs[a] = dist(a, row)
+                legs[row] = dist(row, b)
+            if not is_new[a]:
+                heads.append(a)
+            self._sindex.add([row], lat[row:row + 1], lon[row:row + 1])
+
+        # Splice the run of new points after each point that was already on
+        # the tour into the order in one pass; the first point stays first
+        at = []
+        chain = []
+        heads = np.unique(heads)
+        for head, pos in zip(heads, self._positions(heads)):
+            row = nxt[head]
+            while is_new[row]:
+                at.append(pos + 1)
+                chain.append(row)
+                row = nxt[row]
+
+        order = np.insert(rows, at, chain)
+        self._set_order(order, 0, None if legs is None else legs[order])
+
+    def _repair(self, rows):
+        '''
+        Runs a time bounded 2-opt and Or-opt local search over the tour that
+        starts from the given point store rows only. The first point of the
+        tour is kept as the first point.
+
+        Parameters:
+            rows (np.array): Point store rows touched by an edit
+        '''
+        if len(self) < 5 or len(rows) == 0:
+            return
+
+        xyz = self._xyz()
+        neigh, neigh_dist = self._candidates()
+        start = self._order[self._offset]
+        order = solver.local_search(xyz, self._order, neigh, neigh_dist,
+                                    active=np.unique(rows),
+                                    time_bound=_REPAIR_TIME_BOUND)
+        self._set_order(order.astype(np.intp),
+                        np.flatnonzero(order == start)[0])
+
+    def _candidates(self):
+        '''
+        Gets the candidate neighbour lists of every point store row for the
+        local repair. The lists are built in full once; after that only the
+        rows marked stale by edits, rows added since, and the rows whose
+        lists the added rows now enter, are recomputed.
+
+        Returns:
+            neigh (np.array): Array of shape ``(n, k)`` of neighbour point
+                store rows, nearest first
+            neigh_dist (np.array): Array of shape ``(n, k)`` of distances in
+                kilometres to each neighbour
+        '''
+        n = len(self._store)
+        k = min(_REPAIR_CANDIDATES, n - 1)
+        if self._neigh is not None and self._neigh[0].shape[1] == k:
+            neigh, neigh_dist = self._neigh
+            added = np.arange(len(neigh), n)
+            entered = self._entered_candidates(neigh_dist, added)
+            neigh = np.pad(neigh, ((0, len(added)), (0, 0)))
+            neigh_dist = np.pad(neigh_dist, ((0, len(added)), (0, 0)))
+            stale = np.unique(np.concatenate((self._neigh_stale, added,
+                                              entered)))
+            if self._patch_candidates(neigh, neigh_dist, stale):
+                self._neigh = (neigh, neigh_dist)
+                self._neigh_stale = np.empty(0, dtype=np.intp)
+                return self._neigh
+
+        self._neigh = solver.neighbours(self._xyz(), _REPAIR_CANDIDATES)
+        self._neigh_stale = np.empty(0, dtype=np.intp)
+        return self._neigh
+
+    def _entered_candidates(self, neigh_dist, added):
+        '''
+        Finds the rows whose candidate lists the added rows now enter, as
+        they are nearer than the row's farthest candidate
+
+        Parameters:
+            neigh_dist (np.array): Candidate distances of the rows before
+                the rows were added
+            added (np.array): Point store rows added since
+
+        Returns:
+            np.array of point store rows
+        '''
+        if len(added) == 0 or len(neigh_dist) == 0:
+            return np.empty(0, dtype=np.intp)
+
+        farthest = neigh_dist[:, -1]
+        dists, near = self._spatial_index().within(
+            self._store.column('lat_visit')[added],
+            self._store.column('lon_visit')[added], farthest.max())
+        dists = np.concatenate(dists)
+        near = np.concatenate(near)
+        old = near < len(farthest)
+        near, dists = near[old], dists[old]
+        return near[dists < farthest[near]]
+
+    def _patch_candidates(self, neigh, neigh_dist, rows):
+        '''
+        Recomputes the candidate neighbour lists of the given rows in place
+        with the spatial index
 
-        self._points = self._points.append(new_points)
+        Parameters:
+            neigh (np.array): Candidate neighbour lists to patch
+            neigh_dist (np.array): Candidate distances to patch
+            rows (np.array): Point store rows to recompute
+
+        Returns:
+            bool: False if a row has fewer neighbours with a location than
+            there are candidates, so the lists must be built in full
+        '''
+        if len(rows) == 0:
+            return True
+
+        k = neigh.shape[1]
+        dist, ids = self._spatial_index().nearest(
+            self._store.column('lat_visit')[rows],
+            self._store.column('lon_visit')[rows], k + 1)
+
+        # Drop each row from its own list by index, as for
+        # ``solver.neighbours()``
+        drop = ids == rows[:, None]
+        drop[:, -1] |= ~drop.any(axis=1)
+        ids = ids[~drop].reshape(len(rows), k)
+        if (ids < 0).any():
+            return False
+
+        neigh[rows] = ids
+        neigh_dist[rows] = dist[~drop].reshape(len(rows), k)
+        return True
+
+    def _remap_candidates(self, remap):
+        '''
+        Renumbers the candidate neighbour lists after rows are deleted, and
+        marks the rows whose lists held a deleted row as stale
+
+        Parameters:
+            remap (np.array): Integer array mapping each old row to its new
+                row, or ``-1`` if the row has been deleted
+        '''
+        if self._neigh is None:
+            return
+
+        neigh, neigh_dist = self._neigh
+        kept = remap[:len(neigh)] >= 0
+        neigh = remap[neigh[kept]]
+        stale = remap[self._neigh_stale]
+        self._neigh = (neigh, neigh_dist[kept])
+        self._neigh_stale = np.concatenate(
+            (stale[stale >= 0], np.flatnonzero((neigh < 0).any(axis=1))))
+
+    def _xyz(self):
+        '''
+        Gets the visit points of every point store row as unit-sphere
+        coordinates
+
+        Returns:
+            np.array of shape ``(n, 3)``
+        '''
+        return to_xyz(self._store.column('lat_visit'),
+                      self._store.column('lon_visit'))
 
     def read_csv(self, path,
                  col_map={'gid_county': 'gid_county',
@@ -137,50 +697,63 @@ class TourRoute():
                           'lon_county': 'lon_county',
                           'state': 'state',
                           'cat_code': 'cat_code',
-                          'fips_code': 'fips_code'}):
+                          'fips_code': 'fips_code'},
+                 states=None, bbox=None, where=None,
+                 chunksize=_CSV_CHUNK_ROWS):
         '''
+        Reads points from a csv file in a single pass, a chunk of rows at a
+        time, with each column parsed straight to its storage dtype. Rows can
+        be filtered out as they are read, so peak memory is bounded by the
+        chunk size and the points kept.
+
         Args:
             path (str): File path and name pointing to input data file
             col_map (dict): Mapping of ``add_points()`` argument names (the
                 keys) to csv column names (the values). Defaults to minimum
                 required columns for ``add_points()``.
+            states ([str]): Only keep points in these states. Defaults to
+                ``None`` for all states.
+            bbox (tuple): Only keep points within ``(lat_min, lon_min,
+                lat_max, lon_max)``, using the visit point if it is read,
+                else the county point. Defaults to ``None``.
+            where (callable): Only keep rows for which ``where(chunk)``
+                returns True, where ``chunk`` is a DataFrame with the
+                TourRoute column names. Defaults to ``None``.
+            chunksize (int): Number of rows read at a time. Defaults to
+                ``_CSV_CHUNK_ROWS``.
 
         Notes:
             The input data file is expected to have `lat_visit` and `lon_visit`
             in the header, as the columns containing the latitude and longitude
             of each waypoint to visit, where each waypoint is a row
         '''
-
-        keep_cols = list(col_map.values())
-        df = pd.read_csv(path, header=0, usecols=keep_cols)
-        dfl = []
-
-        # Loop through list of possible column names
-        # If name not found in the csv data `df`, then catch the error, and
-        # append it as an empty data frame
-        for col in _PCOL_NAMES_:
-            try:
-                dfl.append(df[col_map[col]])
-            except KeyError:
-                dfl.append(pd.DataFrame(columns=[col]))  # Append as empty df
-
-        # Use class method to add points
-        # For optional arguments, check if it exists, if not then pass `None`
-        # back to class method
-        self.add_points(gid_county=dfl[0],
-                        name_county=dfl[1],
-                        lat_county=dfl[2],
-                        lon_county=dfl[3],
-                        state=dfl[4],
-                        cat_code=dfl[5],
-                        fips_code=dfl[6],
-                        gid_seat=None if dfl[7].empty else dfl[7],
-                        name_seat=None if dfl[8].empty else dfl[8],
-                        lat_seat=None if dfl[9].empty else dfl[9],
-                        lon_seat=None if dfl[10].empty else dfl[10],
-                        name_visit=None if dfl[11].empty else dfl[11],
-                        lat_visit=None if dfl[12].empty else dfl[12],
-                        lon_visit=None if dfl[13].empty else dfl[13])
+        to_col = {csv_col: col for col, csv_col in col_map.items()}
+        dtypes = {csv_col: np.dtype(_PCOL_DTYPES_[col])
+                  for csv_col, col in to_col.items()}
+        lat_col, lon_col = ('lat_visit', 'lon_visit') \
+            if 'lat_visit' in col_map else ('lat_county', 'lon_county')
+
+        reader = pd.read_csv(path, header=0, usecols=list(to_col),
+                             dtype=dtypes, chunksize=chunksize)
+        for chunk in reader:
+            chunk = chunk.rename(columns=to_col)
+
+            keep = np.ones(len(chunk), dtype=bool)
+            if states is not None:
+                keep &= chunk['state'].isin(states).to_numpy()
+            if bbox is not None:
+                lat = chunk[lat_col].to_numpy()
+                lon = chunk[lon_col].to_numpy()
+                keep &= (lat >= bbox[0]) & (lon >= bbox[1]) \
+                    & (lat <= bbox[2]) & (lon <= bbox[3])
+            if where is not None:
+                keep &= np.asarray(where(chunk), dtype=bool)
+            if not keep.all():
+                chunk = chunk.loc[keep]
+
+            # Columns not in the file are passed as `None` and left missing
+            self.add_points(**{col: chunk[col] if col in chunk else None
+                               for col in _PCOL_NAMES_})
 
     def write_csv(self, path):
         '''
@@ -196,7 +769,107 @@ class TourRoute():
         if not os.path.exists(dir):
             mkdir(dir)
 
-        self._points.to_csv(path, index=False)
+        self._view().to_csv(path, index=False)
+
+    def save(self, path, fmt='npy', meta=None):
+        '''
+        Saves the TourRoute to a directory in a columnar binary format. The
+        points are written in tour order, with the tour metadata in
+        ``meta.json``.
+
+        Parameters:
+            path (str): Directory to save to. Will be created if it does not
+                exist
+
+        Optional:
+            fmt (str): One of ``_SAVE_FORMATS``. ``'npy'`` writes one ``.npy``
+                file per column, which ``load()`` can memory-map; missing
+                strings are saved as ``''``. ``'feather'`` and ``'parquet'``
+                write a single file and need pyarrow. Defaults to ``'npy'``.
+            meta (dict): Extra JSON serialisable metadata to save alongside
+                ``self.meta``. Defaults to ``None``.
+
+        Raises:
+            ValueError: If ``fmt`` is unknown
+        '''
+        if fmt not in _SAVE_FORMATS:
+            raise ValueError(f'Unknown save format ``{fmt}``')
+
+        makedirs(path, exist_ok=True)
+        rows = self._rows()
+        if fmt == 'npy':
+            for col in _PCOL_NAMES_:
+                values = self._store.column(col)[rows]
+                if values.dtype == object:
+                    values = np.where(pd.isna(values), '', values).astype(str)
+                np.save(os.path.join(path, f'{col}.npy'), values)
+        else:
+            pa = _import_pyarrow(fmt)
+            table = pa.Table.from_pandas(self._view(), preserve_index=False)
+            if fmt == 'feather':
+                pa.feather.write_feather(
+                    table, os.path.join(path, 'points.feather'))
+            else:
+                pa.parquet.write_table(
+                    table, os.path.join(path, 'points.parquet'))
+
+        with open(os.path.join(path, _SAVE_META), 'w') as f:
+            json.dump({'format': fmt,
+                       'count': len(self),
+                       'columns': _PCOL_NAMES_,
+                       'meta': {**self._meta, **(meta or {})}}, f, indent=2)
+
+    @classmethod
+    def load(cls, path, cols=None, mmap=True):
+        '''
+        Loads a TourRoute saved by ``save()``, in its saved tour order
+
+        Parameters:
+            path (str): Directory the TourRoute was saved to
+
+        Optional:
+            cols ([str]): Columns to load e.g. ``['lat_visit', 'lon_visit']``;
+                ``gid_county`` is always loaded and other columns are left
+                missing. Defaults to ``None`` for all columns.
+            mmap (bool): If True, numeric columns are memory-mapped copy on
+                write, so only the pages used are read and changes are not
+                written back to the files. Defaults to True.
+
+        Returns:
+            TourRoute
+        '''
+        with open(os.path.join(path, _SAVE_META)) as f:
+            info = json.load(f)
+
+        cols = _PCOL_NAMES_ if cols is None \
+            else [_PCOL_NAMES_[0]] + [c for c in cols if c != _PCOL_NAMES_[0]]
+        data = {}
+        if info['format'] == 'npy':
+            for col in cols:
+                values = np.load(os.path.join(path, f'{col}.npy'),
+                                 mmap_mode='c' if mmap else None)
+                if values.dtype.kind == 'U':
+                    values = values.astype(object)
+                    values[values == ''] = np.nan
+                data[col] = values
+        else:
+            pa = _import_pyarrow(info['format'])
+            file = os.path.join(path, f'points.{info["format"]}')
+            read = pa.feather.read_table if info['format'] == 'feather' \
+                else pa.parquet.read_table
+            table = read(file, columns=cols, memory_map=mmap)
+            for col in cols:
+                values = table.column(col).to_numpy(zero_copy_only=False)
+                if values.dtype == object:
+                    values = np.where(pd.isna(values), np.nan, values)
+                data[col] = values
+
+        tr = cls()
+        tr._store = _PointStore.from_columns(_PCOL_DTYPES_, data,
+                                             _PCOL_VIEW_DTYPES_)
+        tr._set_order(np.arange(len(tr._store)))
+        tr._meta = info.get('meta', {})
+        return tr
 
     def get_points(self, locs, key='gid_county'):
         '''
@@ -214,18 +887,17 @@ class TourRoute():
         '''
 
         if key == _PCOL_NAMES_[0]:
-            # Check that locs is a list for passing to df.isin()
-            locs = locs if isinstance(locs, (list)) else [locs]
-            df = self._points.loc[
-                self._points.isin({_PCOL_NAMES_[0]: locs}).gid_county]
+            rows = self._gid_rows(locs)
+            rows = rows[np.argsort(self._positions(rows))]
         else:
-            df = self._points.iloc[locs]
+            rows = self._rows()[locs]
 
-        return df
+        return self._view(rows)
 
-    def del_points(self, locs, key='gid_county'):
+    def del_points(self, locs, key='gid_county', repair=False):
         '''
-        Delete point(s) from the TourRoute
+        Delete point(s) from the TourRoute. The tour neighbours of each
+        deleted point are joined together.
 
         Parameters:
             locs ([list of ints]): List locations as either Geoname county ids
@@ -233,65 +905,220 @@ class TourRoute():
             key (str): Either ``'gid_county'`` or ``'ilocs'`` to determine
                 reference type to delete the desired rows. Defaults to
                 ``'gid_county'``.
+            repair (bool): If True, run a time bounded local search starting
+                from the points either side of each deletion. Defaults to
+                False.
 
         '''
 
         if key == _PCOL_NAMES_[0]:
-            # Check that locs is a list for passing to df.isin()
-            locs = locs if isinstance(locs, (list)) else [locs]
-            self._points.drop(
-                self._points.loc[
-                    self._points.isin(
-                        {_PCOL_NAMES_[0]: locs}).gid_county].index,
-                axis=0, inplace=True)
+            rows = self._gid_rows(locs)
         else:
-            self._points.drop(index=self._points.iloc[locs].index,
-                              inplace=True)
+            rows = self._rows()[locs]
+
+        remap = self._store.delete(rows)
+        self._gid_index = None
+
+        # Splice the deleted rows out of the tour order
+        keep = remap[self._order] >= 0
+        offset = self._offset - np.count_nonzero(~keep[:self._offset])
+        order = remap[self._order[keep]]
+        legs = None if self._legs is None else self._legs[keep]
+        self._set_order(order, offset, self._patched_legs(
+            order, legs, np.cumsum(keep)[~keep] - 1))
+
+        if self._sindex is not None:
+            self._sindex.remap(remap)
+        self._remap_candidates(remap)
+
+        if repair and len(self):
+            # Points now either side of where each deleted point was
+            after = np.cumsum(keep)[~keep] % len(self)
+            self._repair(self._order[np.concatenate(
+                (after, (after - 1) % len(self)))])
+
+    def _gid_lookup(self, gids):
+        '''
+        Looks up the given Geonames county ids in the hash index, building
+        the index first if required. Costs O(k) in the number of ids.
 
-        self._points.reset_index(drop=True, inplace=True)
+        Parameters:
+            gids ([list of ints]): List of Geoname county ids
 
-    def update_points(self, up_dict):
+        Returns:
+            rows (np.array): Integer point store row number for each id, or
+                ``-1`` where the id is not found
+            found (np.array): Boolean mask of the ids that were found
         '''
-        Update point(s) from the TourRoute
+        if self._gid_index is None:
+            self._gid_index = dict(zip(
+                self._store.column(_PCOL_NAMES_[0]).tolist(),
+                range(len(self._store))))
+
+        gids = np.atleast_1d(np.asarray(gids)).tolist()
+        rows = np.fromiter((self._gid_index.get(g, -1) for g in gids),
+                           dtype=np.intp, count=len(gids))
+        return rows, rows >= 0
+
+    def _gid_rows(self, gids):
+        '''
+        Gets the integer row numbers for the given Geonames county ids
 
         Parameters:
-            up_dict (dict): Dictionary of points to be updated. Each key
-                corresponds to a TourRoute column name, with a list of values
-                to be updated for the respective key(s). Must contain the key
+            gids ([list of ints]): List of Geoname county ids
+
+        Returns:
+            np.array of integer point store row numbers, skipping any id that
+            is not found
+        '''
+        rows, found = self._gid_lookup(gids)
+        return np.unique(rows[found])
+
+    def update_points(self, up_dict, upsert=False):
+        '''
+        Update point(s) from the TourRoute. Every column is matched to the
+        TourRoute rows by ``gid_county`` and set in one pass, so the values
+        may be given in any order.
+
+        Parameters:
+            up_dict (dict or pd.DataFrame): Points to be updated. Each key or
+                column corresponds to a TourRoute column name, with a list or
+                array of values (or a single value for every point) to be
+                updated for the respective key(s). Must contain the key
                 ``gid_county`` to use as the index for updating the desired
-                point(s) aka data frame row(s).
+                point(s) aka data frame row(s). Where a key is given more than
+                once, the last values are used.
+
+        Optional:
+            upsert (bool): If True, keys that are not in the TourRoute are
+                added as new points on the end of the tour, with any columns
+                not given left missing. If False, they are ignored. Defaults
+                to False.
+
+        Returns:
+            np.array of the ``gid_county`` keys that did not match a point
+
+        Raises:
+            ValueError: If ``gid_county`` is missing or a column is not a
+                TourRoute column
 
         Usage:
             updates = {'gid_county': [100, 200], 'name_county': ['foo', 'bar']}
-            tr.update_points(updates)
+            unmatched = tr.update_points(updates)
 
         '''
-        upd_cols = list(up_dict.keys())
-        upd_cols.remove(_PCOL_NAMES_[0])
-        for upd_col in upd_cols:
-            self._points.loc[
-                self._points.isin(
-                    {_PCOL_NAMES_[0]: utils._get(up_dict, _PCOL_NAMES_[0])}
-                ).gid_county, upd_col] = utils._get(up_dict, upd_col)
-
-    def update_visit_points(self):
+        if isinstance(up_dict, pd.DataFrame):
+            up_dict = {col: up_dict[col].to_numpy() for col in up_dict}
+
+        if up_dict.get(_PCOL_NAMES_[0]) is None:
+            raise ValueError(f'Updates must contain ``{_PCOL_NAMES_[0]}``')
+
+        unknown = set(up_dict) - set(_PCOL_NAMES_)
+        if unknown:
+            raise ValueError(f'Unknown column(s) ``{sorted(unknown)}``')
+
+        gids = np.atleast_1d(np.asarray(up_dict[_PCOL_NAMES_[0]]))
+        rows, found = self._gid_lookup(gids)
+        upd_cols = [col for col in up_dict if col != _PCOL_NAMES_[0]]
+
+        # Align every column to the keys, broadcasting single values
+        values = {col: np.broadcast_to(np.asarray(up_dict[col]), gids.shape)
+                  for col in upd_cols}
+        for col in upd_cols:
+            self._store.set(col, rows[found], values[col][found])
+
+        if {'lat_visit', 'lon_visit'} & set(upd_cols):
+            self._sindex = None
+            self._legs = None
+            self._neigh = None
+
+        unmatched = gids[~found]
+        if upsert and len(unmatched):
+            # Add each new key once, with its last values
+            last = len(gids) - 1 - np.unique(gids[::-1], return_index=True)[1]
+            new = np.zeros(len(gids), dtype=bool)
+            new[last] = True
+            new &= ~found
+            new_points = {col: values[col][new] for col in upd_cols}
+            self.add_points(gids[new],
+                            *[new_points.get(col)
+                              for col in _PCOL_NAMES_[1:7]],
+                            **{col: new_points.get(col)
+                               for col in _PCOL_NAMES_[7:]})
+
+        return unmatched
+
+    def update_visit_points(self, rule='seat', places=None, max_km=None):
         '''
-        Update visit points for the TourRoute object
+        Update visit points for the TourRoute object. Each visit point is
+        picked by the given rule, falling back to the county centroid where
+        the rule gives no point.
 
+        Optional:
+            rule (str): One of ``_VISIT_RULES``:
+                * ``'seat'``: the county seat, else the county centroid
+                * ``'county'``: the county centroid
+                * ``'nearest_place'``: the place in ``places`` nearest to the
+                    county centroid, else the county centroid
+                Defaults to ``'seat'``.
+            places (pd.DataFrame): Populated places with columns ``name``,
+                ``lat`` and ``lon``; required for ``'nearest_place'``.
+                Defaults to ``None``.
+            max_km (float): For ``'nearest_place'``, only use a place within
+                this many kilometres of the county centroid. Defaults to
+                ``None`` for no limit.
+
+        Raises:
+            ValueError: If ``rule`` is unknown, or ``places`` is not given for
+                ``'nearest_place'``
         '''
-        # If data for county seat exists, use that data for visit; else use
-        # county data
-        self._points['name_visit'] = self._points[
-            ['name_county', 'name_seat']].apply(
-            lambda x: x[1] if type(x[1]) is str else x[0], axis=1)
+        if rule not in _VISIT_RULES:
+            raise ValueError(f'Unknown visit rule ``{rule}``')
+
+        col = self._store.column
+        name = col('name_county')
+        lat = col('lat_county')
+        lon = col('lon_county')
+
+        if rule == 'seat':
+            # Use the county seat wherever it has a location
+            use = np.isfinite(col('lat_seat')) & np.isfinite(col('lon_seat'))
+            alt_name = col('name_seat')
+            alt_lat = col('lat_seat')
+            alt_lon = col('lon_seat')
+        elif rule == 'nearest_place':
+            if places is None:
+                raise ValueError('``places`` is required for rule '
+                                 + '``nearest_place``')
+            pidx = _SphereIndex(np.arange(len(places)),
+                                places['lat'].to_numpy(np.float64),
+                                places['lon'].to_numpy(np.float64))
+            dist, ids = pidx.nearest(lat, lon, k=1)
+            dist = dist[:, 0]
+            ids = ids[:, 0]
+            use = (ids >= 0) & np.isfinite(lat) & np.isfinite(lon)
+            if max_km is not None:
+                use &= dist <= max_km
+            ids = np.where(use, ids, 0)
+            alt_name = places['name'].to_numpy(object)[ids] \
+                if len(places) else name
+            alt_lat = places['lat'].to_numpy(np.float64)[ids] \
+                if len(places) else lat
+            alt_lon = places['lon'].to_numpy(np.float64)[ids] \
+                if len(places) else lon
+        else:
+            use = np.zeros(len(self._store), dtype=bool)
+            alt_name, alt_lat, alt_lon = name, lat, lon
 
-        self._points['lat_visit'] = self._points[
-            ['lat_county', 'lat_seat']].apply(
-            lambda x: x[0] if math.isnan(x[1]) else x[1], axis=1)
+        has_name = use & pd.notna(alt_name)
+        self._store.set('name_visit', slice(None),
+                        np.where(has_name, alt_name, name))
+        self._store.set('lat_visit', slice(None), np.where(use, alt_lat, lat))
+        self._store.set('lon_visit', slice(None), np.where(use, alt_lon, lon))
 
-        self._points['lon_visit'] = self._points[
-            ['lon_county', 'lon_seat']].apply(
-            lambda x: x[0] if math.isnan(x[1]) else x[1], axis=1)
+        self._sindex = None
+        self._legs = None
+        self._neigh = None
 
     def get_cols(self, cols):
         '''
@@ -304,7 +1131,7 @@ class TourRoute():
             pd.DataFrame of the desired columns
         '''
         cols = cols if isinstance(cols, (list)) else [cols]
-        return self._points[cols]
+        return self._view()[cols]
 
     def get_uniques(self, cols, nas=False):
         '''
@@ -329,20 +1156,21 @@ class TourRoute():
 
     def rotate(self, gid_county):
         '''
-        Rotates a TourRoute so that the given gid_county is the first point
+        Rotates a TourRoute so that the given gid_county is the first point.
+        Only the tour start offset is changed; no point data is moved.
 
         Parameters:
             gid_county (int): Geonames ID for a county
         '''
-        iter = 0
-        while self._points.gid_county.iloc[0] != gid_county:
-            self._points = self._points[1:].append(self._points[:1])
+        rows = self._gid_rows(gid_county)
+        if len(rows) == 0:
+            print(f'WARNING: TourRoute.rotate() gid_county::{gid_county}'
+                  + ' not found')
+            return
 
-            iter += 1
-            if iter == len(self):
-                print(f'WARNING: TourRoute.rotate() gid_county::{gid_county}'
-                      + ' not found')
-                break
+        self._set_order(self._order,
+                        self._offset + self._positions(rows[:1])[0],
+                        self._legs)
 
     def reorder(self, ilocs):
         '''
@@ -352,46 +1180,230 @@ class TourRoute():
             ilocs ([int]): List or array of integers corresponding to TourRoute
         '''
 
-        ilocs = ilocs if isinstance(ilocs, (list)) else ilocs.tolist()
-        self._points = self._points.reindex(ilocs)
+        self._set_order(self._rows()[np.asarray(ilocs, dtype=np.intp)])
+
+    def reverse(self, keep_start=True):
+        '''
+        Reverses the direction of the TourRoute
+
+        Optional:
+            keep_start (bool): If True, the first point stays as the first
+                point and the rest of the tour is reversed behind it. If
+                False, the last point becomes the first point. Defaults to
+                True.
+        '''
+        n = len(self)
+        offset = n - 1 - self._offset if keep_start else n - self._offset
+        legs = None if self._legs is None else np.roll(self._legs[::-1], -1)
+        self._set_order(self._order[::-1], offset, legs)
+
+    def _spatial_index(self):
+        '''
+        Gets the spatial index over the visit points, building it if required
+
+        Returns:
+            _SphereIndex keyed by point store row numbers
+        '''
+        if self._sindex is None:
+            self._sindex = _SphereIndex(np.arange(len(self._store)),
+                                        self._store.column('lat_visit'),
+                                        self._store.column('lon_visit'))
+        return self._sindex
+
+    def nearest_bulk(self, lats, lons, k=1):
+        '''
+        Finds the ``k`` nearest visit points to each of the given locations
+
+        Parameters:
+            lats (np.array): Latitudes of the query locations
+            lons (np.array): Longitudes of the query locations
+
+        Optional:
+            k (int): Number of nearest points to find. Defaults to 1.
+
+        Returns:
+            dist (np.array): Array of shape ``(len(lats), k)`` of distances in
+                kilometres, sorted nearest first
+            ilocs (np.array): Array of shape ``(len(lats), k)`` of TourRoute
+                integer locations of the points found. Where there are fewer
+                than ``k`` points, the location is ``-1`` and the distance is
+                ``inf``
+        '''
+        dist, rows = self._spatial_index().nearest(lats, lons, k)
+        ilocs = np.full(rows.shape, -1, dtype=np.intp)
+        found = rows >= 0
+        ilocs[found] = self._positions(rows[found])
+        return dist, ilocs
+
+    def within_radius_bulk(self, lats, lons, km):
+        '''
+        Finds the visit points within the given distance of each of the given
+        locations
+
+        Parameters:
+            lats (np.array): Latitudes of the query locations
+            lons (np.array): Longitudes of the query locations
+            km (float): Radius in kilometres
+
+        Returns:
+            dist (list of np.array): For each query location, the distances in
+                kilometres to the points found, sorted nearest first
+            ilocs (list of np.array): For each query location, the TourRoute
+                integer locations of the points found
+        '''
+        dist, rows = self._spatial_index().within(lats, lons, km)
+        return dist, [self._positions(r) for r in rows]
+
+    def nearest(self, lat, lon, k=1):
+        '''
+        Gets the ``k`` nearest points to the given location
+
+        Parameters:
+            lat (float): Latitude of the location
+            lon (float): Longitude of the location
+
+        Optional:
+            k (int): Number of nearest points to get. Defaults to 1.
+
+        Returns:
+            pd.DataFrame of the nearest points, sorted nearest first, with the
+            distance to each in kilometres in the column ``dist_km``
+        '''
+        dist, ilocs = self.nearest_bulk(lat, lon, k)
+        found = ilocs[0] >= 0
+        df = self.get_points(ilocs[0][found], key='ilocs')
+        df['dist_km'] = dist[0][found]
+        return df
 
-    def slices(self, slice_len=10):
+    def within_radius(self, lat, lon, km):
         '''
-        Returns a list of slices of length `lgth` (default=10). Each slice has
-        a origin, destination and optional list of waypoints. Each point is a
-        destination), with each waypoint adding incrementally to the length.
-        tuple of `(lat, lon)` coordinates. Length is a minimum of two (origin,
-        destination).
+        Gets the points within the given distance of the given location
+
+        Parameters:
+            lat (float): Latitude of the location
+            lon (float): Longitude of the location
+            km (float): Radius in kilometres
+
+        Returns:
+            pd.DataFrame of the points found, sorted nearest first, with the
+            distance to each in kilometres in the column ``dist_km``
+        '''
+        dist, ilocs = self.within_radius_bulk(lat, lon, km)
+        df = self.get_points(ilocs[0], key='ilocs')
+        df['dist_km'] = dist[0]
+        return df
+
+    def slices(self, slice_len=10, overlap=True, max_waypoints=None):
+        '''
+        Returns a list of slices of length `slice_len` (default=10). Each
+        slice has a origin, destination and optional list of waypoints. Each
+        point is a tuple of `(lat, lon)` coordinates. Length is a minimum of
+        two (origin, destination), with each waypoint adding incrementally to
+        the length. See ``iter_slices()`` to get the slices one at a time.
 
         Optional:
         Args:
             slice_len (int): Length of each slice, default of 10, minimum of 2
+            overlap (bool): If True, each `origin` is the `destination` of
+                the previous slice so that every leg is in a slice. If False,
+                the legs between slices are left out. Defaults to True.
+            max_waypoints (int): Most waypoints in a slice. Defaults to
+                ``None`` for no limit other than ``slice_len``.
 
         Returns:
-            slice (list of dict): List of dicts where each dict has keys
-                `origin`, `destination` and `waypoints`. List is ordered
-                whereby each `origin` is the `destination` of the previous item
-                in the list. `waypoints` is a list. Each point (`origin`,
-                `destiatnion` or any of the items in the `waypoints` list) is a
-                tuple of `('lat_visit', 'lon_visit')`.
+            slice (list of TourSlice): List of TourSlices in tour order. Each
+                point (`origin`, `destination` or any of the items in the
+                `waypoints` list) is a tuple of `('lat_visit', 'lon_visit')`.
+        '''
+        return list(self.iter_slices(slice_len, overlap, max_waypoints))
+
+    def iter_slices(self, slice_len=10, overlap=True, max_waypoints=None):
+        '''
+        Lazily yields slices of length `slice_len` (default=10). Each slice
+        is a lightweight TourSlice over a view of one contiguous coordinate
+        array, so no point data is copied however many slices are taken.
+
+        Optional:
+        Args:
+            slice_len (int): Length of each slice, default of 10, minimum of 2
+            overlap (bool): If True, each `origin` is the `destination` of
+                the previous slice so that every leg is in a slice. If False,
+                the legs between slices are left out. Defaults to True.
+            max_waypoints (int): Most waypoints in a slice e.g.
+                ``_MAX_WAYPOINTS`` for the Google Directions API. Defaults to
+                ``None`` for no limit other than ``slice_len``.
+
+        Yields:
+            TourSlice for each slice, in tour order
         '''
         slice_len = max(2, slice_len)  # Min length of 2
-        slice_list = []
-        tr_len = len(self._points)
+        if max_waypoints is not None:
+            slice_len = min(slice_len, max(0, max_waypoints) + 2)
+
+        coords = self._coords()
+        tr_len = len(coords)
+        step = slice_len - 1 if overlap else slice_len
+        stop = tr_len - 1 if overlap and tr_len > 1 else tr_len
 
-        for i in range(0, tr_len, slice_len):
-            org = tuple(self._points.iloc[i])
-            dest = tuple(self._points.iloc[min(tr_len - 1, i + slice_len - 1)])
-            if slice_len > 2:
-                wpts = list(
-                    self._points.iloc[(i+1):min(tr_len - 1, i + slice_len - 1)
-                                      ].itertuples(index=False,
-                                                   name=None))
-            slice_list.append(TourSlice(org, dest, wpts))
+        for i in range(0, stop, step):
+            yield TourSlice.from_coords(coords[i:min(tr_len, i + slice_len)],
+                                        start=i)
 
-        return slice_list
+    def plan_slices(self, max_waypoints=_MAX_WAYPOINTS, slack=_PLAN_SLACK):
+        '''
+        Plans overlapping slices that cover every leg of the tour, each
+        within the waypoint limit of one Directions request. Each slice ends
+        on the last anchor point, picked by a hash of its ``gid_county``, in
+        the last ``slack`` share of the slice, or failing that on the point
+        there with the lowest hash. The boundaries depend on the points
+        around them rather than on their position, so an edit to the tour
+        only moves the boundaries close to it and the other slices are the
+        same requests as before e.g. cache hits.
+
+        On the continental US tour, the default slack takes about 20% more
+        requests than the fewest possible, and a one point edit changes one
+        slice on average and rarely more than ten.
+
+        Optional:
+            max_waypoints (int): Most waypoints in a request. Defaults to
+                ``_MAX_WAYPOINTS``.
+            slack (float): Share of a full slice's legs that may be given up
+                to end on an anchor, between 0 for the fewest requests but no
+                stable boundaries, and 1. Defaults to ``_PLAN_SLACK``.
 
-    def write_js(self, path, tour_name='optRoute'):
+        Returns:
+            slice (list of TourSlice): List of TourSlices in tour order, where
+                each `origin` is the `destination` of the previous slice
+        '''
+        tr_len = len(self)
+        max_legs = max(0, max_waypoints) + 1
+        min_legs = max(1, int(np.ceil(max_legs * (1 - slack))))
+
+        # Content-defined anchors, a few in every window of slack
+        hashes = _mix_hash(self._store.column(_PCOL_NAMES_[0])[self._rows()])
+        spacing = max(1, (max_legs - min_legs + 1) // _PLAN_ANCHORS)
+        anchors = np.flatnonzero(hashes % np.uint64(spacing) == 0)
+
+        cuts = [0]
+        while cuts[-1] < tr_len - 1:
+            start = cuts[-1]
+            stop = min(tr_len - 1, start + max_legs)
+            if stop < tr_len - 1:
+                # Last anchor in the window, else the lowest hash in it
+                lo = start + min_legs
+                i = np.searchsorted(anchors, stop, side='right') - 1
+                if i >= 0 and anchors[i] >= lo:
+                    stop = int(anchors[i])
+                else:
+                    stop = lo + int(np.argmin(hashes[lo:stop + 1]))
+            cuts.append(stop)
+
+        coords = self._coords()
+        return [TourSlice.from_coords(coords[a:b + 1], start=a)
+                for a, b in zip(cuts[:-1], cuts[1:])]
+
+    def write_js(self, path, tour_name='optRoute', fmt='objects',
+                 precision=5):
         '''
         Write the TourRoute to a javascript file
         Args:
@@ -400,9 +1412,32 @@ class TourRoute():
         Optional:
             tour_name (string): Variable name to be used in the output file.
                 Defaults to `optRoute`.
+            fmt (str): One of ``_JS_FORMATS``. ``'objects'`` writes an object
+                literal per point. ``'polyline'`` and ``'float32'`` write the
+                coordinates as a Google encoded polyline or a base64
+                Float32Array, with the county names, states and seats as
+                lookup tables; these files need ``decode.js`` loaded first.
+                Defaults to ``'objects'``.
+            precision (int): Decimal places kept by ``'polyline'``, up to
+                ``utils._POLYLINE_MAX_PRECISION``. Defaults to 5.
+
+        Raises:
+            ValueError: If ``fmt`` is unknown, or ``precision`` is out of
+                range for ``'polyline'``
         '''
+        if fmt not in _JS_FORMATS:
+            raise ValueError(f'Unknown js format ``{fmt}``')
+        if fmt == 'polyline' \
+                and not 0 <= precision <= utils._POLYLINE_MAX_PRECISION:
+            raise ValueError(f'Polyline precision ``{precision}`` is not '
+                             + 'within 0 to '
+                             + f'{utils._POLYLINE_MAX_PRECISION}')
+
         with open(path, 'w') as f:
-            self._write_js(f, tour_name)
+            if fmt == 'objects':
+                self._write_js(f, tour_name)
+            else:
+                self._write_js_encoded(f, tour_name, fmt, precision)
 
     def _write_js(self, file, tour_name='optRoute'):
         '''
@@ -417,7 +1452,7 @@ class TourRoute():
         with _Writer(file) as w:
             w.write(f'var {tour_name} = [')
             w.indent()
-            for idx, point in self._points.iterrows():
+            for idx, point in self._view().iterrows():
                 w.write('{ ', end_in_newline=False)
                 w.write(utils._format_jslocation(
                     point['lat_visit'], point['lon_visit']),
@@ -431,71 +1466,430 @@ class TourRoute():
             w.dedent()
             w.write(']')
 
-    def flyingcrow_dist(self):
+    def _write_js_encoded(self, file, tour_name='optRoute', fmt='polyline',
+                          precision=5):
+        '''
+        Write the TourRoute to a javascript file with encoded coordinates and
+        deduplicated lookup tables, decoded in the browser by ``decodeTour()``
+        in ``decode.js``
+        Args:
+            file (handle): File handler for output js file
+
+        Optional:
+            tour_name (string): Variable name to be used in the output file.
+                Defaults to `optRoute`.
+            fmt (str): Either ``'polyline'`` or ``'float32'``. Defaults to
+                ``'polyline'``.
+            precision (int): Decimal places kept by ``'polyline'``. Defaults
+                to 5.
+        '''
+        coords = self._coords()
+        if fmt == 'polyline':
+            encoded = utils._encode_polyline(coords[:, 0], coords[:, 1],
+                                             precision)
+        else:
+            encoded = utils._encode_float32(coords[:, 0], coords[:, 1])
+
+        # Each attribute is written as a table of its unique values and an
+        # index into that table for each point
+        rows = self._rows()
+        tables = {}
+        index = {}
+        for js_name, col in _JS_TABLES.items():
+            values = self._store.column(col)[rows].astype(str)
+            codes, uniques = pd.factorize(values)
+            tables[js_name] = uniques.tolist()
+            index[js_name] = codes.tolist()
+
+        with _Writer(file) as w:
+            w.write(f'var {tour_name} = decodeTour({{')
+            w.indent()
+            w.write(f'format: {json.dumps(fmt)},')
+            w.write(f'precision: {precision},')
+            w.write(f'count: {len(coords)},')
+            w.write(f'coords: {json.dumps(encoded)},')
+            w.write(f'tables: {json.dumps(tables, separators=(",", ":"))},')
+            w.write(f'index: {json.dumps(index, separators=(",", ":"))}')
+            w.dedent()
+            w.write('})')
+
+    def leg_dists(self):
+        '''
+        Gets the great circle distance of each leg of the tour, using
+        ``lat_visit`` and ``lon_visit``. The distances are cached and kept up
+        to date as points are rotated, reversed, inserted and deleted.
+
+        Returns:
+            np.array of distances in kilometres, where the i-th entry is the
+            leg from the i-th point to the next point; the last entry is the
+            closing leg back to the first point
+        '''
+        legs = self._order_legs()
+        return np.concatenate((legs[self._offset:], legs[:self._offset]))
+
+    def flyingcrow_dist(self, closed=True):
         '''
         Calculates the total tour distance in kilometres. The distance is
         calculated as a straight line between each subsequent point in the
         TourRoute. Calculates distance using ``lat_visit`` and ``lon_visit``.
 
+        Optional:
+            closed (bool): If True, include the closing leg from the last
+                point back to the first point. Defaults to True.
+
         Returns:
             Distance in kilometres
         '''
-        radius = 6371  # Earth's average radius in kilometres
+        if len(self) < 2:
+            return 0.0
+
+        legs = self._order_legs()
+        dist = np.nansum(legs)
+        if not closed:
+            dist -= np.nan_to_num(legs[self._offset - 1])
+        return float(dist)
+
+    def _delta_rows(self, ilocs):
+        '''
+        Gets the point store rows at the given tour positions, wrapping around
+
+        Parameters:
+            ilocs (np.array): Integer tour positions
+
+        Returns:
+            np.array of integer point store row numbers
+        '''
+        ilocs = np.asarray(ilocs, dtype=np.intp)
+        return self._order[(ilocs + self._offset) % len(self)]
+
+    def _delta_legs(self, ilocs):
+        '''
+        Gets the cached distances of the legs leaving the given tour positions
+
+        Parameters:
+            ilocs (np.array): Integer tour positions
+
+        Returns:
+            np.array of distances in kilometres
+        '''
+        ilocs = np.asarray(ilocs, dtype=np.intp)
+        return self._order_legs()[(ilocs + self._offset) % len(self)]
+
+    def delta_2opt(self, i, j):
+        '''
+        Gets the change in closed tour length from reversing the points at
+        tour positions ``i + 1`` to ``j``, replacing the legs ``(i, i + 1)``
+        and ``(j, j + 1)`` with ``(i, j)`` and ``(i + 1, j + 1)``. The move is
+        not applied. Costs O(1) once the leg distances are cached.
+
+        Parameters:
+            i (int): Tour position before the reversed section
+            j (int): Tour position of the last point of the reversed section
+
+        Returns:
+            float: Change in tour length in kilometres; negative is shorter
+        '''
+        n = len(self)
+        if n < 4 or (j - i) % n in (0, 1, n - 1):
+            return 0.0
+
+        a, b, c, d = self._delta_rows([i, i + 1, j, j + 1])
+        added = self._km([a, b], [c, d]).sum()
+        return float(added - self._delta_legs([i, j]).sum())
+
+    def delta_swap(self, i, j):
+        '''
+        Gets the change in closed tour length from swapping the points at
+        tour positions ``i`` and ``j``. The move is not applied. Costs O(1)
+        once the leg distances are cached.
+
+        Parameters:
+            i (int): Tour position of the first point
+            j (int): Tour position of the second point
+
+        Returns:
+            float: Change in tour length in kilometres; negative is shorter
+        '''
+        n = len(self)
+        i %= max(n, 1)
+        j %= max(n, 1)
+        if n < 4 or i == j:
+            return 0.0
+
+        # Legs leaving the points before and at each swapped position
+        legs = np.unique(np.array([i - 1, i, j - 1, j]) % n)
+        starts = self._delta_rows(legs)
+        ends = self._delta_rows(legs + 1)
+        rows_i, rows_j = self._delta_rows([i, j])
+        swapped = {rows_i: rows_j, rows_j: rows_i}
+        starts = np.array([swapped.get(r, r) for r in starts])
+        ends = np.array([swapped.get(r, r) for r in ends])
+
+        added = self._km(starts, ends).sum()
+        return float(added - self._delta_legs(legs).sum())
+
+    def delta_relocate(self, i, j):
+        '''
+        Gets the change in closed tour length from moving the point at tour
+        position ``i`` to between the points at positions ``j`` and
+        ``j + 1``. The move is not applied. Costs O(1) once the leg distances
+        are cached.
+
+        Parameters:
+            i (int): Tour position of the point to move
+            j (int): Tour position of the point to move it after
+
+        Returns:
+            float: Change in tour length in kilometres; negative is shorter
+        '''
+        n = len(self)
+        if n < 3 or (j - i) % n in (0, n - 1):
+            return 0.0
+
+        p, x, s, a, b = self._delta_rows([i - 1, i, i + 1, j, j + 1])
+        added = self._km([p, a, x], [s, x, b]).sum()
+        return float(added - self._delta_legs([i - 1, i, j]).sum())
+
+    def dist_matrix(self, cache_dir=None):
+        '''
+        Gets the great circle distance matrix between every pair of visit
+        points. Rows and columns are the TourRoute integer locations at the
+        time of the call, so get a new matrix after reordering the TourRoute.
 
-        dist = \
-            utils.haversine(self._points[['lat_visit']],
-                            self._points[['lon_visit']],
-                            self._points[['lat_visit']].shift(periods=1),
-                            self._points[['lon_visit']].shift(periods=1),
-                            to_radians=True,
-                            earth_radius=radius)
-        return pd.DataFrame(dist).sum()[0]
+        Optional:
+            cache_dir (str): Directory in which to cache the matrix. A matrix
+                already cached for the same visit points is memory-mapped
+                rather than recomputed. Defaults to ``None`` for no caching.
 
-    def find_tour(self, time_bound=60, random_seed=42, start_gid=6941775):
+        Returns:
+            DistMatrix of distances in kilometres
         '''
-        Use the Concorde algorithim to find the optimal tour. Returns the
-        optimised tour.
+        data = self.get_cols(['lat_visit', 'lon_visit'])
+        return DistMatrix.from_coords(data.lat_visit.to_numpy(),
+                                      data.lon_visit.to_numpy(),
+                                      cache_dir=cache_dir)
+
+    def find_tour(self, time_bound=60, random_seed=42, start_gid=6941775,
+                  engine='auto', polish=False, polish_time_bound=-1,
+                  n_starts=1, workers=None, target_length=None,
+                  wall_time=None):
+        '''
+        Use a TSP solver to find the optimal, or a near optimal, tour.
+        Reorders the TourRoute to the tour found.
+
+        With ``n_starts`` more than one, independent solves are run in a
+        process pool with seeds ``random_seed``, ``random_seed + 1`` and so
+        on, and the shortest tour is kept.
 
         Parameters:
-            time_bound (int): Time bound in seconds (?) for Concorde
-                algorithim. Defaults to 60. For unbounded, use ``-1``
-            random_seed (int): Random seed for Concorde algorithim. Defaults
-                to 42.
+            time_bound (int): Time bound in seconds for the solver. Defaults
+                to 60. For unbounded, use ``-1``
+            random_seed (int): Random seed for the solver. Defaults to 42.
             start_gid (int): Geonames county id to start the tour at. Defaults
                 to 6941775 (Kings County, NY)
+            engine (str): Solver to use. Either ``'concorde'`` for the
+                Concorde algorithim, ``'builtin'`` for the built-in 2-opt and
+                Or-opt heuristic (see ``lib.solver``), or ``'auto'`` to use
+                Concorde if it is installed and the built-in solver if not.
+                Defaults to ``'auto'``.
+            polish (bool): If True, improve the tour found with Or-opt and
+                Lin-Kernighan style moves (see ``lib.solver.polish``). Useful
+                after a short, time bounded Concorde run. Defaults to False.
+            polish_time_bound (int): Time bound in seconds for the polishing
+                stage. Defaults to ``-1`` for unbounded.
+            n_starts (int): Number of independent solves. Defaults to 1.
+            workers (int): Number of worker processes for ``n_starts`` more
+                than one. Defaults to ``None`` for one per CPU.
+            target_length (float): Stop once a tour of this length in
+                kilometres or shorter is found. Defaults to ``None``.
+            wall_time (float): Stop all solves, including running ones, after
+                this many seconds. Defaults to ``None``.
 
+        Returns:
+            dict: Solve statistics; ``engine``, ``success``, ``seconds``,
+                ``length`` in kilometres, ``compile_seconds`` spent compiling
+                the built-in solver beforehand, for multiple starts ``starts``
+                with the ``seed``, ``length`` and ``seconds`` of each
+                completed solve and, if polished, ``polish`` with the
+                kilometres removed and time taken
+
+        Raises:
+            ValueError: If ``engine`` is not one of ``solver.ENGINES``
         '''
+        engine = solver.resolve_engine(engine)
         data = self.get_cols(['lat_visit', 'lon_visit'])
+        lat = data.lat_visit.to_numpy()
+        lon = data.lon_visit.to_numpy()
 
-        # Instantiate solver
-        solver = TSPSolver.from_data(
-            data.lat_visit,
-            data.lon_visit,
-            norm="GEO"
-        )
+        # Compile the built-in solver's kernels before starting the clock
+        compile_seconds = solver.warm_up() \
+            if engine == 'builtin' or polish else 0.0
 
         # Find tour
         start_time = datetime.now()
-        tour_data = solver.solve(time_bound=time_bound, verbose=False,
-                                 random_seed=random_seed)
+        if n_starts > 1:
+            tour, success, starts = parallel.solve_multistart(
+                lat, lon, random_seed + np.arange(n_starts), engine=engine,
+                time_bound=time_bound, workers=workers,
+                target_length=target_length, wall_time=wall_time)
+        else:
+            tour, success = solver.run_engine(engine, lat, lon, time_bound,
+                                              random_seed)
+
+        stats = {'engine': engine, 'success': success,
+                 'seconds': (datetime.now() - start_time).total_seconds(),
+                 'length': solver.tour_length(solver.to_xyz(lat, lon), tour),
+                 'compile_seconds': compile_seconds}
+        if n_starts > 1:
+            stats['starts'] = starts
 
         # Print diagnostics
         print(f'\n\n{"~"*80}\n')
-        print(f'Tour found in {(datetime.now() - start_time)}')
+        print(f'Tour found by {engine} in {(datetime.now() - start_time)}')
+        if n_starts > 1:
+            best = next(s for s in starts if s['best'])
+            print(f'Best of {len(starts)} starts is seed {best["seed"]} at '
+                  + f'{best["length"]:,.1f} km')
         print(f'{bcolours.OKGREEN}Solver was successful{bcolours.ENDC}'
-              if tour_data.success else
+              if success else
               f'{bcolours.FAIL}Solver was NOT successful{bcolours.ENDC}')
 
-        self.reorder(tour_data.tour)
+        if polish:
+            tour, stats['polish'] = solver.polish(
+                lat, lon, tour, time_bound=polish_time_bound,
+                random_seed=random_seed)
+            stats['length'] = stats['polish']['length_after']
+            print(f'Polishing removed {stats["polish"]["removed"]:,.1f} km '
+                  + f'in {stats["polish"]["seconds"]:.2f} seconds')
+
+        self.reorder(tour)
         self.rotate(start_gid)
+        self._meta = {'engine': engine, 'random_seed': random_seed,
+                      'length': stats['length']}
+        return stats
+
+    def find_tour_decomposed(self, by=None, n_clusters=None, engine='builtin',
+                             time_bound=-1, workers=None, random_seed=42,
+                             start_gid=6941775):
+        '''
+        Finds a tour by splitting the TourRoute into clusters, solving each
+        cluster in parallel, then stitching the cluster subtours together at
+        their best boundary edges (see ``lib.parallel.solve_clustered``).
+        Solve time grows close to linearly with the number of points, so use
+        this in place of ``find_tour()`` for very large TourRoutes.
+
+        Parameters:
+            by (str): TourRoute column to cluster on e.g. ``'state'``.
+                Defaults to ``None`` to cluster with k-means.
+            n_clusters (int): Number of k-means clusters. Defaults to
+                ``None`` for roughly 2,000 points per cluster.
+            engine (str): Solver for each cluster; see ``find_tour()``.
+                Defaults to ``'builtin'``.
+            time_bound (int): Time bound in seconds for each cluster solve
+                and the final local search. Defaults to ``-1`` for unbounded.
+            workers (int): Number of worker processes. Defaults to ``None``
+                for one per CPU.
+            random_seed (int): Random seed. Defaults to 42.
+            start_gid (int): Geonames county id to start the tour at. Defaults
+                to 6941775 (Kings County, NY)
+
+        Returns:
+            dict: Solve statistics, including the ``stitch_overhead`` in
+                kilometres and the time spent in each stage
+        '''
+        data = self.get_cols(['lat_visit', 'lon_visit']
+                             + ([] if by is None else [by]))
+        tour, stats = parallel.solve_clustered(
+            data.lat_visit.to_numpy(), data.lon_visit.to_numpy(),
+            labels=None if by is None else data[by].to_numpy(),
+            n_clusters=n_clusters, engine=engine, time_bound=time_bound,
+            workers=workers, random_seed=random_seed)
+
+        self.reorder(tour)
+        self.rotate(start_gid)
+        self._meta = {'engine': engine, 'random_seed': random_seed,
+                      'length': stats['length'], 'decomposed': True}
+        return stats
+
+
+def _grown(buf, values, size):
+    '''
+    Gets a buffer that starts with ``values`` and can hold ``size`` entries.
+    ``buf`` is reused if ``values`` is a view of its start and it is large
+    enough, otherwise a new buffer is allocated with geometric growth.
+
+    Parameters:
+        buf (np.array): Current buffer, or ``None``
+        values (np.array): Values the buffer must start with
+        size (int): Number of entries needed
+
+    Returns:
+        np.array buffer of at least ``size`` entries
+    '''
+    if buf is not None and values.base is buf and len(buf) >= size \
+            and values.strides == buf.strides \
+            and values.ctypes.data == buf.ctypes.data:
+        return buf
+
+    new_buf = np.empty(max(size, _GROWTH_FACTOR * len(values), _MIN_CAPACITY),
+                       dtype=values.dtype)
+    new_buf[:len(values)] = values
+    return new_buf
+
+
+def _mix_hash(values):
+    '''
+    Hashes integers with the SplitMix64 finaliser, so that nearby values
+    give unrelated hashes
+
+    Parameters:
+        values (np.array): Integers
+
+    Returns:
+        np.array of uint64 hashes
+    '''
+    x = np.asarray(values).astype(np.uint64)
+    x ^= x >> np.uint64(30)
+    x *= np.uint64(0xbf58476d1ce4e5b9)
+    x ^= x >> np.uint64(27)
+    x *= np.uint64(0x94d049bb133111eb)
+    x ^= x >> np.uint64(31)
+    return x
+
+
+def _import_pyarrow(fmt):
+    '''
+    Imports pyarrow along with its feather and parquet modules
+
+    Parameters:
+        fmt (str): Format that needs pyarrow, for the error message
+
+    Returns:
+        The pyarrow module
+
+    Raises:
+        ImportError: If pyarrow is not installed
+    '''
+    try:
+        import pyarrow
+        import pyarrow.feather  # noqa: F401
+        import pyarrow.parquet  # noqa: F401
+    except ImportError as e:
+        raise ImportError(f'The ``{fmt}`` format needs pyarrow; install it or'
+                          + ' use ``npy``') from e
+    return pyarrow
 
 
 class TourSlice():
     '''
     Holds a slice of the tour, with an origin, destination, and set of optional
-    waypoints
+    waypoints. The points are held as one ``(k, 2)`` array of latitude and
+    longitude, which may be a view into a larger array, along with the tour
+    position of the origin when the slice was cut from a TourRoute.
     '''
 
+    __slots__ = ['coords', 'start']
+
     def __init__(self, origin, destination, waypoints=None):
         '''
         Args:
@@ -506,11 +1900,52 @@ class TourSlice():
                 tuples of waypoints in between the origin and destination
 
         Usage::
+            ts = TourSlice((40.7, -74.0), (42.7, -73.8), [(41.1, -74.0)])
+        '''
+        points = [origin] + list(waypoints or []) + [destination]
+        self.coords = np.array([p[:2] for p in points], dtype=np.float64)
+        self.start = None
+
+    @classmethod
+    def from_coords(cls, coords, start=None):
+        '''
+        Creates a TourSlice over the given coordinates without copying them
+
+        Parameters:
+            coords (np.array): Array of shape ``(k, 2)`` of latitude and
+                longitude, from origin to destination
+
+        Optional:
+            start (int): Tour position of the origin. Defaults to ``None``.
 
+        Returns:
+            TourSlice
         '''
-        self.origin = origin
-        self.destination = destination
-        self.waypoints = waypoints
+        tour_slice = cls.__new__(cls)
+        tour_slice.coords = coords
+        tour_slice.start = start
+        return tour_slice
+
+    def __len__(self):
+        return len(self.coords)
+
+    @property
+    def origin(self):
+        '''Latitude and longitude tuple of the origin'''
+        return tuple(self.coords[0].tolist())
+
+    @property
+    def destination(self):
+        '''Latitude and longitude tuple of the destination'''
+        return tuple(self.coords[-1].tolist())
+
+    @property
+    def waypoints(self):
+        '''List of latitude and longitude tuples of the waypoints, or
+        ``None`` if there are none'''
+        if len(self.coords) <= 2:
+            return None
+        return [tuple(p) for p in self.coords[1:-1].tolist()]
 
     def get_slice_drivedistdur(self, gmaps):
         '''
@@ -527,68 +1962,195 @@ class TourSlice():
             duration (numeric): Duration taken to drive the tour_slice in
                 seconds
         '''
+        dist, dur = self.get_slice_legs(gmaps)
+        return np.nansum(dist), np.nansum(dur)
+
+    def get_slice_legs(self, gmaps):
+        '''
+        Get the distance and duration of each leg of the tour_slice
+
+        Args:
+            gmaps (googlemaps Client): An initiated Google Maps Client
+
+        Returns:
+            dist (np.array): Distance of each leg in metres
+            duration (np.array): Duration taken to drive each leg in seconds
+        '''
+        return self._parse_legs(gmaps.directions(**self.directions_args()))
+
+    def directions_args(self):
+        '''
+        Gets the keyword arguments for a driving ``directions()`` request for
+        the slice
+
+        Returns:
+            dict of ``origin``, ``destination``, ``mode``, ``units`` and, if
+            there are any, ``waypoints``
+        '''
+        args = {'origin': self.origin,
+                'destination': self.destination,
+                'mode': 'driving',
+                'units': 'metric'}
         wpts = self.waypoints
-        if wpts is None:
-            dir_result = gmaps.directions(origin=self.origin,
-                                          destination=self.destination,
-                                          mode="driving",
-                                          units="metric")
-        else:
-            dir_result = gmaps.directions(origin=self.origin,
-                                          destination=self.destination,
-                                          waypoints=wpts,
-                                          mode="driving",
-                                          units="metric")
+        if wpts is not None:
+            args['waypoints'] = wpts
+        return args
+
+    def _parse_legs(self, dir_result):
+        '''
+        Gets the distance and duration of each leg from a ``directions()``
+        result for the slice
+
+        Args:
+            dir_result (list): Result of the ``directions()`` request
+
+        Returns:
+            dist (np.array): Distance of each leg in metres, one per pair of
+                consecutive points in the slice; all ``NaN`` if the result
+                has no or the wrong number of legs
+            duration (np.array): Duration taken to drive each leg in seconds,
+                as for ``dist``
+        '''
+        n_legs = len(self.coords) - 1
+        dist = np.full(max(n_legs, 0), np.nan)
+        dur = np.full(max(n_legs, 0), np.nan)
+        if n_legs <= 0:
+            return dist, dur
 
         if len(dir_result) == 0:
             print('No direction result found for')
             print(f'origin {self.origin} and '
                   + f'destination {self.destination}')
-            return 0, 0, []
-
-        if 'legs' in dir_result[0]:
-            for leg in dir_result[0]['legs']:
-                dist = leg['distance']['value']
-                dur = leg['duration']['value']
+            return dist, dur
 
-        else:
-            print('No `legs` found in dir_result[0] for')
+        legs = dir_result[0].get('legs')
+        if not legs or len(legs) != n_legs:
+            print(f'Expected {n_legs} `legs` in dir_result[0] for')
             print(f'origin {self.origin} and '
                   + f'destination {self.destination}')
-            return 0, 0, []
+            return dist, dur
 
+        dist[:] = [leg['distance']['value'] for leg in legs]
+        dur[:] = [leg['duration']['value'] for leg in legs]
         return dist, dur
 
 
-def get_drive_distdur(apikey, tour_slices):
+def get_drive_legs(apikey, tour_slices, workers=directions._WORKERS,
+                   rate=directions._RATE, retries=directions._RETRIES,
+                   cache=None):
+    '''
+    Gets the driving distance and duration of each leg of the tour for the
+    given list of TourSlices, aligned with tour positions so that leg ``i``
+    is from tour point ``i`` to point ``i + 1``. A leg shared by more than
+    one slice is only counted once, and a leg not in any slice (e.g. between
+    slices that do not overlap) or in a slice that failed is ``NaN``. The
+    slices are requested concurrently within a rate limit, retrying failed
+    requests (see ``lib.directions.fetch_directions``); a warning is printed
+    for each slice that still fails. Slices of a single point have no legs
+    and are not requested.
+
+    Args:
+        apikey (str or client): Google API key to use for the Google
+            Directions service, or any client object with a ``directions()``
+            method e.g. a stub for testing
+        tour_slices (list of TourSlice): A list of TourSlices in tour order.
+            Slices without a ``start`` tour position are taken to start at
+            the destination of the previous slice
+
+    Optional:
+        workers (int): Number of requests in flight at once. Defaults to 8.
+        rate (float): Most requests per second. Defaults to 10.
+        retries (int): Number of retries after a failed request. Defaults to
+            3.
+        cache (DirectionsCache or str): Cache of directions results, or path
+            to its SQLite database, so that slices already fetched make no
+            network calls. Defaults to ``None`` for no cache.
+
+    Returns:
+        dist (np.array): Distance of each leg in metres
+        duration (np.array): Duration taken to drive each leg in seconds
+    '''
+    gmaps = googlemaps.Client(key=apikey) if isinstance(apikey, str) \
+        else apikey
+    if cache is not None:
+        gmaps = directions.CachedClient(gmaps, cache)
+    tour_slices = list(tour_slices)
+
+    # A slice of one point has no legs, so it is not requested
+    sent = [i for i, ts in enumerate(tour_slices) if len(ts) > 1]
+    sent_results, failed = directions.fetch_directions(
+        gmaps, [tour_slices[i].directions_args() for i in sent],
+        workers=workers, rate=rate, retries=retries)
+    for slicei, error in failed:
+        print(f'WARNING: get_drive_legs() slice {sent[slicei]} failed: '
+              + f'{error}')
+
+    results = [None] * len(tour_slices)
+    for i, dir_result in zip(sent, sent_results):
+        results[i] = dir_result
+
+    starts = []
+    start = 0
+    for tour_slice in tour_slices:
+        start = start if tour_slice.start is None else tour_slice.start
+        starts.append(start)
+        start += len(tour_slice) - 1
+
+    n_legs = max([s + len(ts) - 1 for s, ts in zip(starts, tour_slices)]
+                 + [0])
+    dist = np.full(n_legs, np.nan)
+    dur = np.full(n_legs, np.nan)
+    for start, tour_slice, dir_result in zip(starts, tour_slices, results):
+        if dir_result is None:
+            continue
+        slice_dist, slice_dur = tour_slice._parse_legs(dir_result)
+
+        # Assign rather than add, so that shared legs are not double counted
+        legs = slice(start, start + len(slice_dist))
+        dist[legs] = np.where(np.isnan(slice_dist), dist[legs], slice_dist)
+        dur[legs] = np.where(np.isnan(slice_dur), dur[legs], slice_dur)
+
+    return dist, dur
+
+
+def get_drive_distdur(apikey, tour_slices, workers=directions._WORKERS,
+                      rate=directions._RATE, retries=directions._RETRIES,
+                      cache=None):
     '''
     Gets the total tour distance and duration for the given list of
     TourSlices. Use slices as the Google Maps API can only handle a certain
     number of waypoints to decode. Hence, if dealing with many points, then
-    slice up the tour into smaller pieces.
+    slice up the tour into smaller pieces. Sums the legs from
+    ``get_drive_legs()``, so a leg shared between slices is counted once. A
+    warning is printed if any leg is missing, e.g. from a slice that failed
+    or between slices that do not overlap, as the totals then leave it out.
 
     Args:
-        apikey (str): Google API key to use for the Google Directions
-            service
+        apikey (str or client): Google API key to use for the Google
+            Directions service, or any client object with a ``directions()``
+            method e.g. a stub for testing
         tour_slices (list of TourSlice): A list of TourSlices, where each
             slice contains latitude and longitude coordinate tuples for an
             origin, destination and an (optional) list of waypoints
 
+    Optional:
+        workers (int): Number of requests in flight at once. Defaults to 8.
+        rate (float): Most requests per second. Defaults to 10.
+        retries (int): Number of retries after a failed request. Defaults to
+            3.
+        cache (DirectionsCache or str): Cache of directions results, or path
+            to its SQLite database, so that slices already fetched make no
+            network calls. Defaults to ``None`` for no cache.
+
     Returns:
         dist (numeric): Total distance of the tour_slices in metres
         duration (numeric): Total duration taken to drive the tour_slice in
             seconds
     '''
-
-    slicei = 0
-    tdist = 0
-    tdur = 0
-    gmaps = googlemaps.Client(key=apikey)
-
-    for tour_slice in tour_slices:
-        dist, dur = tour_slice.get_slice_drivedistdur(gmaps)
-        tdist += dist
-        tdur += dur
-        slicei += 1
-
-    return tdist, tdur
+    dist, dur = get_drive_legs(apikey, tour_slices, workers=workers,
+                               rate=rate, retries=retries, cache=cache)
+    missing = np.count_nonzero(np.isnan(dist) | np.isnan(dur))
+    if missing:
+        print(f'WARNING: get_drive_distdur() {missing:,} of {len(dist):,} '
+              + 'legs are missing from the totals')
+    return np.nansum(dist), np.nansum(dur)
@@ -6,11 +6,18 @@ This module contains utility type functions of use to the broader modulel.
 This file  contains the following functions:
 
     * _get - Get the value of any of the provided keys for the given dictionary
+    * _encode_polyline - Encode coordinates as a Google encoded polyline
+    * _encode_float32 - Encode coordinates as a base64 Float32Array
 
 """
 
+import base64
 import numpy as np
 
+# Most decimal places kept by ``_encode_polyline()``, so that every encoded
+# value is still exact as a JavaScript number when decoded by ``decode.js``
+_POLYLINE_MAX_PRECISION = 10
+
 
 def _get(dict, keys, default=None, get_key=False):
     '''
@@ -49,6 +56,68 @@ def _format_jscounty(name, state, seat):
         + f'seat: \"{seat}\" }}'
 
 
+def _encode_polyline(lat, lon, precision=5):
+    '''
+    Encodes coordinates with the Google encoded polyline algorithm, for all
+    points at once.
+
+    Parameters:
+        lat (np.array): Latitudes in degrees
+        lon (np.array): Longitudes in degrees
+
+    Optional:
+        precision (int): Number of decimal places kept, up to
+            ``_POLYLINE_MAX_PRECISION``. Defaults to 5, as used by Google.
+
+    Returns:
+        str: Encoded polyline
+
+    Raises:
+        ValueError: If any coordinate is missing, or ``precision`` is out of
+            range
+    '''
+    if not 0 <= precision <= _POLYLINE_MAX_PRECISION:
+        raise ValueError(f'Polyline precision ``{precision}`` is not '
+                         + f'within 0 to {_POLYLINE_MAX_PRECISION}')
+
+    coords = np.column_stack((lat, lon)).astype(np.float64)
+    if not np.isfinite(coords).all():
+        raise ValueError('Can not encode missing coordinates as a polyline')
+
+    # Interleaved lat, lon deltas from the previous point, zigzag encoded
+    values = np.round(coords * 10 ** precision).astype(np.int64)
+    values = np.diff(values, axis=0, prepend=0).ravel()
+    values = np.where(values < 0, ~(values << 1), values << 1)
+
+    # Split each value into 5-bit chunks, least significant first, and flag
+    # all but the last chunk of each value as continued
+    width = max(1, -(-int(values.max(initial=0)).bit_length() // 5))
+    shifts = 5 * np.arange(width)
+    chunks = (values[:, None] >> shifts) & 0x1f
+    n_chunks = 1 + np.count_nonzero((values[:, None] >> shifts[1:]) > 0,
+                                    axis=1)
+    used = np.arange(width) < n_chunks[:, None]
+    more = np.arange(width) < (n_chunks - 1)[:, None]
+    chars = (chunks | np.where(more, 0x20, 0)) + 63
+    return chars[used].astype(np.uint8).tobytes().decode('ascii')
+
+
+def _encode_float32(lat, lon):
+    '''
+    Encodes coordinates as base64 of interleaved little-endian float32
+    latitude and longitude, for decoding into a JavaScript Float32Array
+
+    Parameters:
+        lat (np.array): Latitudes in degrees
+        lon (np.array): Longitudes in degrees
+
+    Returns:
+        str: Base64 encoded coordinates
+    '''
+    coords = np.column_stack((lat, lon)).astype('<f4')
+    return base64.b64encode(coords.tobytes()).decode('ascii')
+
+
 def _unique_non_null(s):
     '''
     Returns unique values excluding ``NaN`` values.
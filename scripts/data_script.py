@@ -86,6 +86,7 @@ print(f'Full data set has {nseats:,} seats '
 # Write full data set to data dir for later use
 tour_path_csv = os.path.join(data_in_dir, 'visit_data.csv')
 tour.write_csv(tour_path_csv)
+tour.save(os.path.join(data_in_dir, 'visit_data'))
 
 # Only interested in a tour of the continental 48 plus DC
 keep_states = ['AL', 'AZ', 'AR', 'CA', 'CO', 'CT', 'DE', 'DC', 'FL', 'GA',
@@ -108,11 +109,12 @@ print('For the continental 48 plus DC, '
       + f'looking to visit {len(tour):,} counties '
       + f'with {len(tour) - nseats:,} counties with no seats')
 
-tour.find_tour(time_bound=10)
+tour.find_tour(time_bound=10, polish=True)
 
 data_out_dir = './out'
 tour_path_csv = os.path.join(data_out_dir, 'tour.csv')
 tour.write_csv(tour_path_csv)
+tour.save(os.path.join(data_out_dir, 'tour'))
 
 tour_path_js = os.path.join(data_out_dir, 'tour.js')
-tour.write_js(tour_path_js)
+tour.write_js(tour_path_js, fmt='polyline')
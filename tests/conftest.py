@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""Test fixtures
+
+Shared fixtures for the test suite. Tours are built from random points in the
+continental US so that no downloaded data is needed.
+
+"""
+
+import numpy as np
+import pytest
+
+from lib import utils
+from lib.tourroute import TourRoute
+
+
+def make_tour(n, random_seed=0):
+    '''
+    Makes a TourRoute of random points in the continental US, visiting the
+    county points in the order added
+
+    Parameters:
+        n (int): Number of points
+
+    Optional:
+        random_seed (int): Random seed. Defaults to 0.
+
+    Returns:
+        TourRoute
+    '''
+    rng = np.random.default_rng(random_seed)
+    gids = np.arange(1, n + 1) * 7
+    tr = TourRoute()
+    tr.add_points(gid_county=gids,
+                  name_county=[f'County {g}' for g in gids],
+                  lat_county=rng.uniform(30, 48, n),
+                  lon_county=rng.uniform(-120, -75, n),
+                  state=rng.choice(['CA', 'NY', 'TX', 'KS'], n),
+                  cat_code=[f'US.CA.{g % 1000:03d}' for g in gids],
+                  fips_code=gids,
+                  name_seat=[f'Seat {g}' if g % 3 else None for g in gids],
+                  gid_seat=np.where(gids % 3, gids + 1, np.nan),
+                  lat_seat=np.where(gids % 3, rng.uniform(30, 48, n), np.nan),
+                  lon_seat=np.where(gids % 3, rng.uniform(-120, -75, n),
+                                    np.nan))
+    tr.update_visit_points()
+    return tr
+
+
+def make_legs(tour):
+    '''
+    Computes the leg distances of a TourRoute from scratch, in tour order
+
+    Parameters:
+        tour (TourRoute): TourRoute with visit points
+
+    Returns:
+        np.array of distances in kilometres
+    '''
+    data = tour.get_cols(['lat_visit', 'lon_visit'])
+    lat = np.radians(data.lat_visit.to_numpy())
+    lon = np.radians(data.lon_visit.to_numpy())
+    return utils.haversine(lat, lon, np.roll(lat, -1), np.roll(lon, -1),
+                           to_radians=False)
+
+
+@pytest.fixture
+def tour():
+    '''TourRoute of 300 random points'''
+    return make_tour(300)
@@ -0,0 +1,292 @@
+# -*- coding: utf-8 -*-
+"""Tests for the Geonames and FIPS downloads, against a local HTTP server"""
+
+import hashlib
+import io
+import json
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from lib import datagather
+from zipfile import ZipFile
+
+
+class _Handler(BaseHTTPRequestHandler):
+    '''
+    Serves ``server.body`` with an ETag, answering conditional and range
+    requests. If ``server.cut`` is set, the next response is cut off after
+    that many bytes.
+    '''
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append(dict(self.headers))
+        body = server.body
+        etag = server.etag
+
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        start = 0
+        rng = self.headers.get('Range')
+        if rng and self.headers.get('If-Range') == etag:
+            start = int(rng.split('=')[1].rstrip('-'))
+            if start >= len(body):
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{len(body)}')
+                self.end_headers()
+                return
+
+        self.send_response(206 if start else 200)
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(body) - start))
+        if start:
+            self.send_header('Content-Range',
+                             f'bytes {start}-{len(body) - 1}/{len(body)}')
+        self.end_headers()
+
+        cut, server.cut = server.cut, None
+        self.wfile.write(body[start:] if cut is None
+                         else body[start:start + cut])
+        self.wfile.flush()
+        if cut is not None:
+            self.close_connection = True
+
+
+@pytest.fixture
+def server():
+    '''Local HTTP server standing in for the data source'''
+    srv = ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+    srv.body = os.urandom(300000)
+    srv.etag = '"v1"'
+    srv.cut = None
+    srv.requests = []
+    srv.url = f'http://127.0.0.1:{srv.server_port}/US.zip'
+    thread = threading.Thread(target=srv.serve_forever, args=(0.01,),
+                              daemon=True)
+    thread.start()
+    yield srv
+    srv.shutdown()
+    srv.server_close()
+
+
+def _read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def _manifest(path):
+    with open(os.path.join(os.path.dirname(path),
+                           datagather._DL_MANIFEST)) as f:
+        return json.load(f)
+
+
+def test_download_then_unchanged(server, tmp_path):
+    path = str(tmp_path / 'dl' / 'US.zip')
+    assert datagather._download(server.url, path) is True
+    assert _read(path) == server.body
+    entry = _manifest(path)['US.zip']
+    assert entry['sha256'] == hashlib.sha256(server.body).hexdigest()
+    assert entry['etag'] == server.etag
+
+    assert datagather._download(server.url, path) is False
+    assert server.requests[-1]['If-None-Match'] == server.etag
+
+
+def test_changed_source_downloaded_again(server, tmp_path):
+    path = str(tmp_path / 'US.zip')
+    datagather._download(server.url, path)
+    server.body = os.urandom(1000)
+    server.etag = '"v2"'
+    assert datagather._download(server.url, path) is True
+    assert _read(path) == server.body
+
+
+def test_resume_after_interruption(server, tmp_path):
+    path = str(tmp_path / 'US.zip')
+    server.cut = 100000
+    with pytest.raises(Exception):
+        datagather._download(server.url, path, chunk_size=1 << 12)
+    done = os.path.getsize(path + datagather._DL_PART)
+    assert 0 < done <= 100000
+
+    assert datagather._download(server.url, path, chunk_size=1 << 12)
+    assert server.requests[-1]['Range'] == f'bytes={done}-'
+    assert server.requests[-1]['If-Range'] == server.etag
+    assert _read(path) == server.body
+    assert not os.path.exists(path + datagather._DL_PART)
+
+
+def test_resume_of_changed_source_restarts(server, tmp_path):
+    path = str(tmp_path / 'US.zip')
+    server.cut = 100000
+    with pytest.raises(Exception):
+        datagather._download(server.url, path, chunk_size=1 << 12)
+    server.body = os.urandom(200000)
+    server.etag = '"v2"'
+
+    assert datagather._download(server.url, path)
+    assert _read(path) == server.body
+
+
+def test_range_not_satisfiable_restarts(server, tmp_path):
+    path = str(tmp_path / 'US.zip')
+    server.cut = 100000
+    with pytest.raises(Exception):
+        datagather._download(server.url, path, chunk_size=1 << 12)
+    # A partial file as long as the source gets a 416
+    with open(path + datagather._DL_PART, 'wb') as f:
+        f.write(server.body)
+
+    assert datagather._download(server.url, path)
+    assert [r.get('Range') is not None for r in server.requests[-2:]] \
+        == [True, False]
+    assert _read(path) == server.body
+
+
+def test_corrupt_copy_downloaded_again(server, tmp_path):
+    path = str(tmp_path / 'US.zip')
+    datagather._download(server.url, path)
+    with open(path, 'r+b') as f:
+        f.write(b'x')
+
+    assert datagather._download(server.url, path) is True
+    assert 'If-None-Match' not in server.requests[-1]
+    assert _read(path) == server.body
+
+
+def test_checksum(server, tmp_path):
+    path = str(tmp_path / 'US.zip')
+    digest = hashlib.sha256(server.body).hexdigest()
+    with pytest.raises(ValueError):
+        datagather._download(server.url, path, sha256='00')
+    assert not os.path.exists(path)
+    assert not os.path.exists(path + datagather._DL_PART)
+
+    assert datagather._download(server.url, path, sha256=digest.upper())
+    assert datagather._download(server.url, path, sha256=digest) is False
+
+    # An unchanged file is still checked against the expected checksum
+    with pytest.raises(ValueError):
+        datagather._download(server.url, path, sha256='00')
+    assert 'If-None-Match' not in server.requests[-1]
+
+
+def test_remove_gndata_keeps_downloads(server, tmp_path):
+    path = str(tmp_path / 'US.zip')
+    datagather._download(server.url, path)
+    (tmp_path / 'US.txt').write_text('x')
+    (tmp_path / 'other.zip').write_text('x')
+
+    datagather.remove_gndata(str(tmp_path))
+    assert sorted(os.listdir(tmp_path)) == ['US.zip',
+                                            datagather._DL_MANIFEST]
+    datagather.remove_gndata(str(tmp_path), keep_downloads=False)
+    assert os.listdir(tmp_path) == [datagather._DL_MANIFEST]
+
+
+# Tab separated rows in the layout of the Geonames country files
+_GN_ROWS = [
+    (4046704, 'Fort Hall Mine', 'P', 'PPL', 'ID', '011'),
+    (5332921, 'Alameda County', 'A', 'ADM2', 'CA', '001'),
+    (5322745, 'Oakland', 'P', 'PPLA2', 'CA', '001'),
+    (5359071, 'Inyo County', 'A', 'ADM2', 'CA', '027'),
+    (11497201, 'Orange', 'P', 'PPLA2', 'CA', '059'),
+    (5465283, 'Doña Ana County', 'A', 'ADM2', 'NM', '013'),
+    (4273837, 'Logan County', 'A', 'ADM2', 'KS', '109'),
+    (4274994, 'Oakley', 'P', 'PPLA2', 'KS', '063'),
+    (5128581, 'New York City', 'P', 'PPL', 'NY', '061'),
+]
+
+
+def _gn_zip(rows):
+    lines = [f'{gid}\t{name}\t{name}\t\t37.5\t-120.25\t{f_class}\t{f_code}'
+             + f'\tUS\t\t{state}\t{county}\t\t\t0\t\t10\tAmerica/X\t2020-12-31'
+             for gid, name, f_class, f_code, state, county in rows]
+    buf = io.BytesIO()
+    with ZipFile(buf, 'w') as z:
+        z.writestr('US.txt', '\n'.join(lines) + '\n')
+    return buf.getvalue()
+
+
+@pytest.mark.parametrize('chunksize', [2, 100])
+def test_dl_county_data(server, tmp_path, chunksize):
+    server.body = _gn_zip(_GN_ROWS)
+    path = tmp_path / 'gn' / 'counties.csv'
+    data = datagather.dl_county_data(server.url, str(path),
+                                     chunksize=chunksize)
+
+    # The first line is taken as the header, as in the source files
+    gids = set(data.gid)
+    assert gids == {5332921, 5322745, 5359071, 5465283, 4273837, 4274994,
+                    9999999}
+    data = data.set_index('gid')
+    assert data.loc[5465283, 'name'] == 'Dona Ana County'
+    assert data.loc[5322745, 'cat_code'] == 'US.CA.001'
+    assert data.loc[9999999, 'cat_code'] == 'US.CA.027'
+    assert data.loc[4274994, 'cat_code'] == 'US.KS.109'
+    assert data.loc[4274994, 'cat_key'] == data.loc[4273837, 'cat_key']
+    assert data.loc[5322745, 'cat_key'] != data.loc[5359071, 'cat_key']
+    assert os.path.exists(path)
+
+
+def test_cat_key():
+    keys = datagather._cat_key(pd.Series(['US', 'US', 'US', 'CA', 'US']),
+                               pd.Series(['CA', 'CA', 'NY', 'CA', 'CA']),
+                               pd.Series([27, 27, 27, 27, 1]))
+    assert keys.dtype == np.int64
+    assert keys[0] == keys[1]
+    assert len(set(keys[1:])) == 4
+    assert keys[0] == (ord('U') << 40 | ord('S') << 32 | ord('C') << 24
+                       | ord('A') << 16 | 27)
+
+
+def _gn_frame():
+    rows = [(5332921, 'Alameda County', 'ADM2', 'CA', 1, 37.6, -121.9),
+            (5322745, 'Oakland', 'PPLA2', 'CA', 1, 37.8, -122.3),
+            (5359071, 'Inyo County', 'ADM2', 'CA', 27, 36.5, -117.4),
+            (4273837, 'Logan County', 'ADM2', 'KS', 109, 38.9, -101.1),
+            (4274994, 'Oakley', 'PPLA2', 'KS', 109, 39.1, -100.9)]
+    data = pd.DataFrame(rows, columns=['gid', 'name', 'f_code', 'state',
+                                       'county', 'lat', 'lon'])
+    data['f_class'] = np.where(data.f_code == 'ADM2', 'A', 'P')
+    data['country'] = 'US'
+    data['cat_code'] = 'US.' + data.state + '.' \
+        + data.county.astype(str).str.zfill(3)
+    return data.astype({'name': object, 'state': object, 'f_code': object,
+                        'f_class': object, 'country': object,
+                        'cat_code': object})
+
+
+@pytest.mark.parametrize('with_key', [True, False])
+def test_prep_data_joins_seats(with_key):
+    data = _gn_frame()
+    if with_key:
+        data['cat_key'] = datagather._cat_key(data.country, data.state,
+                                              data.county)
+    fips = pd.DataFrame({'fips_code': [6001, 6027, 20109],
+                         'state': ['CA', 'CA', 'KS'],
+                         'name': ['Alameda County', 'Inyo County',
+                                  'Logan County']})
+    fips = fips.astype({'state': object, 'name': object})
+
+    tour = datagather.prep_data(data, fips)
+    got = tour.get_cols(['gid_county', 'cat_code', 'fips_code', 'gid_seat',
+                         'name_visit']).set_index('gid_county')
+    assert list(got.cat_code) == ['US.CA.001', 'US.CA.027', 'US.KS.109']
+    assert list(got.fips_code) == [6001, 6027, 20109]
+    assert got.loc[5332921, 'gid_seat'] == 5322745
+    assert got.loc[4273837, 'gid_seat'] == 4274994
+    assert pd.isna(got.loc[5359071, 'gid_seat'])
+    assert got.loc[5359071, 'name_visit'] == 'Inyo County'
+    assert got.loc[5332921, 'name_visit'] == 'Oakland'
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""Tests for concurrent directions fetching and the directions cache"""
+
+import threading
+
+from lib import directions
+
+
+class StubClient():
+    '''
+    Client whose ``directions()`` returns one leg per waypoint gap, with the
+    origin as the distance, and fails the first ``fails`` calls for each
+    origin
+    '''
+
+    def __init__(self, fails=0):
+        self.fails = fails
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def directions(self, origin, destination, waypoints=None, **kwargs):
+        with self._lock:
+            self.calls.append(origin)
+            attempt = self.calls.count(origin)
+        if attempt <= self.fails:
+            raise TimeoutError(f'Attempt {attempt} for {origin}')
+
+        n_legs = 1 + len(waypoints or [])
+        return [{'legs': [{'distance': {'value': origin[0]},
+                           'duration': {'value': k}}
+                          for k in range(n_legs)]}]
+
+
+def _requests(n):
+    return [{'origin': (float(i), 0.0), 'destination': (float(i), 1.0),
+             'waypoints': [(float(i), 0.5)] * (i % 3)}
+            for i in range(n)]
+
+
+def _no_sleep(seconds):
+    pass
+
+
+def test_results_in_request_order():
+    requests = _requests(50)
+    results, failed = directions.fetch_directions(
+        StubClient(), requests, workers=8, rate=1e5, sleep=_no_sleep)
+    assert failed == []
+    for request, result in zip(requests, results):
+        legs = result[0]['legs']
+        assert len(legs) == 1 + len(request['waypoints'])
+        assert legs[0]['distance']['value'] == request['origin'][0]
+
+
+def test_retries_then_succeeds():
+    client = StubClient(fails=2)
+    results, failed = directions.fetch_directions(
+        client, _requests(10), rate=1e5, retries=2, backoff=0,
+        sleep=_no_sleep)
+    assert failed == []
+    assert all(r is not None for r in results)
+    assert len(client.calls) == 30
+
+
+def test_failures_reported_after_retries():
+    results, failed = directions.fetch_directions(
+        StubClient(fails=5), _requests(4), rate=1e5, retries=1, backoff=0,
+        sleep=_no_sleep)
+    assert results == [None] * 4
+    assert [i for i, _ in failed] == [0, 1, 2, 3]
+    assert all(isinstance(e, TimeoutError) for _, e in failed)
+
+
+def test_cache_hits_make_no_calls_and_take_no_tokens():
+    stub = StubClient()
+    cache = directions.DirectionsCache(':memory:')
+    client = directions.CachedClient(stub, cache)
+    requests = _requests(20)
+    first, _ = directions.fetch_directions(client, requests, rate=1e5,
+                                           sleep=_no_sleep)
+    assert len(stub.calls) == 20
+
+    # A rate of one request a second would make any token taken sleep
+    slept = []
+    second, failed = directions.fetch_directions(
+        client, requests, rate=1, burst=1, sleep=slept.append)
+    assert failed == []
+    assert len(stub.calls) == 20
+    assert slept == []
+    assert second == first
+    assert cache.stats() == {'hits': 20, 'misses': 20, 'entries': 20}
+
+
+def test_cache_expiry_and_eviction():
+    now = [0.0]
+    cache = directions.DirectionsCache(':memory:', ttl=10, max_entries=2,
+                                       clock=lambda: now[0])
+    a, b, c = _requests(3)
+    cache.put(a, [(1, 2)])
+    now[0] = 1
+    cache.put(b, [(3, 4)])
+    now[0] = 2
+    assert cache.get(a) == [(1, 2)]
+    now[0] = 3
+    cache.put(c, [(5, 6)])
+    # b was least recently used
+    assert cache.get(b) is None
+    assert len(cache) == 2
+    now[0] = 20
+    assert cache.get(a) is None
+
+
+def test_cache_key_rounds_coordinates():
+    a = {'origin': (40.1234561, -73.0), 'destination': (41.0, -74.0)}
+    b = {'origin': (40.1234559, -73.0), 'destination': (41.0, -74.0)}
+    assert directions.DirectionsCache.key(a) == \
+        directions.DirectionsCache.key(b)
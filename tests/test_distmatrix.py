@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+"""Tests for the condensed distance matrix"""
+
+import numpy as np
+import pytest
+
+from lib import utils
+from lib.distmatrix import DistMatrix
+
+
+def _points(n, random_seed=0):
+    rng = np.random.default_rng(random_seed)
+    return rng.uniform(30, 48, n), rng.uniform(-120, -75, n)
+
+
+@pytest.mark.parametrize('cached', [False, True])
+def test_matches_haversine(tmp_path, cached):
+    lat, lon = _points(300)
+    dm = DistMatrix.from_coords(lat, lon,
+                                cache_dir=tmp_path if cached else None)
+    lat, lon = np.radians(lat), np.radians(lon)
+    full = utils.haversine(lat[:, None], lon[:, None], lat[None, :],
+                           lon[None, :], to_radians=False)
+    assert np.allclose(dm.square(), full, rtol=1e-5, atol=1e-2)
+    assert np.allclose(dm[[0, 5, 7], [9, 5, 2]], full[[0, 5, 7], [9, 5, 2]],
+                       rtol=1e-5)
+    assert np.allclose(dm.row(3), full[3], rtol=1e-5, atol=1e-2)
+
+
+def test_cache_is_reused(tmp_path):
+    lat, lon = _points(50)
+    first = DistMatrix.from_coords(lat, lon, cache_dir=tmp_path)
+    files = list(tmp_path.iterdir())
+    second = DistMatrix.from_coords(lat, lon, cache_dir=tmp_path)
+    assert list(tmp_path.iterdir()) == files
+    assert isinstance(second.data, np.memmap)
+    assert np.array_equal(first.data, second.data)
+    assert len(DistMatrix.open(files[0])) == 50
+
+
+@pytest.mark.parametrize('n', [0, 1, 2])
+def test_few_points(tmp_path, n):
+    lat, lon = _points(n)
+    dm = DistMatrix.from_coords(lat, lon, cache_dir=tmp_path)
+    assert len(dm) == n
+    assert dm.square().shape == (n, n)
+    if n:
+        assert dm[0, 0] == 0
+        assert np.array_equal(dm.row(0)[:1], [0])
+    with pytest.raises(IndexError):
+        dm[0, n]
+
+
+def test_open_empty_needs_n(tmp_path):
+    path = tmp_path / 'empty.npy'
+    np.save(path, np.empty(0, dtype=np.float32))
+    with pytest.raises(ValueError):
+        DistMatrix.open(path)
+    assert len(DistMatrix.open(path, n=1)) == 1
+    with pytest.raises(ValueError):
+        DistMatrix.open(path, n=3)
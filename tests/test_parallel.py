@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""Tests for the parallel solvers"""
+
+import multiprocessing
+import time
+
+import numpy as np
+
+from datetime import datetime
+from lib import parallel
+
+
+def _points(n, random_seed=0):
+    rng = np.random.default_rng(random_seed)
+    return rng.uniform(30, 48, n), rng.uniform(-120, -75, n)
+
+
+def _slow_worker(name, n, engine, seed, time_bound, perturb, idx=None):
+    '''Solve that returns at once for seed 0 and runs on for other seeds'''
+    if seed != 0:
+        time.sleep(60)
+    return {'seed': int(seed), 'tour': np.arange(n), 'length': 1.0,
+            'seconds': 0.0, 'compile_seconds': 0.0, 'success': True}
+
+
+def test_multistart_keeps_shortest():
+    lat, lon = _points(300)
+    tour, success, starts = parallel.solve_multistart(
+        lat, lon, [1, 2, 3], workers=2)
+    assert np.array_equal(np.sort(tour), np.arange(300))
+    assert sorted(s['seed'] for s in starts) == [1, 2, 3]
+    best = [s for s in starts if s['best']]
+    assert len(best) == 1
+    assert best[0]['length'] == min(s['length'] for s in starts)
+
+
+def test_multistart_target_stops_running_solves(monkeypatch):
+    monkeypatch.setattr(parallel, '_solve_worker', _slow_worker)
+    lat, lon = _points(10)
+    start_time = datetime.now()
+    tour, success, starts = parallel.solve_multistart(
+        lat, lon, [1, 0, 2], engine='builtin', workers=3, target_length=2)
+    assert (datetime.now() - start_time).total_seconds() < 30
+    assert [s['seed'] for s in starts] == [0]
+    assert multiprocessing.active_children() == []
+
+
+def test_multistart_wall_time_stops_running_solves(monkeypatch):
+    monkeypatch.setattr(parallel, '_solve_worker', _slow_worker)
+    lat, lon = _points(10)
+    start_time = datetime.now()
+    tour, success, starts = parallel.solve_multistart(
+        lat, lon, [0, 1, 2], engine='builtin', workers=3, wall_time=2)
+    assert 2 <= (datetime.now() - start_time).total_seconds() < 30
+    assert [s['seed'] for s in starts] == [0]
+    assert multiprocessing.active_children() == []
+
+
+def test_clustered_is_permutation():
+    lat, lon = _points(600)
+    tour, stats = parallel.solve_clustered(lat, lon, n_clusters=3,
+                                           workers=2)
+    assert np.array_equal(np.sort(tour), np.arange(600))
+    assert stats['clusters'] == 3
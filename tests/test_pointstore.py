@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""Tests for the columnar point store"""
+
+import numpy as np
+import pandas as pd
+
+from lib import pointstore
+from lib.pointstore import _PointStore
+from tests.conftest import make_tour
+
+_DTYPES = {'gid': np.int64, 'name': object, 'lat': np.float64,
+           'code': np.float64}
+
+_VIEW_DTYPES = {'code': 'Int64'}
+
+
+def _store():
+    return _PointStore(_DTYPES, _VIEW_DTYPES)
+
+
+def _check_dtypes(store):
+    for col, dtype in _DTYPES.items():
+        assert store.column(col).dtype == dtype
+    df = store.frame()
+    assert df.gid.dtype == np.int64
+    assert df.lat.dtype == np.float64
+    assert df.code.dtype == 'Int64'
+
+
+def test_growth_past_capacity():
+    store = _store()
+    assert store.capacity == 0
+    capacities = []
+    for i in range(300):
+        store.append({'gid': [i], 'name': [f'P{i}'], 'lat': [i / 10],
+                      'code': [i * 2]})
+        capacities.append(store.capacity)
+
+    # Capacity grows geometrically from the minimum, not once per append
+    grown = sorted(set(capacities))
+    assert grown[0] == pointstore._MIN_CAPACITY
+    assert np.all(np.diff(grown) / grown[:-1] >= pointstore._GROWTH_FACTOR - 1)
+    assert len(grown) <= 4 and store.capacity >= 300
+
+    assert len(store) == 300
+    assert np.array_equal(store.column('gid'), np.arange(300))
+    assert list(store.column('name')[[0, 63, 64, 299]]) == \
+        ['P0', 'P63', 'P64', 'P299']
+    assert np.allclose(store.column('lat'), np.arange(300) / 10)
+
+
+def test_append_returns_rows_and_fills_missing():
+    store = _store()
+    assert list(store.append({'gid': [5, 6]})) == [0, 1]
+    assert list(store.append({'gid': [7], 'code': [3]})) == [2]
+    df = store.frame()
+    assert df.lat.isna().all()
+    assert list(df.code.isna()) == [True, True, False]
+
+
+def test_dtypes_kept_across_add_and_delete():
+    store = _store()
+    store.append({'gid': pd.Series([1, 2, 3]), 'name': ['a', None, 'c'],
+                  'lat': [1, 2, 3], 'code': pd.array([10, None, 30],
+                                                     dtype='Int64')})
+    _check_dtypes(store)
+
+    remap = store.delete([1])
+    assert list(remap) == [0, -1, 1]
+    _check_dtypes(store)
+    assert list(store.frame().code) == [10, 30]
+
+    store.append({'gid': [4], 'name': ['d'], 'lat': [4.5], 'code': [None]})
+    store.delete(np.array([True, False, False]))
+    _check_dtypes(store)
+    df = store.frame()
+    assert list(df.gid) == [3, 4]
+    assert list(df.name) == ['c', 'd']
+    assert df.code.isna().tolist() == [False, True]
+
+
+def test_frame_cache_dropped_on_change():
+    store = _store()
+    store.append({'gid': [1, 2]})
+    df = store.frame()
+    assert store.frame() is df
+
+    version = store.version
+    store.set('lat', [1], 5.0)
+    assert store.version > version
+    assert store.frame() is not df
+    assert list(store.frame().lat.isna()) == [True, False]
+
+
+def test_rotate_and_reverse_keep_store_rows():
+    tour = make_tour(50)
+    gids = tour.get_cols('gid_county').gid_county.to_numpy()
+    stored = tour._store.column('gid_county').copy()
+
+    def order():
+        return tour.get_cols('gid_county').gid_county.to_numpy()
+
+    tour.rotate(gids[10])
+    assert np.array_equal(order(), np.roll(gids, -10))
+
+    # Keeping the start reverses the tour behind the first point
+    tour.reverse()
+    rotated = np.roll(gids, -10)
+    assert np.array_equal(order(), np.r_[rotated[:1], rotated[:0:-1]])
+
+    # Otherwise the last point becomes the first
+    tour.reverse(keep_start=False)
+    assert np.array_equal(order(), np.r_[rotated[1:], rotated[:1]])
+
+    # Only the permutation and offset change, never the stored rows
+    assert np.array_equal(tour._store.column('gid_county'), stored)
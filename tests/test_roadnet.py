@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""Tests for the local road network router"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+
+from lib.roadnet import RoadNetwork
+
+
+def _network(n=200, k=3, oneway=0.3, weight='duration', random_seed=0):
+    '''Makes a random road graph linking each node to nearby nodes'''
+    rng = np.random.default_rng(random_seed)
+    lat = rng.uniform(40, 41, n)
+    lon = rng.uniform(-75, -74, n)
+    near = np.argsort((lat[:, None] - lat) ** 2 + (lon[:, None] - lon) ** 2,
+                      axis=1)[:, 1:k + 1]
+    u = np.repeat(np.arange(n), k)
+    v = near.ravel()
+    distance = rng.uniform(100, 5000, len(u))
+    duration = distance / rng.uniform(5, 30, len(u))
+    return RoadNetwork(lat, lon, u, v, distance, duration,
+                       oneway=rng.random(len(u)) < oneway, weight=weight)
+
+
+def _scipy_costs(net):
+    n = len(net)
+    graph = csr_matrix((net._costs(), (net._src, net._dst)), shape=(n, n))
+    return dijkstra(graph, directed=True)
+
+
+@pytest.mark.parametrize('weight', ['duration', 'distance'])
+def test_shortest_path_matches_scipy(weight):
+    net = _network(weight=weight)
+    full = _scipy_costs(net)
+    rng = np.random.default_rng(1)
+    for s, t in rng.integers(0, len(net), (200, 2)):
+        path = net._shortest_path(int(s), int(t))
+        if path is None:
+            assert np.isinf(full[s, t])
+            continue
+
+        # A connected walk from s to t of the least cost
+        ends = [s] + list(net._dst[path])
+        assert ends[-1] == t
+        assert np.array_equal(net._src[path], ends[:-1])
+        assert np.isclose(net._costs()[path].sum(), full[s, t])
+
+
+def test_matrix_matches_route():
+    net = _network()
+    rng = np.random.default_rng(2)
+    lat1, lon1 = rng.uniform(40, 41, 6), rng.uniform(-75, -74, 6)
+    lat2, lon2 = rng.uniform(40, 41, 5), rng.uniform(-75, -74, 5)
+    dist, dur = net.matrix(lat1, lon1, lat2, lon2)
+    for i in range(len(lat1)):
+        for j in range(len(lat2)):
+            d, t = net.route(lat1[i], lon1[i], lat2[j], lon2[j])
+            assert np.isclose(dist[i, j], d, equal_nan=True)
+            assert np.isclose(dur[i, j], t, equal_nan=True)
+
+
+def test_directions_legs():
+    net = _network(oneway=0)
+    points = [(net.lat[i], net.lon[i]) for i in (0, 10, 20, 30)]
+    result = net.directions(points[0], points[-1], waypoints=points[1:-1])
+    legs = result[0]['legs']
+    assert len(legs) == len(points) - 1
+    for leg, (a, b) in zip(legs, zip(points, points[1:])):
+        d, t = net.route(*a, *b)
+        assert leg['distance']['value'] == int(round(d))
+        assert leg['duration']['value'] == int(round(t))
+
+    with pytest.raises(ValueError):
+        net.directions(points[0], points[1], mode='walking')
+
+
+def test_save_load(tmp_path):
+    net = _network()
+    net.save(tmp_path / 'net.npz')
+    loaded = RoadNetwork.load(tmp_path / 'net.npz')
+    assert loaded.weight == net.weight
+    assert loaded.n_edges == net.n_edges
+    assert np.array_equal(_scipy_costs(loaded), _scipy_costs(net))
+
+
+def _write_csv(tmp_path, ids, u, v):
+    nodes = pd.DataFrame({'id': ids, 'lat': np.linspace(40, 41, len(ids)),
+                          'lon': np.linspace(-75, -74, len(ids))})
+    edges = pd.DataFrame({'u': u, 'v': v, 'length': 1000.0})
+    nodes.to_csv(tmp_path / 'nodes.csv', index=False)
+    edges.to_csv(tmp_path / 'edges.csv', index=False)
+    return tmp_path / 'nodes.csv', tmp_path / 'edges.csv'
+
+
+def test_from_csv_renumbers(tmp_path):
+    ids = [900, 40, 7000, 12]
+    net = RoadNetwork.from_csv(*_write_csv(tmp_path, ids, [900, 40, 7000],
+                                           [40, 7000, 12]))
+    assert net.n_edges == 6
+    edges = set(zip(net._src.tolist(), net._dst.tolist()))
+    assert {(0, 1), (1, 2), (2, 3)} <= edges
+
+
+@pytest.mark.parametrize('ids', [[900, 40, 7000, 12], []])
+def test_from_csv_unknown_ids(tmp_path, ids):
+    paths = _write_csv(tmp_path, ids, [900, 41, 99999], [40, 7000, 12])
+    with pytest.raises(ValueError, match='node ids') as err:
+        RoadNetwork.from_csv(*paths)
+    assert '99999' in str(err.value)
+    if ids:
+        assert '41' in str(err.value) and '900' not in str(err.value)
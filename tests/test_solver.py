@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""Tests for the built-in TSP solver"""
+
+import numpy as np
+import pytest
+
+from datetime import datetime
+from lib import solver
+from lib.spatial import to_xyz
+
+
+def _points(n, random_seed=0):
+    rng = np.random.default_rng(random_seed)
+    return rng.uniform(30, 48, n), rng.uniform(-120, -75, n)
+
+
+@pytest.mark.parametrize('init', ['greedy', 'sfc'])
+@pytest.mark.parametrize('n', [1, 3, 4, 5, 200])
+def test_solve_is_permutation(n, init):
+    lat, lon = _points(n)
+    tour = solver.solve(lat, lon, init=init)
+    assert np.array_equal(np.sort(tour), np.arange(n))
+
+
+def test_local_search_does_not_lengthen():
+    lat, lon = _points(500)
+    xyz = to_xyz(lat, lon)
+    neigh, neigh_dist = solver.neighbours(xyz)
+    start = solver.sfc_tour(lat, lon)
+    tour = solver.local_search(xyz, start, neigh, neigh_dist, lk_depth=4)
+    assert np.array_equal(np.sort(tour), np.arange(500))
+    assert solver.tour_length(xyz, tour) < solver.tour_length(xyz, start)
+
+
+def test_warm_up_runs_once():
+    solver.warm_up()
+    assert solver.warm_up() == 0.0
+
+
+def test_time_bound_excludes_compile():
+    lat, lon = _points(20000)
+    xyz = to_xyz(lat, lon)
+    neigh, neigh_dist = solver.neighbours(xyz)
+    start = solver.sfc_tour(lat, lon)
+    solver.warm_up()
+
+    # A zero bound stops after the first batch of steps
+    start_time = datetime.now()
+    tour = solver.local_search(xyz, start, neigh, neigh_dist, time_bound=0)
+    assert (datetime.now() - start_time).total_seconds() < 1
+    assert np.array_equal(np.sort(tour), np.arange(20000))
+    assert solver.tour_length(xyz, tour) < solver.tour_length(xyz, start)
+
+
+def test_polish_reports_compile_seconds():
+    lat, lon = _points(100)
+    tour, stats = solver.polish(lat, lon, np.arange(100))
+    assert np.array_equal(np.sort(tour), np.arange(100))
+    assert stats['compile_seconds'] >= 0
+    assert stats['length_after'] <= stats['length_before']
+
+
+@pytest.mark.parametrize('copies', [1, 20])
+def test_duplicate_coordinates(copies):
+    lat, lon = _points(200)
+    lat = np.append(lat, [lat[5]] * copies)
+    lon = np.append(lon, [lon[5]] * copies)
+    n = len(lat)
+
+    neigh, _ = solver.neighbours(to_xyz(lat, lon))
+    assert not (neigh == np.arange(n)[:, None]).any()
+
+    tour = solver.solve(lat, lon)
+    assert np.array_equal(np.sort(tour), np.arange(n))
+    tour, stats = solver.polish(lat, lon, np.arange(n))
+    assert np.array_equal(np.sort(tour), np.arange(n))
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""Tests for the spherical spatial index"""
+
+import numpy as np
+import pytest
+
+from lib import spatial, utils
+from lib.spatial import _SphereIndex
+
+
+def _points(n, random_seed=0):
+    rng = np.random.default_rng(random_seed)
+    return rng.uniform(30, 48, n), rng.uniform(-120, -75, n)
+
+
+def _brute_km(ids, lat, lon, q_lat, q_lon):
+    '''Haversine distances from a query point to every point, by id'''
+    km = utils.haversine(np.radians(q_lat), np.radians(q_lon),
+                         np.radians(lat), np.radians(lon), to_radians=False)
+    return dict(zip(ids.tolist(), km.tolist()))
+
+
+def _edited_index(n=2000, n_added=300, random_seed=0):
+    '''Index with points added one at a time and then some removed, and the
+    coordinates of the points left in it by id'''
+    lat, lon = _points(n + n_added, random_seed)
+    idx = _SphereIndex(np.arange(n), lat[:n], lon[:n])
+    for i in range(n, n + n_added):
+        idx.add([i], lat[i:i + 1], lon[i:i + 1])
+
+    # Remove every third point, renumbering the rest
+    keep = np.arange(n + n_added) % 3 != 0
+    remap = np.where(keep, np.cumsum(keep) - 1, -1)
+    idx.remap(remap)
+    return idx, np.arange(np.count_nonzero(keep)), lat[keep], lon[keep]
+
+
+@pytest.mark.parametrize('k', [1, 7, 40])
+def test_nearest_matches_brute_force(k):
+    idx, ids, lat, lon = _edited_index()
+    q_lat, q_lon = _points(30, random_seed=1)
+    dist, found = idx.nearest(q_lat, q_lon, k=k)
+    assert len(idx) == len(ids)
+    for i in range(len(q_lat)):
+        km = _brute_km(ids, lat, lon, q_lat[i], q_lon[i])
+        expected = sorted(km.values())[:k]
+        assert np.allclose(dist[i], expected, rtol=1e-6, atol=1e-6)
+        assert np.allclose([km[j] for j in found[i]], dist[i], rtol=1e-6,
+                           atol=1e-6)
+
+
+def test_within_matches_brute_force():
+    idx, ids, lat, lon = _edited_index()
+    q_lat, q_lon = _points(30, random_seed=2)
+    dists, found = idx.within(q_lat, q_lon, 150)
+    for i in range(len(q_lat)):
+        km = _brute_km(ids, lat, lon, q_lat[i], q_lon[i])
+        expected = {j for j, d in km.items() if d <= 150}
+        assert set(found[i].tolist()) == expected
+        assert np.all(np.diff(dists[i]) >= 0)
+
+
+def test_nearest_pads_when_few_points():
+    idx = _SphereIndex([5, 6], [40.0, 41.0], [-100.0, -101.0])
+    idx.remap(np.array([-1] * 5 + [0, -1]))
+    dist, found = idx.nearest(40.0, -100.0, k=3)
+    assert list(found[0]) == [0, -1, -1]
+    assert np.isinf(dist[0, 1:]).all()
+
+
+def test_pending_points_are_bounded():
+    lat, lon = _points(20000)
+    idx = _SphereIndex(np.arange(10000), lat[:10000], lon[:10000])
+    most = 0
+    for i in range(10000, 20000, 10):
+        idx.add(np.arange(i, i + 10), lat[i:i + 10], lon[i:i + 10])
+        most = max(most, len(idx._pend_ids))
+    assert most <= max(spatial._MIN_PENDING, np.sqrt(20000)) + 10
+    assert len(idx) == 20000
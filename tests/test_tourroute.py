@@ -0,0 +1,530 @@
+# -*- coding: utf-8 -*-
+"""Tests for the TourRoute class"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from lib import solver, utils
+from lib.tourroute import (TourRoute, _SAVE_FORMATS, get_drive_distdur,
+                           get_drive_legs)
+from tests.conftest import make_legs, make_tour
+
+
+@pytest.mark.parametrize('fmt', _SAVE_FORMATS)
+@pytest.mark.parametrize('mmap', [True, False])
+def test_load_is_mutable(tour, tmp_path, fmt, mmap):
+    if fmt != 'npy':
+        pytest.importorskip('pyarrow')
+    tour.save(tmp_path, fmt=fmt)
+    gids = tour.get_cols('gid_county').gid_county.to_numpy()
+
+    loaded = TourRoute.load(tmp_path, mmap=mmap)
+    loaded.del_points(gids[:5])
+    loaded.update_points({'gid_county': gids[5:8],
+                          'lat_visit': [40.0, 41.0, 42.0]})
+
+    assert len(loaded) == len(tour) - 5
+    assert np.allclose(loaded.get_points(gids[5:8]).lat_visit, [40, 41, 42])
+    # The saved files are unchanged
+    assert len(TourRoute.load(tmp_path, mmap=mmap)) == len(tour)
+
+
+def _slice_keys(slices):
+    return {(s.origin, s.destination, len(s)) for s in slices}
+
+
+@pytest.mark.parametrize('slack', [0, 0.5])
+def test_plan_slices_covers_tour(slack, capsys):
+    tour = make_tour(1000)
+    slices = tour.plan_slices(max_waypoints=8, slack=slack)
+    assert capsys.readouterr().out == ''
+    assert all(len(s) <= 10 for s in slices)
+    assert sum(len(s) - 1 for s in slices) == len(tour) - 1
+    assert slices[0].start == 0
+    assert all(a.destination == b.origin and a.start + len(a) - 1 == b.start
+               for a, b in zip(slices[:-1], slices[1:]))
+    fewest = int(np.ceil((len(tour) - 1) / 9))
+    if slack == 0:
+        assert len(slices) == fewest
+    else:
+        assert len(slices) <= 2 * fewest
+
+
+def test_plan_slices_local_edit():
+    tour = make_tour(3000)
+    base = _slice_keys(tour.plan_slices())
+    gids = tour.get_cols('gid_county').gid_county.to_numpy()
+
+    changed = []
+    for gid in gids[np.linspace(1, len(gids) - 2, 40).astype(int)]:
+        edited = make_tour(3000)
+        edited.del_points([gid])
+        changed.append(len(_slice_keys(edited.plan_slices()) - base))
+
+    assert np.mean(changed) <= 2
+    assert max(changed) <= 10
+
+
+def _add_one(tour, gid, lat, lon, insert='end'):
+    tour.add_points([gid], [f'County {gid}'], [lat], [lon], ['CA'],
+                    ['US.CA.001'], [gid], lat_visit=[lat], lon_visit=[lon],
+                    insert=insert)
+
+
+def test_add_points_end_appends_before_start():
+    tour = make_tour(50)
+    tour.flyingcrow_dist()
+    gids = tour.get_cols('gid_county').gid_county.to_numpy()
+    tour.rotate(gids[10])
+    _add_one(tour, 1001, 40.0, -100.0)
+    _add_one(tour, 1002, 41.0, -101.0)
+
+    order = tour.get_cols('gid_county').gid_county.to_numpy()
+    assert np.array_equal(order, np.concatenate(
+        (gids[10:], gids[:10], [1001, 1002])))
+    assert np.allclose(tour.leg_dists(), make_legs(tour))
+
+
+def test_add_points_end_reuses_capacity():
+    tour = make_tour(10)
+    tour.flyingcrow_dist()
+    buffers = set()
+    for gid in range(1000, 3000):
+        _add_one(tour, gid, 40.0 + gid * 1e-3, -100.0)
+        buffers.add(id(tour._order_buf))
+
+    # Geometric growth needs only a handful of buffers
+    assert len(buffers) <= 12
+    assert len(tour) == 2010
+    assert np.allclose(tour.leg_dists(), make_legs(tour))
+
+
+def _moved_length(tour, order):
+    '''Closed tour length after reordering to the given tour positions'''
+    moved = make_tour(len(tour))
+    moved.reorder(order)
+    return make_legs(moved).sum()
+
+
+def _two_opt(n, i, j):
+    order = list(range(n))
+    order[i + 1:j + 1] = order[i + 1:j + 1][::-1]
+    return order
+
+
+def _swap(n, i, j):
+    order = list(range(n))
+    order[i], order[j] = order[j], order[i]
+    return order
+
+
+def _relocate(n, i, j):
+    order = list(range(n))
+    if j in (i, (i - 1) % n):
+        return order
+
+    x = order.pop(i)
+    order.insert(order.index(j) + 1, x)
+    return order
+
+
+@pytest.mark.parametrize('delta, move', [('delta_2opt', _two_opt),
+                                         ('delta_swap', _swap),
+                                         ('delta_relocate', _relocate)])
+def test_deltas_match_brute_force(delta, move):
+    tour = make_tour(40)
+    length = make_legs(tour).sum()
+    pairs = [(i, j) for i in range(len(tour)) for j in range(len(tour))
+             if delta != 'delta_2opt' or i < j]
+    for i, j in pairs[::7]:
+        expected = _moved_length(tour, move(len(tour), i, j)) - length
+        assert np.isclose(getattr(tour, delta)(i, j), expected, atol=1e-6), \
+            (i, j)
+
+
+def test_leg_cache_after_mutations(tour):
+    gids = tour.get_cols('gid_county').gid_county.to_numpy()
+    tour.flyingcrow_dist()
+
+    def check():
+        assert np.allclose(tour.leg_dists(), make_legs(tour))
+        assert np.isclose(tour.flyingcrow_dist(), make_legs(tour).sum())
+        rows = tour._rows()
+        assert np.array_equal(np.sort(rows), np.arange(len(tour._store)))
+
+    tour.rotate(gids[100])
+    check()
+    tour.reverse()
+    check()
+    tour.reverse(keep_start=False)
+    check()
+    tour.del_points(gids[[0, 50, 101, 299]])
+    check()
+    _add_one(tour, 5001, 40.0, -100.0)
+    check()
+    _add_one(tour, 5002, 35.0, -90.0, insert='cheapest')
+    check()
+    tour.update_points({'gid_county': gids[[10, 200]],
+                        'lat_visit': [45.0, 31.0],
+                        'lon_visit': [-80.0, -110.0]})
+    check()
+    tour.reorder(np.random.default_rng(0).permutation(len(tour)))
+    check()
+
+
+def test_gid_lookup(tour):
+    gids = tour.get_cols('gid_county').gid_county.to_numpy()
+    got = tour.get_points([gids[7], 123456, gids[3]])
+    assert list(got.gid_county) == [gids[3], gids[7]]
+
+    tour.rotate(gids[50])
+    rows, found = tour._gid_lookup([gids[50], 123456])
+    assert list(found) == [True, False]
+    assert tour._store.column('gid_county')[rows[0]] == gids[50]
+
+
+def test_del_points_by_gid(tour):
+    gids = tour.get_cols('gid_county').gid_county.to_numpy()
+    tour.get_points(gids[0])
+    tour.del_points([gids[10], gids[20], 123456])
+    left = tour.get_cols('gid_county').gid_county.to_numpy()
+    assert np.array_equal(left, np.delete(gids, [10, 20]))
+    assert len(tour.get_points([gids[10], gids[20]])) == 0
+
+    # The index is rebuilt against the renumbered rows
+    assert list(tour.get_points(gids[21]).gid_county) == [gids[21]]
+    _add_one(tour, gids[10], 40.0, -100.0)
+    assert list(tour.get_points(gids[10]).gid_county) == [gids[10]]
+
+
+def test_duplicate_gids_rejected(tour):
+    gids = tour.get_cols('gid_county').gid_county.to_numpy()
+    with pytest.raises(ValueError, match=str(gids[4])):
+        _add_one(tour, gids[4], 40.0, -100.0)
+    with pytest.raises(ValueError, match='5001'):
+        tour.add_points([5001, 5001], ['a', 'b'], [40, 41], [-100, -101],
+                        ['CA', 'CA'], ['US.CA.001'] * 2, [1, 2])
+    assert len(tour) == 300
+
+    # Upserting a new key twice adds it once, with the last values
+    unmatched = tour.update_points({'gid_county': [5002, gids[0], 5002],
+                                    'name_county': ['a', 'b', 'c']},
+                                   upsert=True)
+    assert list(unmatched) == [5002, 5002]
+    assert len(tour) == 301
+    assert list(tour.get_points([5002, gids[0]]).name_county) == ['b', 'c']
+
+
+class _LegClient():
+    '''Client whose ``directions()`` legs are the great circle metres and
+    seconds at 1 m/s between consecutive points'''
+
+    def __init__(self):
+        self.calls = 0
+
+    def directions(self, origin, destination, waypoints=None, **kwargs):
+        self.calls += 1
+        points = np.radians([origin] + list(waypoints or []) + [destination])
+        metres = utils.haversine(points[:-1, 0], points[:-1, 1],
+                                 points[1:, 0], points[1:, 1],
+                                 to_radians=False) * 1000
+        return [{'legs': [{'distance': {'value': m}, 'duration': {'value': m}}
+                          for m in metres]}]
+
+
+@pytest.mark.parametrize('slices', ['slices', 'plan_slices'])
+def test_drive_legs_align_with_tour(slices, capsys):
+    tour = make_tour(23)
+    expected = make_legs(tour)[:-1] * 1000
+    tour_slices = getattr(tour, slices)()
+
+    dist, dur = get_drive_legs(_LegClient(), tour_slices, rate=1e5)
+    assert np.allclose(dist, expected)
+    assert np.allclose(dur, expected)
+
+    total, total_dur = get_drive_distdur(_LegClient(), tour_slices, rate=1e5)
+    assert np.isclose(total, expected.sum())
+    assert np.isclose(total_dur, expected.sum())
+    assert 'WARNING' not in capsys.readouterr().out
+
+
+def test_drive_distdur_warns_of_missing_legs(capsys):
+    tour = make_tour(23)
+    dist, _ = get_drive_legs(_LegClient(), tour.slices(overlap=False),
+                             rate=1e5)
+    assert np.count_nonzero(np.isnan(dist)) == 2
+
+    get_drive_distdur(_LegClient(), tour.slices(overlap=False), rate=1e5)
+    assert '2 of 22 legs are missing' in capsys.readouterr().out
+
+
+def test_write_js_precision(tour, tmp_path):
+    tour.write_js(tmp_path / 'tour.js', fmt='polyline', precision=7)
+    assert 'precision: 7,' in (tmp_path / 'tour.js').read_text()
+    with pytest.raises(ValueError, match='precision'):
+        tour.write_js(tmp_path / 'bad.js', fmt='polyline', precision=11)
+    assert not (tmp_path / 'bad.js').exists()
+
+
+def _add_twins(tour, gids, insert='cheapest', repair=False):
+    '''Adds a point at the same place as each of the given points'''
+    pts = tour.get_points(gids)
+    new = pts.gid_county.to_numpy() + 100000
+    tour.add_points(new, list(pts.name_county), pts.lat_county,
+                    pts.lon_county, list(pts.state), list(pts.cat_code),
+                    pts.fips_code, lat_visit=pts.lat_visit,
+                    lon_visit=pts.lon_visit, insert=insert, repair=repair)
+    return dict(zip(pts.gid_county, new))
+
+
+@pytest.mark.parametrize('indexed', [False, True])
+def test_insert_cheapest_batch(tour, indexed):
+    gids = tour.get_cols('gid_county').gid_county.to_numpy()
+    length = tour.flyingcrow_dist()
+    if indexed:
+        tour.nearest(40.0, -100.0)
+    twins = _add_twins(tour, gids[[0, 5, 6, 7, 150, 299]])
+
+    # Each twin costs nothing next to its point, and the start is kept
+    order = list(tour.get_cols('gid_county').gid_county)
+    assert len(order) == 306 and order[0] == gids[0]
+    assert np.isclose(tour.flyingcrow_dist(), length)
+    assert np.allclose(tour.leg_dists(), make_legs(tour))
+    for gid, twin in twins.items():
+        i, j = order.index(gid), order.index(twin)
+        assert abs(i - j) in (1, len(order) - 1)
+
+    # The spatial index holds every point once
+    assert len(tour._spatial_index()) == 306
+    assert list(tour.nearest(*tour.get_points(gids[150])[
+        ['lat_visit', 'lon_visit']].iloc[0], k=2).gid_county) in (
+            [gids[150], gids[150] + 100000], [gids[150] + 100000, gids[150]])
+
+
+def test_repair_patches_candidates():
+    tour = make_tour(2000)
+    gids = tour.get_cols('gid_county').gid_county.to_numpy()
+    tour.del_points(gids[:1], repair=True)
+    tour.del_points(gids[100:110], repair=True)
+    _add_twins(tour, gids[[500, 900]], repair=True)
+    tour.add_points([1, 2], ['a', 'b'], [40.0, 41.0], [-100.0, -101.0],
+                    ['KS', 'KS'], ['US.KS.001'] * 2, [1, 2],
+                    lat_visit=[40.0, 41.0], lon_visit=[-100.0, -101.0],
+                    repair=True)
+
+    rows = tour._rows()
+    assert np.array_equal(np.sort(rows), np.arange(1993))
+    assert np.allclose(tour.leg_dists(), make_legs(tour))
+
+    # The patched lists are the lists built in full, bar the order of the
+    # twins, which are the same distance away
+    neigh, neigh_dist = tour._candidates()
+    full, full_dist = solver.neighbours(tour._xyz(), neigh.shape[1])
+    assert np.allclose(neigh_dist, full_dist)
+    assert (neigh == full).mean() > 0.999
+
+
+def test_repair_shortens_tour():
+    tour = make_tour(1000)
+    gids = tour.get_cols('gid_county').gid_county.to_numpy()
+    plain = make_tour(1000)
+    plain.del_points(gids[::10])
+    tour.del_points(gids[::10], repair=True)
+    assert tour.get_cols('gid_county').gid_county.iloc[0] == gids[1]
+    assert tour.flyingcrow_dist() < plain.flyingcrow_dist()
+
+
+def _visits(tour):
+    return tour.get_cols(['gid_county', 'name_county', 'lat_county',
+                          'lon_county', 'name_seat', 'lat_seat', 'lon_seat',
+                          'name_visit', 'lat_visit', 'lon_visit'])
+
+
+def test_visit_points_seat_and_county(tour):
+    data = _visits(tour)
+    seat = data.gid_county % 3 != 0
+    assert np.array_equal(data.lat_visit[seat], data.lat_seat[seat])
+    assert np.array_equal(data.lon_visit[~seat], data.lon_county[~seat])
+    assert list(data.name_visit[seat]) == list(data.name_seat[seat])
+    assert list(data.name_visit[~seat]) == list(data.name_county[~seat])
+
+    tour.flyingcrow_dist()
+    tour.update_visit_points(rule='county')
+    data = _visits(tour)
+    assert np.array_equal(data.lat_visit, data.lat_county)
+    assert list(data.name_visit) == list(data.name_county)
+    assert np.allclose(tour.leg_dists(), make_legs(tour))
+
+
+def test_visit_points_nearest_place(tour):
+    data = _visits(tour)
+    places = pd.DataFrame({'name': ['Near', 'Far'],
+                           'lat': [data.lat_county[0] + 0.01, -40.0],
+                           'lon': [data.lon_county[0], 100.0]})
+    tour.update_visit_points(rule='nearest_place', places=places, max_km=5)
+    data = _visits(tour)
+    assert data.name_visit[0] == 'Near'
+    assert data.lat_visit[0] == places.lat[0]
+    assert list(data.name_visit[1:]) == list(data.name_county[1:])
+    assert np.array_equal(data.lat_visit[1:], data.lat_county[1:])
+
+    tour.update_visit_points(rule='nearest_place', places=places)
+    assert set(_visits(tour).name_visit) == {'Near'}
+
+    with pytest.raises(ValueError, match='places'):
+        tour.update_visit_points(rule='nearest_place')
+    with pytest.raises(ValueError, match='rule'):
+        tour.update_visit_points(rule='capital')
+
+
+def test_update_points_bulk(tour):
+    gids = tour.get_cols('gid_county').gid_county.to_numpy()
+    updates = pd.DataFrame({'gid_county': [gids[9], 123, gids[2]],
+                            'name_county': ['Nine', 'New', 'Two']})
+    unmatched = tour.update_points(updates)
+    assert list(unmatched) == [123]
+    assert len(tour) == 300
+    assert list(tour.get_points([gids[2], gids[9]]).name_county) == \
+        ['Two', 'Nine']
+
+    # A single value is set on every matched point
+    tour.update_points({'gid_county': gids[:3], 'state': 'NY'})
+    assert set(tour.get_points(gids[:3]).state) == {'NY'}
+
+    with pytest.raises(ValueError, match='gid_county'):
+        tour.update_points({'name_county': ['x']})
+    with pytest.raises(ValueError, match='colour'):
+        tour.update_points({'gid_county': [gids[0]], 'colour': ['red']})
+
+
+def test_update_points_upsert(tour):
+    gids = tour.get_cols('gid_county').gid_county.to_numpy()
+    tour.flyingcrow_dist()
+    unmatched = tour.update_points(
+        {'gid_county': [gids[0], 9001, 9002],
+         'name_county': ['Zero', 'A', 'B'],
+         'lat_visit': [40.0, 41.0, 42.0],
+         'lon_visit': [-100.0, -101.0, -102.0]}, upsert=True)
+    assert list(unmatched) == [9001, 9002]
+    assert len(tour) == 302
+
+    order = tour.get_cols(['gid_county', 'name_county', 'lat_visit'])
+    assert list(order.gid_county[-2:]) == [9001, 9002]
+    assert list(order.name_county[[0, 300, 301]]) == ['Zero', 'A', 'B']
+    assert order.lat_visit[0] == 40.0
+    assert pd.isna(tour.get_points(9001).state.iloc[0])
+    assert np.allclose(tour.leg_dists(), make_legs(tour))
+
+
+@pytest.mark.parametrize('n', [1, 2, 10, 23])
+def test_slices_overlap(n):
+    tour = make_tour(n)
+    coords = tour._coords()
+    slices = tour.slices(slice_len=10)
+    assert [s.start for s in slices] == list(range(0, max(n - 1, 1), 9))
+    for a, b in zip(slices[:-1], slices[1:]):
+        assert a.destination == b.origin
+    assert sum(len(s) - 1 for s in slices) == n - 1
+    for s in slices:
+        assert 2 <= len(s) <= 10 or n == 1
+        assert np.shares_memory(s.coords, coords)
+        assert np.array_equal(s.coords, coords[s.start:s.start + len(s)])
+
+
+def test_slices_without_overlap():
+    tour = make_tour(23)
+    slices = tour.slices(slice_len=10, overlap=False)
+    assert [(s.start, len(s)) for s in slices] == [(0, 10), (10, 10),
+                                                    (20, 3)]
+    assert slices[0].waypoints == [tuple(p) for p in
+                                   tour._coords()[1:9].tolist()]
+
+
+def test_slices_max_waypoints():
+    tour = make_tour(100)
+    slices = list(tour.iter_slices(slice_len=50, max_waypoints=3))
+    assert max(len(s) for s in slices) == 5
+    assert len(slices) == int(np.ceil(99 / 4))
+    assert all(len(s.waypoints or []) <= 3 for s in slices)
+
+
+def test_drive_legs_skip_single_point_slices(capsys):
+    tour = make_tour(21)
+    client = _LegClient()
+    tour_slices = tour.slices(overlap=False)
+    assert len(tour_slices[-1]) == 1
+    dist, _ = get_drive_legs(client, tour_slices, rate=1e5)
+    assert client.calls == 2
+    assert len(dist) == 20 and np.isnan(dist[[9, 19]]).all()
+
+    client = _LegClient()
+    dist, _ = get_drive_legs(client, make_tour(1).slices(), rate=1e5)
+    assert client.calls == 0 and len(dist) == 0
+
+
+def _write_points_csv(path, n=50):
+    tour = make_tour(n)
+    tour.write_csv(path)
+    return tour.get_cols(['gid_county', 'state', 'lat_visit', 'lon_visit',
+                          'name_seat', 'fips_code'])
+
+
+_VISIT_COL_MAP = {'gid_county': 'gid_county', 'name_county': 'name_county',
+                  'lat_county': 'lat_county', 'lon_county': 'lon_county',
+                  'state': 'state', 'cat_code': 'cat_code',
+                  'fips_code': 'fips_code', 'name_seat': 'name_seat',
+                  'lat_visit': 'lat_visit', 'lon_visit': 'lon_visit'}
+
+
+@pytest.mark.parametrize('chunksize', [1, 7, 1000])
+def test_read_csv_chunks(tmp_path, chunksize):
+    expected = _write_points_csv(tmp_path / 'points.csv')
+    tour = TourRoute()
+    tour.read_csv(tmp_path / 'points.csv', col_map=_VISIT_COL_MAP,
+                  chunksize=chunksize)
+
+    got = tour.get_cols(list(expected))
+    assert list(got.gid_county) == list(expected.gid_county)
+    assert np.allclose(got.lat_visit, expected.lat_visit)
+    assert list(got.name_seat.fillna('')) == \
+        list(expected.name_seat.fillna(''))
+    assert got.fips_code.dtype == expected.fips_code.dtype
+    assert tour._store.column('gid_county').dtype == np.int64
+
+    # Columns not read are left missing
+    assert tour.get_cols('lat_seat').lat_seat.isna().all()
+
+
+def test_read_csv_column_map(tmp_path):
+    expected = _write_points_csv(tmp_path / 'points.csv')
+    data = pd.read_csv(tmp_path / 'points.csv')
+    data.rename(columns={'gid_county': 'id', 'state': 'st'}).to_csv(
+        tmp_path / 'renamed.csv', index=False)
+
+    tour = TourRoute()
+    tour.read_csv(tmp_path / 'renamed.csv',
+                  col_map={**_VISIT_COL_MAP, 'gid_county': 'id',
+                           'state': 'st'}, chunksize=9)
+    got = tour.get_cols(['gid_county', 'state'])
+    assert list(got.gid_county) == list(expected.gid_county)
+    assert list(got.state) == list(expected.state)
+
+
+def test_read_csv_filters(tmp_path):
+    expected = _write_points_csv(tmp_path / 'points.csv')
+    bbox = (35, -110, 45, -85)
+
+    tour = TourRoute()
+    tour.read_csv(tmp_path / 'points.csv', col_map=_VISIT_COL_MAP,
+                  states=['CA', 'TX'], bbox=bbox,
+                  where=lambda chunk: chunk.gid_county % 2 == 0,
+                  chunksize=4)
+
+    keep = expected.state.isin(['CA', 'TX']) \
+        & expected.lat_visit.between(bbox[0], bbox[2]) \
+        & expected.lon_visit.between(bbox[1], bbox[3]) \
+        & (expected.gid_county % 2 == 0)
+    assert 0 < keep.sum() < len(expected)
+    assert list(tour.get_cols('gid_county').gid_county) == \
+        list(expected.gid_county[keep])
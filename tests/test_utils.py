@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""Tests for the coordinate encoders and the JavaScript decoder"""
+
+import base64
+import json
+import os
+import shutil
+import subprocess
+
+import numpy as np
+import pytest
+
+from lib import utils
+
+_DECODE_JS = os.path.join(os.path.dirname(__file__), '..', 'lib',
+                          'decode.js')
+
+
+def _decode_polyline(encoded, precision):
+    '''Reference decoder, in the same steps as Google's description'''
+    values = []
+    result = shift = 0
+    for char in encoded:
+        b = ord(char) - 63
+        result |= (b & 0x1f) << shift
+        shift += 5
+        if b < 0x20:
+            values.append(~(result >> 1) if result & 1 else result >> 1)
+            result = shift = 0
+    return np.cumsum(np.reshape(values, (-1, 2)), axis=0) / 10 ** precision
+
+
+def _points(n, random_seed=0):
+    rng = np.random.default_rng(random_seed)
+    return rng.uniform(-90, 90, n), rng.uniform(-180, 180, n)
+
+
+def test_encode_polyline_reference():
+    encoded = utils._encode_polyline([38.5, 40.7, 43.252],
+                                     [-120.2, -120.95, -126.453])
+    assert encoded == '_p~iF~ps|U_ulLnnqC_mqNvxq`@'
+
+
+@pytest.mark.parametrize('precision', [0, 5, 7, 10])
+def test_encode_polyline_round_trip(precision):
+    lat, lon = _points(500)
+    lat[:2], lon[:2] = [90, -90], [180, -180]
+    encoded = utils._encode_polyline(lat, lon, precision)
+    decoded = _decode_polyline(encoded, precision)
+    assert np.allclose(decoded[:, 0], lat, rtol=0, atol=10 ** -precision)
+    assert np.allclose(decoded[:, 1], lon, rtol=0, atol=10 ** -precision)
+
+
+@pytest.mark.parametrize('precision', [-1, utils._POLYLINE_MAX_PRECISION + 1])
+def test_encode_polyline_precision_range(precision):
+    with pytest.raises(ValueError, match='precision'):
+        utils._encode_polyline([1.0], [2.0], precision)
+
+
+def test_encode_float32_round_trip():
+    lat, lon = _points(100)
+    decoded = np.frombuffer(base64.b64decode(utils._encode_float32(lat, lon)),
+                            dtype='<f4').reshape(-1, 2)
+    assert np.array_equal(decoded[:, 0], lat.astype(np.float32))
+    assert np.array_equal(decoded[:, 1], lon.astype(np.float32))
+
+
+@pytest.mark.skipif(shutil.which('node') is None, reason='needs node')
+@pytest.mark.parametrize('precision', [5, 7, 10])
+def test_decode_js_round_trip(precision):
+    lat, lon = _points(200)
+    encoded = utils._encode_polyline(lat, lon, precision)
+    script = f'{open(_DECODE_JS).read()}\n' \
+        + 'console.log(JSON.stringify(decodePolyline(' \
+        + f'{json.dumps(encoded)}, {precision})))'
+    out = subprocess.run(['node', '-e', script], capture_output=True,
+                         text=True, check=True).stdout
+    decoded = np.reshape(json.loads(out), (-1, 2))
+    assert np.array_equal(decoded, _decode_polyline(encoded, precision))